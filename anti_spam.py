@@ -1,11 +1,13 @@
 """
 Система защиты от спама и DDoS для Telegram бота
 """
+import re
 import time
 import asyncio
-from typing import Dict, List, Set
+from typing import List, Set
+from array import array
 from dataclasses import dataclass, field
-from collections import defaultdict
+from collections import OrderedDict
 import logging
 
 logger = logging.getLogger(__name__)
@@ -18,21 +20,78 @@ except ImportError:
     MONITORING_ENABLED = False
     security_monitor = None
 
-@dataclass
+class SlidingWindowCounter:
+    """Число событий за последнюю минуту и последний час (амортизированно O(1))
+    
+    Времена событий хранятся в кольцевом буфере array('d') по возрастанию:
+    с головы отбрасываются события старше часа, а курсор _minute_start
+    (смещение от головы) указывает на первое событие последней минуты. Оба
+    указателя только движутся вперед, поэтому каждое событие проверяется не
+    больше двух раз. Буфер удваивается при заполнении; его размер ограничен
+    числом сообщений в час, которое пропускает лимит.
+    """
+    __slots__ = ('_times', '_head', '_size', '_minute_start')
+    
+    MINUTE = 60
+    HOUR = 3600
+    INITIAL_CAPACITY = 8
+    
+    def __init__(self):
+        self._times = array('d', bytes(8 * self.INITIAL_CAPACITY))
+        self._head = 0
+        self._size = 0
+        self._minute_start = 0
+    
+    def _advance(self, current_time: float):
+        times = self._times
+        capacity = len(times)
+        while (self._minute_start < self._size
+               and current_time - times[(self._head + self._minute_start) % capacity] >= self.MINUTE):
+            self._minute_start += 1
+        # События старше часа всегда левее курсора минуты
+        while self._size and current_time - times[self._head] >= self.HOUR:
+            self._head = (self._head + 1) % capacity
+            self._size -= 1
+            self._minute_start -= 1
+    
+    def add(self, current_time: float):
+        """Учесть событие (время не меньше предыдущего)"""
+        self._advance(current_time)
+        capacity = len(self._times)
+        if self._size == capacity:
+            # Разворачиваем кольцо в начало буфера двойного размера
+            times = self._times
+            self._times = times[self._head:] + times[:self._head] + array('d', bytes(8 * capacity))
+            self._head = 0
+            capacity *= 2
+        self._times[(self._head + self._size) % capacity] = current_time
+        self._size += 1
+    
+    def counts(self, current_time: float) -> tuple[int, int]:
+        """Число событий (за минуту, за час)"""
+        self._advance(current_time)
+        return self._size - self._minute_start, self._size
+
+# Эмодзи: символы выше U+1F000
+EMOJI_RE = re.compile('[\U0001F001-\U0010FFFF]')
+
+@dataclass(slots=True)
 class UserStats:
     """Статистика пользователя для анти-спам системы"""
+    last_seen: float = 0  # время последнего обращения (для вытеснения неактивных)
     message_count: int = 0
     last_message_time: float = 0
     blocked_until: float = 0
     warning_count: int = 0
     spam_score: int = 0
-    recent_messages: List[float] = field(default_factory=list)
+    recent_messages: SlidingWindowCounter = field(default_factory=SlidingWindowCounter)
 
 class AntiSpamSystem:
     """Система защиты от спама"""
     
     def __init__(self):
-        self.user_stats: Dict[int, UserStats] = defaultdict(UserStats)
+        # Статистика только активных пользователей: от давно неактивных к недавним
+        self.user_stats: "OrderedDict[int, UserStats]" = OrderedDict()
         self.blocked_users: Set[int] = set()
         self.admin_ids: Set[int] = set()
         
@@ -43,6 +102,7 @@ class AntiSpamSystem:
         self.SPAM_THRESHOLD = 250          # Порог блокировки за спам (увеличено в 5 раз)
         self.BLOCK_DURATION = 300          # Время блокировки (5 минут)
         self.WARNING_THRESHOLD = 15        # Количество предупреждений до блокировки (увеличено в 5 раз)
+        self.STATS_IDLE_TTL = 3600         # Хранение статистики неактивного пользователя (не меньше часового окна)
         
         # Паттерны спама
         self.SPAM_PATTERNS = [
@@ -50,6 +110,15 @@ class AntiSpamSystem:
             "бесплатно", "скидка", "акция", "промокод", "wwww", "http",
             "telegram.me", "t.me", "@", "канал", "подписка"
         ]
+        # Все паттерны одной регуляркой (длинные первыми). Паттерны, вложенные
+        # в найденный ("t.me" в "telegram.me"), берутся из таблицы вложенности
+        self._spam_re = re.compile("|".join(
+            re.escape(pattern) for pattern in sorted(self.SPAM_PATTERNS, key=len, reverse=True)
+        ))
+        self._spam_nested = {
+            pattern: {other for other in self.SPAM_PATTERNS if other in pattern}
+            for pattern in self.SPAM_PATTERNS
+        }
         
     def set_admin_ids(self, admin_ids: List[int]):
         """Установить ID администраторов (они не блокируются)"""
@@ -61,12 +130,37 @@ class AntiSpamSystem:
         """Проверить, является ли пользователь админом"""
         return user_id in self.admin_ids
     
+    def _get_stats(self, user_id: int) -> UserStats:
+        """Статистика пользователя для записи (создается при первом обращении)"""
+        stats = self.user_stats.get(user_id)
+        if stats is None:
+            stats = self.user_stats[user_id] = UserStats()
+        else:
+            self.user_stats.move_to_end(user_id)
+        stats.last_seen = time.time()
+        return stats
+    
+    def _evict_idle(self, current_time: float):
+        """Удалить статистику пользователей, неактивных дольше STATS_IDLE_TTL
+        
+        Записи упорядочены по последнему обращению, поэтому проверяются только
+        самые старые. Блокировка длится меньше TTL и к этому моменту уже истекла;
+        постоянные блокировки хранятся отдельно в blocked_users.
+        """
+        while self.user_stats:
+            user_id, stats = next(iter(self.user_stats.items()))
+            if current_time - stats.last_seen < self.STATS_IDLE_TTL or stats.blocked_until > current_time:
+                break
+            del self.user_stats[user_id]
+    
     def is_blocked(self, user_id: int) -> bool:
         """Проверить, заблокирован ли пользователь"""
         if self.is_admin(user_id):
             return False
             
-        stats = self.user_stats[user_id]
+        stats = self.user_stats.get(user_id)
+        if stats is None:
+            return user_id in self.blocked_users
         current_time = time.time()
         
         # Проверяем временную блокировку
@@ -86,14 +180,9 @@ class AntiSpamSystem:
         if self.is_admin(user_id):
             return True, ""
             
-        stats = self.user_stats[user_id]
+        stats = self._get_stats(user_id)
         current_time = time.time()
-        
-        # Очищаем старые сообщения (старше часа)
-        stats.recent_messages = [
-            msg_time for msg_time in stats.recent_messages 
-            if current_time - msg_time < 3600
-        ]
+        messages_last_minute, messages_last_hour = stats.recent_messages.counts(current_time)
         
         # Проверяем минимальный интервал
         if (current_time - stats.last_message_time) < self.MIN_MESSAGE_INTERVAL:
@@ -101,16 +190,12 @@ class AntiSpamSystem:
             return False, f"⚠️ Слишком быстро! Подождите {self.MIN_MESSAGE_INTERVAL} секунд между сообщениями."
         
         # Проверяем лимит в минуту
-        recent_minute = [
-            msg_time for msg_time in stats.recent_messages 
-            if current_time - msg_time < 60
-        ]
-        if len(recent_minute) >= self.MAX_MESSAGES_PER_MINUTE:
+        if messages_last_minute >= self.MAX_MESSAGES_PER_MINUTE:
             stats.spam_score += 10
             return False, f"⚠️ Превышен лимит сообщений в минуту ({self.MAX_MESSAGES_PER_MINUTE}). Подождите немного."
         
         # Проверяем лимит в час
-        if len(stats.recent_messages) >= self.MAX_MESSAGES_PER_HOUR:
+        if messages_last_hour >= self.MAX_MESSAGES_PER_HOUR:
             stats.spam_score += 15
             return False, f"⚠️ Превышен лимит сообщений в час ({self.MAX_MESSAGES_PER_HOUR}). Попробуйте позже."
         
@@ -124,19 +209,28 @@ class AntiSpamSystem:
         text_lower = text.lower()
         spam_words_found = []
         
-        for pattern in self.SPAM_PATTERNS:
-            if pattern in text_lower:
-                spam_words_found.append(pattern)
-        
-        # Проверяем на повторяющиеся символы (aaaaaaa, wwwwww)
+        # Поиск продолжается со следующего символа после начала совпадения, чтобы
+        # не пропустить пересекающиеся паттерны ("скидка" и "канал" в "скидканал")
+        matched = set()
+        match = self._spam_re.search(text_lower)
+        while match:
+            matched |= self._spam_nested[match.group()]
+            match = self._spam_re.search(text_lower, match.start() + 1)
+        if matched:
+            spam_words_found = [pattern for pattern in self.SPAM_PATTERNS if pattern in matched]
+        
+        # Проверяем на повторяющиеся символы (aaaaaaa, wwwwww): каждую букву считаем один раз
+        checked = set()
         for char in text_lower:
+            if char in checked:
+                continue
+            checked.add(char)
             if char.isalpha() and text_lower.count(char) > 7:
                 spam_words_found.append("повторяющиеся символы")
                 break
         
         # Проверяем на большое количество эмодзи
-        emoji_count = sum(1 for char in text if ord(char) > 0x1F000)
-        if emoji_count > 10:
+        if len(EMOJI_RE.findall(text)) > 10:
             spam_words_found.append("много эмодзи")
         
         if spam_words_found:
@@ -148,11 +242,13 @@ class AntiSpamSystem:
         """Обработать сообщение пользователя"""
         if self.is_admin(user_id):
             return True, ""
+        
+        self._evict_idle(time.time())
             
         # Проверяем блокировку
         if self.is_blocked(user_id):
-            stats = self.user_stats[user_id]
-            if stats.blocked_until > time.time():
+            stats = self.user_stats.get(user_id)
+            if stats and stats.blocked_until > time.time():
                 remaining = int(stats.blocked_until - time.time())
                 return False, f"🚫 Вы заблокированы на {remaining} секунд за спам."
             else:
@@ -167,7 +263,7 @@ class AntiSpamSystem:
         # Проверяем содержимое на спам
         content_ok, content_msg = self.check_spam_content(text)
         if not content_ok:
-            stats = self.user_stats[user_id]
+            stats = self._get_stats(user_id)
             stats.spam_score += 20
             self._apply_penalty(user_id, content_msg)
             return False, content_msg
@@ -178,12 +274,12 @@ class AntiSpamSystem:
     
     def _record_message(self, user_id: int):
         """Записать успешное сообщение"""
-        stats = self.user_stats[user_id]
+        stats = self._get_stats(user_id)
         current_time = time.time()
         
         stats.message_count += 1
         stats.last_message_time = current_time
-        stats.recent_messages.append(current_time)
+        stats.recent_messages.add(current_time)
         
         # Записываем в монитор безопасности
         if MONITORING_ENABLED:
@@ -195,7 +291,7 @@ class AntiSpamSystem:
     
     def _apply_penalty(self, user_id: int, reason: str):
         """Применить наказание за нарушение"""
-        stats = self.user_stats[user_id]
+        stats = self._get_stats(user_id)
         
         logger.warning(f"Применяется наказание для пользователя {user_id}: {reason}")
         
@@ -224,10 +320,10 @@ class AntiSpamSystem:
         if self.is_admin(user_id):
             return
             
-        stats = self.user_stats[user_id]
         current_time = time.time()
         
         if duration > 0:
+            stats = self._get_stats(user_id)
             stats.blocked_until = current_time + duration
             logger.warning(f"Пользователь {user_id} заблокирован на {duration} секунд. Причина: {reason}")
             
@@ -244,10 +340,11 @@ class AntiSpamSystem:
     
     def unblock_user(self, user_id: int):
         """Разблокировать пользователя"""
-        stats = self.user_stats[user_id]
-        stats.blocked_until = 0
-        stats.spam_score = 0
-        stats.warning_count = 0
+        stats = self.user_stats.get(user_id)
+        if stats:
+            stats.blocked_until = 0
+            stats.spam_score = 0
+            stats.warning_count = 0
         
         if user_id in self.blocked_users:
             self.blocked_users.remove(user_id)
@@ -265,7 +362,8 @@ class AntiSpamSystem:
     
     def get_user_stats(self, user_id: int) -> dict:
         """Получить статистику пользователя"""
-        stats = self.user_stats[user_id]
+        # Для неизвестного пользователя - пустая статистика, без сохранения записи
+        stats = self.user_stats.get(user_id) or UserStats()
         current_time = time.time()
         
         return {
@@ -276,10 +374,7 @@ class AntiSpamSystem:
             "is_blocked": self.is_blocked(user_id),
             "blocked_until": stats.blocked_until,
             "remaining_block_time": max(0, int(stats.blocked_until - current_time)),
-            "messages_last_hour": len([
-                msg_time for msg_time in stats.recent_messages 
-                if current_time - msg_time < 3600
-            ])
+            "messages_last_hour": stats.recent_messages.counts(current_time)[1]
         }
     
     def get_blocked_users(self) -> List[dict]:
@@ -287,8 +382,11 @@ class AntiSpamSystem:
         blocked = []
         current_time = time.time()
         
-        for user_id, stats in self.user_stats.items():
+        # Постоянно заблокированные могут не иметь статистики (вытеснена или не было сообщений)
+        user_ids = list(self.user_stats) + [user_id for user_id in self.blocked_users if user_id not in self.user_stats]
+        for user_id in user_ids:
             if self.is_blocked(user_id):
+                stats = self.user_stats.get(user_id) or UserStats()
                 remaining = max(0, int(stats.blocked_until - current_time))
                 blocked.append({
                     "user_id": user_id,
@@ -0,0 +1,56 @@
+#!/usr/bin/env python3
+"""
+Микро-бенчмарк проверки содержимого сообщений анти-спам системой
+"""
+import sys
+import os
+import timeit
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from anti_spam import anti_spam
+
+# Типичные тексты: кнопки и callback'и, вопросы, адреса, обращения в поддержку, спам
+MESSAGES = {
+    "callback": "add_to_cart_42",
+    "вопрос": "Когда будет доставка?",
+    "адрес": "Тбилиси, пр. Чавчавадзе 37, подъезд 2, этаж 5, кв 18, код 4512",
+    "поддержка": ("Здравствуйте! Заказал вчера, хотел уточнить время доставки "
+                  "и можно ли оплатить картой при получении. ") * 15,
+    "эмодзи": "🔥💰🎁" * 10 + " 12345" * 100,
+    "спам": "Бесплатно! Подписка на канал t.me/casino_bonus, промокод wwwwwwwww " * 5,
+}
+
+
+def legacy_check_spam_content(text: str) -> tuple[bool, str]:
+    """Прежняя реализация: str.count на каждый символ и отдельный проход по эмодзи"""
+    if not text:
+        return True, ""
+    text_lower = text.lower()
+    spam_words_found = []
+    for pattern in anti_spam.SPAM_PATTERNS:
+        if pattern in text_lower:
+            spam_words_found.append(pattern)
+    for char in text_lower:
+        if char.isalpha() and text_lower.count(char) > 7:
+            spam_words_found.append("повторяющиеся символы")
+            break
+    emoji_count = sum(1 for char in text if ord(char) > 0x1F000)
+    if emoji_count > 10:
+        spam_words_found.append("много эмодзи")
+    if spam_words_found:
+        return False, f"⚠️ Сообщение содержит признаки спама: {', '.join(spam_words_found[:3])}"
+    return True, ""
+
+
+def run_benchmark(number: int = 5000):
+    print(f"⏱  {number} проверок на сообщение:")
+    for title, text in MESSAGES.items():
+        assert anti_spam.check_spam_content(text) == legacy_check_spam_content(text), title
+        legacy = timeit.timeit(lambda: legacy_check_spam_content(text), number=number)
+        current = timeit.timeit(lambda: anti_spam.check_spam_content(text), number=number)
+        print(f"{title:10} {len(text):5} симв.: было {legacy * 1e6 / number:7.2f} мкс, "
+              f"стало {current * 1e6 / number:7.2f} мкс (x{legacy / current:.1f})")
+
+
+if __name__ == "__main__":
+    run_benchmark()
@@ -0,0 +1,77 @@
+#!/usr/bin/env python3
+"""
+Микро-бенчмарк переводов: обход вложенных словарей против скомпилированного каталога
+"""
+import sys
+import os
+import timeit
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from i18n import i18n, _flatten
+
+
+def legacy_t(key: str, user_id: int = None, **kwargs) -> str:
+    """Прежняя реализация I18n.t: разбор ключа и обход деревьев на каждый вызов"""
+    language = i18n.current_language
+    if user_id and user_id in i18n.user_languages:
+        language = i18n.user_languages.get(user_id)
+    keys = key.split('.')
+    translation = i18n.translations.get(language, {})
+    for k in keys:
+        if isinstance(translation, dict) and k in translation:
+            translation = translation[k]
+        else:
+            translation = i18n.translations.get(i18n.default_language, {})
+            for k in keys:
+                if isinstance(translation, dict) and k in translation:
+                    translation = translation[k]
+                else:
+                    return key
+            break
+    if isinstance(translation, str):
+        try:
+            return translation.format(**kwargs)
+        except KeyError:
+            return translation
+    return str(translation)
+
+
+def check_equivalence() -> int:
+    """Сравнить результаты на всех ключах всех языков"""
+    keys = set()
+    for tree in i18n.translations.values():
+        keys.update(_flatten(tree))
+    keys.add('missing.key')
+    user_id = 1
+    mismatches = 0
+    for language in i18n.get_available_languages():
+        i18n.set_language(language, user_id)
+        for key in keys:
+            for kwargs in ({}, {'order_id': 10001, 'date': '01.01.2026', 'total': 55.5, 'status': 'paid'}):
+                if i18n.t(key, user_id=user_id, **kwargs) != legacy_t(key, user_id=user_id, **kwargs):
+                    mismatches += 1
+                    print(f"❌ {language}:{key} {kwargs}")
+    return mismatches
+
+
+def run_benchmark(number: int = 200000):
+    user_id = 1
+    i18n.set_language("en", user_id)
+    cases = [
+        ("простой ключ", "menu.catalog", {}),
+        ("запасной язык", "catalog.by_flavors", {}),
+        ("шаблон", "orders.order_info", {"order_id": 10001, "date": "01.01.2026", "total": 55.5, "status": "paid"}),
+    ]
+    print(f"\n⏱  {number} вызовов на случай, язык en:")
+    for title, key, kwargs in cases:
+        legacy = timeit.timeit(lambda: legacy_t(key, user_id=user_id, **kwargs), number=number)
+        compiled = timeit.timeit(lambda: i18n.t(key, user_id=user_id, **kwargs), number=number)
+        print(f"{title:15} было {legacy * 1e6 / number:6.2f} мкс, стало {compiled * 1e6 / number:6.2f} мкс "
+              f"(x{legacy / compiled:.1f})")
+
+
+if __name__ == "__main__":
+    print("🧪 Проверка совпадения с прежней реализацией...")
+    mismatches = check_equivalence()
+    print("✅ Результаты совпадают" if not mismatches else f"❌ Расхождений: {mismatches}")
+    run_benchmark()
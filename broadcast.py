@@ -0,0 +1,335 @@
+"""
+Движок рассылок администратора
+
+Задание рассылки хранится в таблице broadcast_jobs (тексты, курсор по user_id,
+счетчики). Получатели читаются из БД пачками по возрастанию user_id (следующая
+пачка читается, пока отправляется текущая), после каждой пачки прогресс
+сохраняется, поэтому после перезапуска процесса рассылка продолжается с места
+остановки (повторно может уйти не больше одной пачки).
+
+Скорость ограничена token bucket (общий лимит Telegram ~30 сообщений/с, в каждый
+чат уходит одно сообщение) и семафором параллельности. TelegramRetryAfter
+приостанавливает всю рассылку на указанное время, пользователи, заблокировавшие
+бота, помечаются неактивными и в следующие рассылки не попадают.
+"""
+import asyncio
+import json
+import logging
+import time
+from contextlib import aclosing, suppress
+from typing import Dict, NamedTuple, Optional
+from aiogram import Bot
+from aiogram.exceptions import TelegramForbiddenError, TelegramRetryAfter
+from aiogram.types import InlineKeyboardMarkup, InlineKeyboardButton
+from config import (
+    BROADCAST_RATE_PER_SECOND, BROADCAST_CONCURRENCY, BROADCAST_BATCH_SIZE,
+    BROADCAST_MAX_RETRIES, BROADCAST_PROGRESS_INTERVAL
+)
+from database import background_db
+
+logger = logging.getLogger(__name__)
+
+BROADCAST_HEADERS = {
+    'ru': f"📢 <b>Новости от Tbilisi Vape Shop</b> 📢",
+    'ka': f"📢 <b>ახალი ამბები Tbilisi Vape Shop-დან</b> 📢",
+    'en': f"📢 <b>News from Tbilisi Vape Shop</b> 📢"
+}
+
+BROADCAST_FOOTERS = {
+    'ru': f"\n\n━━━━━━━━━━━━━━━━━━━━━━━━\n💨 <i>Tbilisi Vape Shop</i>\n🛍️ <i>Лучшие цены на вейпы в Тбилиси</i>",
+    'ka': f"\n\n━━━━━━━━━━━━━━━━━━━━━━━━\n💨 <i>Tbilisi Vape Shop</i>\n🛍️ <i>საუკეთესო ფასები ვეიფზე თბილისში</i>",
+    'en': f"\n\n━━━━━━━━━━━━━━━━━━━━━━━━\n💨 <i>Tbilisi Vape Shop</i>\n🛍️ <i>Best vape prices in Tbilisi</i>"
+}
+
+LANGUAGE_NAMES = {"ru": "русском", "ka": "грузинском", "en": "английском"}
+
+# Кнопка "Главное меню" под каждой рассылкой (общий объект для всех получателей)
+BROADCAST_KEYBOARD = InlineKeyboardMarkup(inline_keyboard=[
+    [InlineKeyboardButton(text="🏠 Главное меню", callback_data="back_to_menu")]
+])
+
+
+def format_broadcast_message(text: str, user_id: int = None, lang: str = None) -> str:
+    """
+    Форматирует сообщение рассылки с красивым оформлением
+
+    Язык оформления - lang, а если он не задан - язык пользователя user_id.
+    """
+    if lang is None:
+        from i18n import i18n
+        lang = i18n.get_user_language(user_id) if user_id else 'ru'
+
+    header = BROADCAST_HEADERS.get(lang, BROADCAST_HEADERS['ru'])
+    footer = BROADCAST_FOOTERS.get(lang, BROADCAST_FOOTERS['ru'])
+
+    return f"{header}\n\n{text}{footer}"
+
+
+class BroadcastTemplate(NamedTuple):
+    """Готовое сообщение рассылки для одного языка"""
+    text: str
+    reply_markup: InlineKeyboardMarkup
+
+
+def compile_templates(messages: Dict[str, str]) -> Dict[str, BroadcastTemplate]:
+    """Оформить тексты рассылки один раз на язык перед отправкой"""
+    return {
+        lang: BroadcastTemplate(format_broadcast_message(text, lang=lang), BROADCAST_KEYBOARD)
+        for lang, text in messages.items()
+    }
+
+
+class TokenBucket:
+    """Ограничитель скорости отправки (token bucket) с общей паузой"""
+
+    def __init__(self, rate: float, capacity: float):
+        self.rate = rate
+        self.capacity = capacity
+        self._tokens = capacity
+        self._updated = time.monotonic()
+        self._paused_until = 0.0
+        self._lock = asyncio.Lock()
+
+    def pause(self, seconds: float):
+        """Остановить выдачу токенов (ответ RetryAfter от Telegram)"""
+        self._paused_until = max(self._paused_until, time.monotonic() + seconds)
+        self._tokens = 0
+        self._updated = self._paused_until
+
+    async def acquire(self):
+        """Дождаться токена на одну отправку"""
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                if now < self._paused_until:
+                    await asyncio.sleep(self._paused_until - now)
+                    continue
+                self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+                self._updated = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                await asyncio.sleep((1 - self._tokens) / self.rate)
+
+
+async def _prefetch(batches):
+    """Читать следующую пачку получателей, пока отправляется текущая"""
+    queue = asyncio.Queue(maxsize=1)
+    done = object()
+
+    async def produce():
+        cancelled = False
+        try:
+            async for batch in batches:
+                await queue.put(batch)
+        except asyncio.CancelledError:
+            cancelled = True
+            raise
+        finally:
+            # После отмены читать очередь уже некому - put на полной очереди ждал бы вечно
+            if not cancelled:
+                await queue.put(done)
+
+    producer = asyncio.create_task(produce())
+    try:
+        while True:
+            batch = await queue.get()
+            if batch is done:
+                break
+            yield batch
+        await producer  # Пробрасываем ошибку чтения, если она была
+    finally:
+        if not producer.done():
+            producer.cancel()
+            with suppress(asyncio.CancelledError):
+                await producer
+        await batches.aclose()
+
+
+class BroadcastEngine:
+    """Выполнение заданий рассылки в фоне"""
+
+    def __init__(self):
+        self._bucket = TokenBucket(BROADCAST_RATE_PER_SECOND, BROADCAST_RATE_PER_SECOND)
+        self._tasks: Dict[int, asyncio.Task] = {}
+
+    async def start_job(self, bot: Bot, admin_id: int, chat_id: int, message_id: int,
+                        mode: str, messages: Dict[str, str], language: Optional[str] = None) -> int:
+        """Создать задание рассылки и запустить его в фоне
+
+        mode: 'auto' - каждому на его языке (messages: {язык: текст}),
+        'single' - всем пользователям языка language (messages: {language: текст}).
+        Прогресс показывается в сообщении message_id чата chat_id.
+        """
+        job_id = await background_db.create_broadcast_job(
+            admin_id, chat_id, message_id, mode, language, messages
+        )
+        logger.info(f"Создана рассылка #{job_id} ({mode}, {language or 'все языки'})")
+        self._spawn(bot, job_id)
+        return job_id
+
+    async def resume_jobs(self, bot: Bot):
+        """Продолжить рассылки, прерванные перезапуском процесса"""
+        for job_id in await background_db.get_running_broadcast_jobs():
+            logger.info(f"Продолжаем рассылку #{job_id} после перезапуска")
+            self._spawn(bot, job_id)
+
+    async def cancel_job(self, job_id: int) -> bool:
+        """Остановить рассылку; задание заметит отмену после текущей пачки"""
+        return await background_db.cancel_broadcast_job(job_id)
+
+    def _spawn(self, bot: Bot, job_id: int):
+        if job_id in self._tasks:
+            return
+        task = asyncio.create_task(self._run_job(bot, job_id))
+        self._tasks[job_id] = task
+        task.add_done_callback(lambda _: self._tasks.pop(job_id, None))
+
+    async def _run_job(self, bot: Bot, job_id: int):
+        """Отправка всем получателям задания пачками с сохранением прогресса"""
+        try:
+            job = await background_db.get_broadcast_job(job_id)
+            if not job or job['status'] != 'running':
+                return
+            templates = compile_templates(json.loads(job['messages']))
+            lang_stats = json.loads(job['lang_stats'])
+            counters = {'sent': job['sent'], 'failed': job['failed'], 'blocked': job['blocked']}
+            status = job['status']
+            last_progress = time.monotonic()
+            semaphore = asyncio.Semaphore(BROADCAST_CONCURRENCY)
+
+            recipients = background_db.iter_broadcast_recipients(
+                job['language'], job['last_user_id'], BROADCAST_BATCH_SIZE
+            )
+            async with aclosing(_prefetch(recipients)) as batches:
+                async for batch in batches:
+                    results = await asyncio.gather(*(
+                        self._send(bot, semaphore, job, templates, user) for user in batch
+                    ))
+
+                    blocked_user_ids = []
+                    for user_id, lang, outcome in results:
+                        counters[outcome] += 1
+                        stats = lang_stats.setdefault(lang, {'sent': 0, 'failed': 0})
+                        stats['sent' if outcome == 'sent' else 'failed'] += 1
+                        if outcome == 'blocked':
+                            blocked_user_ids.append(user_id)
+
+                    status = await background_db.save_broadcast_progress(
+                        job_id, batch[-1]['user_id'], counters['sent'], counters['failed'],
+                        counters['blocked'], lang_stats, blocked_user_ids
+                    )
+                    if status != 'running':
+                        break
+
+                    if time.monotonic() - last_progress >= BROADCAST_PROGRESS_INTERVAL:
+                        last_progress = time.monotonic()
+                        await self._show_progress(bot, job, counters)
+
+            if status == 'running':
+                await background_db.finish_broadcast_job(job_id)
+            await self._show_result(bot, job, counters, lang_stats, cancelled=(status == 'cancelled'))
+            logger.info(f"Рассылка #{job_id} завершена: {counters}")
+
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            # Задание остается в статусе running и продолжится после перезапуска
+            logger.error(f"Ошибка рассылки #{job_id}: {e}")
+
+    async def _send(self, bot: Bot, semaphore: asyncio.Semaphore, job,
+                    templates: Dict[str, BroadcastTemplate], user):
+        """Отправить сообщение одному получателю: (user_id, язык, sent/failed/blocked)"""
+        user_id = user['user_id']
+        if job['mode'] == 'auto':
+            lang = user['language_code']
+            if not lang:
+                from i18n import i18n
+                lang = i18n.get_user_language(user_id)
+            if lang not in templates:
+                lang = 'ru'
+        else:
+            lang = job['language']
+        template = templates[lang]
+
+        async with semaphore:
+            for _ in range(BROADCAST_MAX_RETRIES + 1):
+                await self._bucket.acquire()
+                try:
+                    await bot.send_message(user_id, template.text, parse_mode='HTML',
+                                           reply_markup=template.reply_markup)
+                    return user_id, lang, 'sent'
+                except TelegramRetryAfter as e:
+                    logger.warning(f"Telegram просит подождать {e.retry_after}с, рассылка приостановлена")
+                    self._bucket.pause(e.retry_after)
+                except TelegramForbiddenError:
+                    return user_id, lang, 'blocked'
+                except Exception as e:
+                    logger.debug(f"Не удалось отправить рассылку пользователю {user_id}: {e}")
+                    return user_id, lang, 'failed'
+        return user_id, lang, 'failed'
+
+    async def _show_progress(self, bot: Bot, job, counters: Dict[str, int]):
+        done = counters['sent'] + counters['failed'] + counters['blocked']
+        text = (
+            f"📢 <b>Рассылка #{job['id']}</b>\n\n"
+            f"⏳ Обработано: {done} из {job['total']}\n"
+            f"📤 Отправлено: {counters['sent']}\n"
+            f"❌ Не доставлено: {counters['failed']}\n"
+            f"🚫 Заблокировали бота: {counters['blocked']}"
+        )
+        keyboard = InlineKeyboardMarkup(inline_keyboard=[
+            [InlineKeyboardButton(text="⛔ Остановить", callback_data=f"stop_broadcast_{job['id']}")]
+        ])
+        await self._edit_status(bot, job, text, keyboard)
+
+    async def _show_result(self, bot: Bot, job, counters: Dict[str, int], lang_stats, cancelled: bool):
+        def lang_line(lang):
+            stats = lang_stats.get(lang, {'sent': 0, 'failed': 0})
+            return f"✅ {stats['sent']} | ❌ {stats['failed']}"
+
+        undelivered = counters['failed'] + counters['blocked']
+        if job['mode'] == 'auto':
+            title = "⛔ <b>Многоязычная рассылка остановлена</b>" if cancelled else "✅ <b>Многоязычная рассылка завершена!</b>"
+            text = (
+                f"{title}\n\n"
+                f"📊 <b>Статистика по языкам:</b>\n\n"
+                f"🇷🇺 Русский: {lang_line('ru')}\n"
+                f"🇬🇪 Грузинский: {lang_line('ka')}\n"
+                f"🇬🇧 Английский: {lang_line('en')}\n\n"
+                f"📤 <b>Всего отправлено:</b> {counters['sent']}\n"
+                f"❌ <b>Не доставлено:</b> {undelivered}"
+            )
+        else:
+            lang_name = LANGUAGE_NAMES.get(job['language'], job['language'])
+            title = (f"⛔ <b>Рассылка на {lang_name} языке остановлена</b>" if cancelled
+                     else f"✅ <b>Рассылка на {lang_name} языке завершена!</b>")
+            text = (
+                f"{title}\n\n"
+                f"📤 Отправлено: {counters['sent']}\n"
+                f"❌ Не доставлено: {undelivered}"
+            )
+        if counters['blocked']:
+            text += f"\n🚫 Из них заблокировали бота: {counters['blocked']}"
+
+        keyboard = InlineKeyboardMarkup(inline_keyboard=[
+            [InlineKeyboardButton(text="🔙 Админ панель", callback_data="admin_panel")]
+        ])
+        await self._edit_status(bot, job, text, keyboard)
+
+    async def _edit_status(self, bot: Bot, job, text: str, keyboard: InlineKeyboardMarkup):
+        """Обновить сообщение со статусом рассылки у администратора"""
+        try:
+            await bot.edit_message_text(
+                text,
+                chat_id=job['status_chat_id'],
+                message_id=job['status_message_id'],
+                reply_markup=keyboard,
+                parse_mode='HTML'
+            )
+        except Exception as e:
+            logger.debug(f"Не удалось обновить статус рассылки #{job['id']}: {e}")
+
+
+# Глобальный экземпляр движка рассылок
+broadcast_engine = BroadcastEngine()
@@ -1,7 +1,7 @@
 """
 Динамические фильтры для кнопок без хардкода
 """
-from typing import List, Optional
+from typing import FrozenSet, List, Optional
 from aiogram.types import Message
 from i18n import i18n
 
@@ -28,14 +28,19 @@ def get_all_translations_for_key(key: str) -> List[str]:
     return list(set(translations))  # Убираем дубликаты
 
 
+def get_keys_for_text(text: str) -> FrozenSet[str]:
+    """Получить ключи переводов, текст которых на каком-либо языке совпадает с text"""
+    return i18n.text_index.get(text, frozenset())
+
+
 def create_button_filter(translation_key: str):
     """Создать фильтр для кнопки по ключу перевода"""
     def filter_func(message: Message) -> bool:
         if not message.text:
             return False
         
-        button_texts = get_all_translations_for_key(translation_key)
-        return message.text in button_texts
+        # Индекс пересобирается в i18n при загрузке переводов
+        return translation_key in get_keys_for_text(message.text)
     
     return filter_func
 
@@ -0,0 +1,121 @@
+"""
+Кэш каталога в памяти процесса
+
+Справочные данные каталога (категории, вкусы, карточки товаров) меняются только
+из админки, поэтому хранятся в памяти до явной инвалидации (invalidate) из
+методов записи Database. Версия защищает от сохранения данных, загрузка которых
+началась до инвалидации.
+
+Наличие (in_stock, остаток, доступное количество с учетом резервов) меняется
+постоянно и хранится отдельным снимком с коротким сроком жизни; он
+сбрасывается при изменениях склада и корзин в этом процессе.
+
+Счетчики заказов по статусам (OrderCountsCache) устроены так же, как снимок
+наличия: короткий срок жизни и сброс при создании заказа или смене статуса.
+"""
+import time
+from typing import Dict, List, NamedTuple, Optional, Tuple
+from config import CATALOG_CACHE_TTL, CATALOG_AVAILABILITY_TTL, ORDER_COUNTS_TTL
+from models import FlavorCategory, Product
+
+
+class CatalogSnapshot(NamedTuple):
+    """Справочные данные каталога"""
+    categories: Dict[int, object]  # id -> запись categories (по возрастанию id)
+    flavor_categories: List[FlavorCategory]  # по имени
+    products: Dict[int, Product]  # id -> товар (по возрастанию id)
+    products_by_category: Dict[int, List[int]]  # по id
+    products_by_flavor: Dict[int, List[int]]  # по имени товара
+
+
+def build_snapshot(category_rows, flavor_categories: List[FlavorCategory], products: List[Product]) -> CatalogSnapshot:
+    """Собрать снимок каталога с индексами по категориям и вкусам"""
+    products_by_category: Dict[int, List[int]] = {}
+    products_by_flavor: Dict[int, List[int]] = {}
+    for product in products:
+        products_by_category.setdefault(product.category_id, []).append(product.id)
+    for product in sorted(products, key=lambda p: p.name):
+        if product.flavor_category_id is not None:
+            products_by_flavor.setdefault(product.flavor_category_id, []).append(product.id)
+    return CatalogSnapshot(
+        categories={row['id']: row for row in category_rows},
+        flavor_categories=flavor_categories,
+        products={product.id: product for product in products},
+        products_by_category=products_by_category,
+        products_by_flavor=products_by_flavor,
+    )
+
+
+class CatalogCache:
+    """Версионированный кэш каталога"""
+
+    def __init__(self):
+        self.version = 0
+        self._catalog: Optional[CatalogSnapshot] = None
+        self._catalog_loaded_at = 0.0
+        self.availability_version = 0
+        # id -> (in_stock, stock_quantity, доступно с учетом резервов)
+        self._availability: Optional[Dict[int, Tuple[bool, int, int]]] = None
+        self._availability_loaded_at = 0.0
+
+    def invalidate(self):
+        """Сбросить весь кэш (изменение товаров, категорий или вкусов)"""
+        self.version += 1
+        self._catalog = None
+        self.invalidate_availability()
+
+    def invalidate_availability(self):
+        """Сбросить снимок наличия (изменение склада, корзин или резервов)"""
+        self.availability_version += 1
+        self._availability = None
+
+    def get_catalog(self) -> Optional[CatalogSnapshot]:
+        if self._catalog is not None and time.monotonic() - self._catalog_loaded_at < CATALOG_CACHE_TTL:
+            return self._catalog
+        return None
+
+    def store_catalog(self, version: int, catalog: CatalogSnapshot):
+        """Сохранить снимок, если с начала загрузки не было инвалидации"""
+        if version == self.version:
+            self._catalog = catalog
+            self._catalog_loaded_at = time.monotonic()
+
+    def get_availability(self) -> Optional[Dict[int, Tuple[bool, int, int]]]:
+        if self._availability is not None and time.monotonic() - self._availability_loaded_at < CATALOG_AVAILABILITY_TTL:
+            return self._availability
+        return None
+
+    def store_availability(self, version: int, availability: Dict[int, Tuple[bool, int, int]]):
+        if version == self.availability_version:
+            self._availability = availability
+            self._availability_loaded_at = time.monotonic()
+
+
+class OrderCountsCache:
+    """Версионированный кэш количества заказов по статусам"""
+
+    def __init__(self):
+        self.version = 0
+        self._counts: Optional[Dict[str, int]] = None
+        self._loaded_at = 0.0
+
+    def invalidate(self):
+        """Сбросить счетчики (создание заказа, смена статуса, удаление)"""
+        self.version += 1
+        self._counts = None
+
+    def get(self) -> Optional[Dict[str, int]]:
+        if self._counts is not None and time.monotonic() - self._loaded_at < ORDER_COUNTS_TTL:
+            return self._counts
+        return None
+
+    def store(self, version: int, counts: Dict[str, int]):
+        """Сохранить счетчики, если с начала загрузки не было инвалидации"""
+        if version == self.version:
+            self._counts = counts
+            self._loaded_at = time.monotonic()
+
+
+# Глобальные экземпляры кэшей (общие для всех пулов Database)
+catalog_cache = CatalogCache()
+order_counts_cache = OrderCountsCache()
@@ -2,10 +2,14 @@
 Компонент пагинации для многократного использования
 """
 
-from typing import List, Dict, Any, Optional, Callable
+from datetime import datetime, timedelta
+from typing import List, Dict, Any, Optional, Callable, Tuple
 from aiogram.types import InlineKeyboardMarkup, InlineKeyboardButton
 from i18n import _
 
+# Начало отсчета для курсоров (created_at в БД хранится без часового пояса)
+_CURSOR_EPOCH = datetime(1970, 1, 1)
+
 
 class PaginationComponent:
     """Универсальный компонент пагинации"""
@@ -76,6 +80,108 @@ class PaginationComponent:
             'end_index': end_index
         }
     
+    def paginate_offset(self, items: List[Any], page: int, total_items: int) -> Dict[str, Any]:
+        """
+        Информация о странице, уже загруженной из БД через LIMIT/OFFSET
+
+        Args:
+            items: Элементы текущей страницы
+            page: Номер текущей страницы (начиная с 1)
+            total_items: Общее количество элементов
+
+        Returns:
+            Dict в формате paginate()
+        """
+        page = max(page, 1)
+        total_pages = (total_items + self.items_per_page - 1) // self.items_per_page
+        start_index = (page - 1) * self.items_per_page
+
+        return {
+            'items': items,
+            'page': page,
+            'total_pages': total_pages,
+            'total_items': total_items,
+            'has_prev': page > 1,
+            'has_next': page < total_pages,
+            'start_index': start_index,
+            'end_index': start_index + len(items)
+        }
+
+    def paginate_cursor(
+        self,
+        items: List[Any],
+        page: int,
+        total_items: int,
+        cursor_of: Callable[[Any], str]
+    ) -> Dict[str, Any]:
+        """
+        Информация о странице, загруженной по курсору (keyset), без полного списка
+        
+        Args:
+            items: Элементы текущей страницы (уже загруженные из БД)
+            page: Номер текущей страницы (начиная с 1)
+            total_items: Общее количество элементов (например, из кэша счетчиков)
+            cursor_of: Функция, возвращающая курсор элемента (см. make_cursor)
+            
+        Returns:
+            Dict в формате paginate() и дополнительно:
+            'prev_cursor' - курсор первого элемента страницы,
+            'next_cursor' - курсор последнего элемента страницы
+        """
+        page = max(page, 1)
+        total_pages = (total_items + self.items_per_page - 1) // self.items_per_page
+        if items and page > total_pages:
+            total_pages = page  # Счетчик устарел: элементов больше, чем в нем
+        start_index = (page - 1) * self.items_per_page
+        
+        return {
+            'items': items,
+            'page': page,
+            'total_pages': total_pages,
+            'total_items': total_items,
+            'has_prev': page > 1 and bool(items),
+            'has_next': page < total_pages and len(items) == self.items_per_page,
+            'start_index': start_index,
+            'end_index': start_index + len(items),
+            'prev_cursor': cursor_of(items[0]) if items else None,
+            'next_cursor': cursor_of(items[-1]) if items else None
+        }
+    
+    @staticmethod
+    def make_cursor(created_at: datetime, item_id: int) -> str:
+        """Курсор по ключу (created_at, id) для callback_data"""
+        return f"{(created_at - _CURSOR_EPOCH) // timedelta(microseconds=1)}-{item_id}"
+    
+    @staticmethod
+    def parse_cursor(cursor: str) -> Tuple[datetime, int]:
+        """Разобрать курсор make_cursor в (created_at, id); ValueError, если он некорректен"""
+        microseconds, item_id = cursor.split("-")
+        if not (microseconds.isdigit() and item_id.isdigit()):
+            raise ValueError(f"Некорректный курсор: {cursor!r}")
+        try:
+            return _CURSOR_EPOCH + timedelta(microseconds=int(microseconds)), int(item_id)
+        except OverflowError:
+            raise ValueError(f"Некорректный курсор: {cursor!r}")
+    
+    @staticmethod
+    def parse_cursor_callback(data: str, callback_prefix: str) -> Tuple[int, bool, Optional[str]]:
+        """
+        Разобрать callback_data кнопки пагинации по курсору
+        
+        Returns:
+            (страница, назад ли, курсор) или (1, False, None) для первой страницы,
+            в том числе если callback_data испорчена
+        """
+        parts = data[len(callback_prefix) + 1:].split("_")
+        if len(parts) != 2 or not parts[0].isdigit() or int(parts[0]) < 1 or parts[1][:1] not in ("a", "b"):
+            return 1, False, None
+        cursor = parts[1][1:]
+        try:
+            PaginationComponent.parse_cursor(cursor)
+        except ValueError:
+            return 1, False, None
+        return int(parts[0]), parts[1][0] == "b", cursor
+    
     def create_pagination_keyboard(
         self,
         pagination_info: Dict[str, Any],
@@ -88,7 +194,7 @@ class PaginationComponent:
         Создает клавиатуру с пагинацией
         
         Args:
-            pagination_info: Информация о пагинации из метода paginate()
+            pagination_info: Информация о пагинации из метода paginate() или paginate_cursor()
             callback_prefix: Префикс для callback_data пагинации (например, "orders_page")
             user_id: ID пользователя для переводов
             item_button_generator: Функция для генерации кнопок элементов
@@ -113,12 +219,19 @@ class PaginationComponent:
         if pagination_info['total_pages'] > 1:
             pagination_row = []
             
+            # В режиме курсора страница передается вместе с ключом соседнего элемента:
+            # "b<курсор>" - элементы перед первым, "a<курсор>" - после последнего
+            prev_suffix = next_suffix = ""
+            if pagination_info.get('prev_cursor'):
+                prev_suffix = f"_b{pagination_info['prev_cursor']}"
+                next_suffix = f"_a{pagination_info['next_cursor']}"
+            
             # Кнопка "Предыдущая"
             if pagination_info['has_prev']:
                 pagination_row.append(
                     InlineKeyboardButton(
                         text=f"⬅️ {_('common.prev_page', user_id=user_id)}",
-                        callback_data=f"{callback_prefix}_{pagination_info['page'] - 1}"
+                        callback_data=f"{callback_prefix}_{pagination_info['page'] - 1}{prev_suffix}"
                     )
                 )
             
@@ -127,7 +240,7 @@ class PaginationComponent:
                 pagination_row.append(
                     InlineKeyboardButton(
                         text=f"{_('common.next_page', user_id=user_id)} ➡️",
-                        callback_data=f"{callback_prefix}_{pagination_info['page'] + 1}"
+                        callback_data=f"{callback_prefix}_{pagination_info['page'] + 1}{next_suffix}"
                     )
                 )
             
@@ -29,4 +29,36 @@ DELIVERY_ZONES = {
 }
 
 # Минимальная сумма заказа
-MIN_ORDER_AMOUNT = 20
\ No newline at end of file
+MIN_ORDER_AMOUNT = 20
+# Фоновая очистка просроченных резервов: строк за один запрос и запросов за один проход
+RESERVATION_CLEANUP_BATCH_SIZE = int(os.getenv("RESERVATION_CLEANUP_BATCH_SIZE", "200"))
+RESERVATION_CLEANUP_MAX_BATCHES = int(os.getenv("RESERVATION_CLEANUP_MAX_BATCHES", "5"))
+# Пул соединений с БД для запросов пользователей
+DB_POOL_MIN_SIZE = int(os.getenv("DB_POOL_MIN_SIZE", "5"))
+DB_POOL_MAX_SIZE = int(os.getenv("DB_POOL_MAX_SIZE", "10"))
+DB_COMMAND_TIMEOUT = float(os.getenv("DB_COMMAND_TIMEOUT", "30"))
+# Отдельный небольшой пул для фоновых задач (очистка резервов, рассылки, статистика),
+# чтобы они не занимали соединения оформления заказов
+DB_BACKGROUND_POOL_MIN_SIZE = int(os.getenv("DB_BACKGROUND_POOL_MIN_SIZE", "1"))
+DB_BACKGROUND_POOL_MAX_SIZE = int(os.getenv("DB_BACKGROUND_POOL_MAX_SIZE", "3"))
+DB_BACKGROUND_COMMAND_TIMEOUT = float(os.getenv("DB_BACKGROUND_COMMAND_TIMEOUT", "120"))
+# Размер кэша подготовленных запросов на одно соединение
+DB_STATEMENT_CACHE_SIZE = int(os.getenv("DB_STATEMENT_CACHE_SIZE", "100"))
+# Кэш каталога: справочные данные живут до инвалидации из админки (TTL - страховка),
+# снимок наличия товаров - несколько секунд
+CATALOG_CACHE_TTL = float(os.getenv("CATALOG_CACHE_TTL", "300"))
+CATALOG_AVAILABILITY_TTL = float(os.getenv("CATALOG_AVAILABILITY_TTL", "2"))
+# Рассылки: общий лимит сообщений в секунду (у Telegram ~30), одновременных отправок,
+# получателей в пачке (после каждой сохраняется прогресс), повторов после RetryAfter,
+# период обновления прогресса у администратора (секунды)
+BROADCAST_RATE_PER_SECOND = float(os.getenv("BROADCAST_RATE_PER_SECOND", "25"))
+BROADCAST_CONCURRENCY = int(os.getenv("BROADCAST_CONCURRENCY", "10"))
+BROADCAST_BATCH_SIZE = int(os.getenv("BROADCAST_BATCH_SIZE", "100"))
+BROADCAST_MAX_RETRIES = int(os.getenv("BROADCAST_MAX_RETRIES", "3"))
+BROADCAST_PROGRESS_INTERVAL = float(os.getenv("BROADCAST_PROGRESS_INTERVAL", "5"))
+# Языки пользователей в памяти: сколько последних активных пользователей держать в кэше
+USER_LANGUAGE_CACHE_SIZE = int(os.getenv("USER_LANGUAGE_CACHE_SIZE", "10000"))
+# Счетчики заказов по статусам для списков в админке, секунд
+ORDER_COUNTS_TTL = float(os.getenv("ORDER_COUNTS_TTL", "30"))
+# Кэш отрисованных статичных страниц (render): максимум записей
+RENDER_CACHE_SIZE = int(os.getenv("RENDER_CACHE_SIZE", "500"))
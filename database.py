@@ -1,31 +1,127 @@
 import asyncpg
 import asyncio
+from contextlib import asynccontextmanager
 from datetime import datetime
 import json
 import logging
-from config import DATABASE_URL
-from models import User, Category, Product, CartItem, Order, FlavorCategory
+import re
+from config import (
+    DATABASE_URL, DB_POOL_MIN_SIZE, DB_POOL_MAX_SIZE, DB_COMMAND_TIMEOUT,
+    DB_BACKGROUND_POOL_MIN_SIZE, DB_BACKGROUND_POOL_MAX_SIZE, DB_BACKGROUND_COMMAND_TIMEOUT,
+    DB_STATEMENT_CACHE_SIZE
+)
+from models import User, Category, Product, CartItem, Order, OrderItem, FlavorCategory
+from query_stats import query_stats
+from catalog_cache import catalog_cache, order_counts_cache, build_snapshot
 from typing import List, Optional
 
 logger = logging.getLogger(__name__)
 
+# Полный пересчет учета резервов (products.reserved_quantity).
+# Резерв заказа учитывается только пока заказ в статусе waiting_payment.
+REBUILD_AVAILABILITY_LEDGER_SQL = """
+WITH reserved AS (
+    SELECT product_id, SUM(quantity) AS quantity
+    FROM (
+        SELECT product_id, quantity FROM cart
+        UNION ALL
+        SELECT ri.product_id, ri.quantity
+        FROM reservation_items ri
+        JOIN orders o ON ri.order_id = o.id
+        WHERE o.status = 'waiting_payment'
+    ) items
+    GROUP BY product_id
+)
+UPDATE products p
+SET reserved_quantity = COALESCE(reserved.quantity, 0)
+FROM products p2
+LEFT JOIN reserved ON reserved.product_id = p2.id
+WHERE p.id = p2.id AND p.reserved_quantity IS DISTINCT FROM COALESCE(reserved.quantity, 0)
+"""
+
+_ORDER_FIELDS = ("id", "order_number", "user_id", "products", "total_price", "delivery_zone", "delivery_price",
+                 "phone", "address", "status", "payment_screenshot", "created_at", "latitude", "longitude")
+_ORDER_COLUMNS = ", ".join(_ORDER_FIELDS)
+
+# Реестр самых частых запросов. Они подготавливаются один раз на соединение
+# (в init пула попадают в кэш подготовленных операторов asyncpg) и выполняются
+# по имени через fetch*_prepared. Только явные списки колонок.
+PREPARED_STATEMENTS = {
+    'get_user': "SELECT user_id, username, first_name, phone, address, language_code, created_at FROM users WHERE user_id = $1",
+    'get_user_language': "SELECT language_code FROM users WHERE user_id = $1",
+    'get_product': """SELECT id, name, price, description, photo, category_id, in_stock, created_at,
+                             stock_quantity, flavor_category_id
+                      FROM products WHERE id = $1""",
+    'get_cart': """SELECT c.product_id, c.quantity, p.name, p.price, p.photo, c.reserved_until
+                   FROM cart c
+                   JOIN products p ON c.product_id = p.id
+                   WHERE c.user_id = $1 AND p.in_stock = true AND c.reserved_until > CURRENT_TIMESTAMP""",
+    'get_product_quantity_in_cart': """SELECT COALESCE(quantity, 0)
+                                       FROM cart
+                                       WHERE user_id = $1 AND product_id = $2 AND reserved_until > CURRENT_TIMESTAMP""",
+    'get_available_product_quantity': """SELECT GREATEST(0, stock_quantity - reserved_quantity)
+                                         FROM products WHERE id = $1 AND in_stock = true""",
+    'get_order': f"SELECT {_ORDER_COLUMNS} FROM orders WHERE id = $1",
+    'get_order_by_number': f"SELECT {_ORDER_COLUMNS} FROM orders WHERE order_number = $1",
+    'is_admin_in_db': "SELECT user_id FROM admins WHERE user_id = $1",
+}
+
+
+def _param_count(sql):
+    """Число параметров $N в запросе"""
+    return max((int(n) for n in re.findall(r'\$(\d+)', sql)), default=0)
+
+
+def _status_rows(status):
+    """Число строк из статуса команды ('UPDATE 3' -> 3)"""
+    tail = status.rsplit(' ', 1)[-1] if status else ''
+    return int(tail) if tail.isdigit() else 0
+
+
 class Database:
-    def __init__(self):
+    def __init__(self, background=False):
+        """background=True - отдельный пул для фоновых задач (см. background_db)"""
         self.database_url = DATABASE_URL
         self._pool = None
-        self._last_cleanup_time = 0  # Кэш времени последней очистки
+        self._pool_lock = asyncio.Lock()
+        self._background = background
+        self._stats_prefix = 'bg:' if background else ''
     
     async def init_pool(self):
         """Инициализация пула соединений"""
-        if not self._pool:
+        if self._pool:
+            return
+        async with self._pool_lock:
+            if self._pool:
+                return  # Пул уже создан параллельным вызовом
+            
             async def init_connection(conn):
                 # Устанавливаем часовой пояс для каждого соединения
                 await conn.execute("SET timezone = 'Asia/Tbilisi'")
+                # Подготавливаем частые запросы: прогон с NULL-параметрами ничего
+                # не находит, но кладет оператор в кэш соединения. Если схема еще
+                # не создана, запрос подготовится при первом использовании
+                for name, sql in PREPARED_STATEMENTS.items():
+                    try:
+                        await conn.fetch(sql, *[None] * _param_count(sql))
+                    except asyncpg.PostgresError as e:
+                        logger.debug(f"Запрос {name} не подготовлен заранее: {e}")
             
+            if self._background:
+                min_size, max_size = DB_BACKGROUND_POOL_MIN_SIZE, DB_BACKGROUND_POOL_MAX_SIZE
+                command_timeout = DB_BACKGROUND_COMMAND_TIMEOUT
+            else:
+                min_size, max_size = DB_POOL_MIN_SIZE, DB_POOL_MAX_SIZE
+                command_timeout = DB_COMMAND_TIMEOUT
+            
+            # min_size соединений открываются сразу: первые запросы после деплоя
+            # не ждут установки соединений
             self._pool = await asyncpg.create_pool(
                 self.database_url, 
-                min_size=1, 
-                max_size=10,
+                min_size=min_size, 
+                max_size=max_size,
+                command_timeout=command_timeout,
+                statement_cache_size=DB_STATEMENT_CACHE_SIZE,
                 init=init_connection
             )
     
@@ -33,78 +129,205 @@ class Database:
         """Закрытие пула соединений"""
         if self._pool:
             await self._pool.close()
+            self._pool = None
+    
+    def _stats_name(self, query_name, query):
+        """Ключ статистики запроса: явное имя или начало текста запроса"""
+        return self._stats_prefix + (query_name or ' '.join(query.split())[:60])
     
-    async def execute(self, query, *params):
+    async def execute(self, query, *params, query_name=None):
         """Выполнение запроса"""
+        name = self._stats_name(query_name, query)
         await self.init_pool()
         async with self._pool.acquire() as conn:
-            return await conn.execute(query, *params)
+            with query_stats.measure(name) as result:
+                status = await conn.execute(query, *params)
+                result['rows'] = _status_rows(status)
+            return status
     
-    async def fetchone(self, query, *params):
+    async def fetchone(self, query, *params, query_name=None):
         """Получение одной записи"""
+        name = self._stats_name(query_name, query)
         await self.init_pool()
         async with self._pool.acquire() as conn:
-            return await conn.fetchrow(query, *params)
+            with query_stats.measure(name) as result:
+                row = await conn.fetchrow(query, *params)
+                result['rows'] = 0 if row is None else 1
+            return row
     
-    async def fetchall(self, query, *params):
+    async def fetchall(self, query, *params, query_name=None):
         """Получение всех записей"""
+        name = self._stats_name(query_name, query)
         await self.init_pool()
         async with self._pool.acquire() as conn:
-            return await conn.fetch(query, *params)
+            with query_stats.measure(name) as result:
+                rows = await conn.fetch(query, *params)
+                result['rows'] = len(rows)
+            return rows
     
-    async def fetchval(self, query, *params):
+    async def fetchval(self, query, *params, query_name=None):
         """Получение одного значения"""
+        name = self._stats_name(query_name, query)
         await self.init_pool()
         async with self._pool.acquire() as conn:
-            return await conn.fetchval(query, *params)
+            with query_stats.measure(name) as result:
+                value = await conn.fetchval(query, *params)
+                result['rows'] = 0 if value is None else 1
+            return value
+    
+    async def _run_prepared(self, name, method, *params):
+        """Выполнить запрос из реестра PREPARED_STATEMENTS
+        
+        Оператор берется из кэша соединения (подготовлен в init пула), поэтому
+        разбор и описание запроса на сервере не повторяются.
+        """
+        await self.init_pool()
+        async with self._pool.acquire() as conn:
+            with query_stats.measure(self._stats_prefix + name) as result:
+                value = await getattr(conn, method)(PREPARED_STATEMENTS[name], *params)
+                if method == 'fetch':
+                    result['rows'] = len(value)
+                else:
+                    result['rows'] = 0 if value is None else 1
+            return value
+    
+    async def fetchone_prepared(self, name, *params):
+        """Получение одной записи запросом из реестра"""
+        return await self._run_prepared(name, 'fetchrow', *params)
+    
+    async def fetchall_prepared(self, name, *params):
+        """Получение всех записей запросом из реестра"""
+        return await self._run_prepared(name, 'fetch', *params)
+    
+    async def fetchval_prepared(self, name, *params):
+        """Получение одного значения запросом из реестра"""
+        return await self._run_prepared(name, 'fetchval', *params)
+    
+    @asynccontextmanager
+    async def transaction(self):
+        """Соединение с открытой транзакцией (откат при исключении)"""
+        await self.init_pool()
+        async with self._pool.acquire() as conn:
+            async with conn.transaction():
+                yield conn
     
     # Методы для работы с пользователями
     async def add_user(self, user_id, username=None, first_name=None, language_code='ru'):
         """Добавление пользователя"""
+        # Вернувшийся пользователь снова получает рассылки
         query = """INSERT INTO users (user_id, username, first_name, language_code) 
-                   VALUES ($1, $2, $3, $4) ON CONFLICT (user_id) DO NOTHING"""
-        await self.execute(query, user_id, username, first_name, language_code)
+                   VALUES ($1, $2, $3, $4)
+                   ON CONFLICT (user_id) DO UPDATE SET is_active = TRUE WHERE users.is_active = FALSE"""
+        await self.execute(query, user_id, username, first_name, language_code, query_name='add_user')
     
     async def update_user_contact(self, user_id, phone, address):
         """Обновление контактных данных пользователя"""
         query = "UPDATE users SET phone = $1, address = $2 WHERE user_id = $3"
-        await self.execute(query, phone, address, user_id)
+        await self.execute(query, phone, address, user_id, query_name='update_user_contact')
     
     async def update_user_language(self, user_id, language_code):
         """Обновление языка пользователя"""
         query = "UPDATE users SET language_code = $1 WHERE user_id = $2"
-        await self.execute(query, language_code, user_id)
+        await self.execute(query, language_code, user_id, query_name='update_user_language')
+        # Сквозная запись в кэш языков
+        from i18n import i18n
+        i18n.set_language(language_code, user_id)
+    
+    async def get_user_language(self, user_id) -> Optional[str]:
+        """Сохраненный язык пользователя (None, если не выбран)"""
+        return await self.fetchval_prepared('get_user_language', user_id)
     
     async def get_user(self, user_id) -> Optional[User]:
         """Получение информации о пользователе"""
-        query = "SELECT user_id, username, first_name, phone, address, language_code, created_at FROM users WHERE user_id = $1"
-        row = await self.fetchone(query, user_id)
+        row = await self.fetchone_prepared('get_user', user_id)
         return User(*row) if row else None
     
+    # Кэш каталога (см. catalog_cache.py)
+    async def _get_catalog(self):
+        """Справочные данные каталога из кэша или из БД"""
+        catalog = catalog_cache.get_catalog()
+        if catalog is None:
+            version = catalog_cache.version
+            category_rows = await self.fetchall("SELECT * FROM categories ORDER BY id", query_name='get_catalog_categories')
+            flavor_rows = await self.fetchall("SELECT * FROM flavor_categories ORDER BY name", query_name='get_catalog_flavor_categories')
+            product_rows = await self.fetchall("""
+            SELECT id, name, price, description, photo, category_id, in_stock, created_at,
+                   stock_quantity, flavor_category_id
+            FROM products ORDER BY id
+            """, query_name='get_catalog_products')
+            catalog = build_snapshot(
+                category_rows,
+                [FlavorCategory(
+                    id=row['id'],
+                    name=row['name'],
+                    emoji=row['emoji'],
+                    description=row['description'],
+                    created_at=row['created_at'],
+                    updated_at=row['updated_at']
+                ) for row in flavor_rows],
+                [Product(*row) for row in product_rows]
+            )
+            catalog_cache.store_catalog(version, catalog)
+        return catalog
+    
+    async def _get_availability(self):
+        """Снимок наличия товаров: id -> (in_stock, stock_quantity, доступно с учетом резервов)"""
+        availability = catalog_cache.get_availability()
+        if availability is None:
+            version = catalog_cache.availability_version
+            rows = await self.fetchall("""
+            SELECT id, in_stock, stock_quantity, GREATEST(0, stock_quantity - reserved_quantity)
+            FROM products
+            """, query_name='get_availability')
+            availability = {row[0]: (row[1], row[2], row[3]) for row in rows}
+            catalog_cache.store_availability(version, availability)
+        return availability
+    
+    async def _get_catalog_products(self, product_ids):
+        """Товары каталога в наличии; stock_quantity - доступное количество с учетом резервов"""
+        catalog = await self._get_catalog()
+        availability = await self._get_availability()
+        products = []
+        for product_id in product_ids:
+            in_stock, _, available_quantity = availability.get(product_id, (False, 0, 0))
+            # Фильтруем товары с доступным количеством > 0
+            if in_stock and available_quantity > 0:
+                products.append(catalog.products[product_id]._replace(
+                    in_stock=in_stock,
+                    stock_quantity=available_quantity
+                ))
+        return products
+    
     # Методы для работы с категориями
     async def add_category(self, name, emoji=None, description=None):
         """Добавление категории"""
         query = """INSERT INTO categories (name, emoji, description) 
                    VALUES ($1, $2, $3) ON CONFLICT (name) DO NOTHING"""
-        await self.execute(query, name, emoji, description)
+        await self.execute(query, name, emoji, description, query_name='add_category')
+        catalog_cache.invalidate()
     
     async def get_categories(self):
         """Получение всех категорий"""
         query = "SELECT * FROM categories ORDER BY id"
-        return await self.fetchall(query)
+        return await self.fetchall(query, query_name='get_categories')
     
     async def get_categories_with_products(self):
-        """Получение только категорий, в которых есть товары в наличии"""
-        query = """SELECT DISTINCT c.* FROM categories c 
-                   INNER JOIN products p ON c.id = p.category_id 
-                   WHERE p.in_stock = true AND p.stock_quantity > 0
-                   ORDER BY c.id"""
-        return await self.fetchall(query)
+        """Получение только категорий, в которых есть товары в наличии (из кэша каталога)"""
+        catalog = await self._get_catalog()
+        availability = await self._get_availability()
+        categories = []
+        for category_id, row in catalog.categories.items():
+            for product_id in catalog.products_by_category.get(category_id, ()):
+                in_stock, stock_quantity, _ = availability.get(product_id, (False, 0, 0))
+                if in_stock and stock_quantity > 0:
+                    categories.append(row)
+                    break
+        return categories
     
     async def get_category(self, category_id):
-        """Получение категории по ID"""
-        query = "SELECT * FROM categories WHERE id = $1"
-        row = await self.fetchone(query, category_id)
+        """Получение категории по ID (из кэша каталога)"""
+        catalog = await self._get_catalog()
+        row = catalog.categories.get(category_id)
         if row:
             return Category(
                 id=row['id'],
@@ -118,7 +341,13 @@ class Database:
         """Добавление товара"""
         query = """INSERT INTO products (name, price, description, photo, category_id, stock_quantity, flavor_category_id) 
                    VALUES ($1, $2, $3, $4, $5, $6, $7)"""
-        await self.execute(query, name, price, description, photo, category_id, stock_quantity, flavor_category_id)
+        await self.execute(query, name, price, description, photo, category_id, stock_quantity, flavor_category_id, query_name='add_product')
+        catalog_cache.invalidate()
+    
+    async def delete_product(self, product_id):
+        """Удаление товара"""
+        await self.execute("DELETE FROM products WHERE id = $1", product_id, query_name='delete_product')
+        catalog_cache.invalidate()
     
     async def get_products(self, category_id=None):
         """Получение списка товаров"""
@@ -128,76 +357,24 @@ class Database:
                        LEFT JOIN categories c ON p.category_id = c.id 
                        WHERE p.category_id = $1 AND p.in_stock = true 
                        ORDER BY p.id"""
-            return await self.fetchall(query, category_id)
+            return await self.fetchall(query, category_id, query_name='get_products_in_category')
         else:
             query = """SELECT p.*, c.name as category_name, c.emoji as category_emoji 
                        FROM products p 
                        LEFT JOIN categories c ON p.category_id = c.id 
                        WHERE p.in_stock = true 
                        ORDER BY p.id"""
-            return await self.fetchall(query)
+            return await self.fetchall(query, query_name='get_products')
     
     async def get_products_by_category(self, category_id):
-        """Получение товаров по категории с учетом резервов (оптимизированная версия)"""
-        await self.cleanup_if_needed()  # Кэшированная очистка
-        
-        # Получаем все товары категории сразу с расчетом доступного количества
-        query = """
-        SELECT 
-            p.*,
-            GREATEST(0, 
-                p.stock_quantity - 
-                COALESCE(cart_reserved.quantity, 0) - 
-                COALESCE(order_reserved.quantity, 0)
-            ) as available_quantity
-        FROM products p
-        LEFT JOIN (
-            SELECT 
-                product_id, 
-                SUM(quantity) as quantity
-            FROM cart
-            WHERE reserved_until > CURRENT_TIMESTAMP
-            GROUP BY product_id
-        ) cart_reserved ON p.id = cart_reserved.product_id
-        LEFT JOIN (
-            SELECT 
-                CAST(product_key AS INTEGER) as product_id,
-                SUM((reserved_products->>product_key)::integer) as quantity
-            FROM order_reservations ord_res
-            JOIN orders o ON ord_res.order_id = o.id
-            CROSS JOIN LATERAL jsonb_object_keys(reserved_products) as product_key
-            WHERE ord_res.reserved_until > CURRENT_TIMESTAMP 
-            AND o.status = 'waiting_payment'
-            GROUP BY product_key
-        ) order_reserved ON p.id = order_reserved.product_id
-        WHERE p.category_id = $1 AND p.in_stock = true
-        ORDER BY p.id
-        """
-        rows = await self.fetchall(query, category_id)
-        
-        products = []
-        for row in rows:
-            available_quantity = row['available_quantity']
-            # Фильтруем товары с доступным количеством > 0
-            if available_quantity > 0:
-                products.append(Product(
-                    id=row['id'],
-                    name=row['name'],
-                    price=row['price'],
-                    description=row['description'],
-                    photo=row['photo'],
-                    category_id=row['category_id'],
-                    in_stock=row['in_stock'],
-                    created_at=row['created_at'],
-                    stock_quantity=available_quantity,
-                    flavor_category_id=row.get('flavor_category_id')
-                ))
-        return products
+        """Получение товаров по категории с учетом резервов (из кэша каталога)"""
+        catalog = await self._get_catalog()
+        return await self._get_catalog_products(catalog.products_by_category.get(category_id, ()))
     
     async def get_all_products(self):
         """Получение всех товаров (для админки)"""
         query = """SELECT * FROM products ORDER BY id"""
-        rows = await self.fetchall(query)
+        rows = await self.fetchall(query, query_name='get_all_products')
         return [
             Product(
                 id=row['id'],
@@ -214,9 +391,17 @@ class Database:
         ]
     
     async def get_product(self, product_id):
-        """Получение товара по ID"""
-        query = "SELECT * FROM products WHERE id = $1"
-        row = await self.fetchone(query, product_id)
+        """Получение товара по ID (из кэша каталога; наличие - из снимка наличия)"""
+        catalog = await self._get_catalog()
+        product = catalog.products.get(product_id)
+        if product:
+            availability = await self._get_availability()
+            if product_id in availability:
+                in_stock, stock_quantity, _ = availability[product_id]
+                return product._replace(in_stock=in_stock, stock_quantity=stock_quantity)
+        
+        # Товара еще нет в кэше (например, добавлен другим процессом)
+        row = await self.fetchone_prepared('get_product', product_id)
         if row:
             return Product(
                 id=row['id'],
@@ -234,32 +419,15 @@ class Database:
     
     async def get_product_with_availability(self, product_id):
         """Получение товара с вычисленным доступным количеством (оптимизированная версия)"""
-        await self.cleanup_if_needed()  # Кэшированная очистка
-        
-        # Упрощенный запрос с скалярными подзапросами для одного товара
+        # Доступное количество берется из учета резервов (products.reserved_quantity)
         query = """
-        SELECT 
+        SELECT
             p.*,
-            GREATEST(0, 
-                p.stock_quantity - 
-                COALESCE((
-                    SELECT SUM(quantity) 
-                    FROM cart 
-                    WHERE product_id = $1 AND reserved_until > CURRENT_TIMESTAMP
-                ), 0) - 
-                COALESCE((
-                    SELECT SUM((reserved_products->>$2)::integer)
-                    FROM order_reservations ord_res
-                    JOIN orders o ON ord_res.order_id = o.id
-                    WHERE ord_res.reserved_until > CURRENT_TIMESTAMP 
-                    AND o.status = 'waiting_payment'
-                    AND reserved_products ? $2
-                ), 0)
-            ) as available_quantity
+            GREATEST(0, p.stock_quantity - p.reserved_quantity) as available_quantity
         FROM products p
         WHERE p.id = $1
         """
-        row = await self.fetchone(query, product_id, str(product_id))
+        row = await self.fetchone(query, product_id, query_name='get_product_with_availability')
         if row:
             return Product(
                 id=row['id'],
@@ -278,7 +446,13 @@ class Database:
     async def update_product_stock(self, product_id, in_stock):
         """Обновление наличия товара"""
         query = "UPDATE products SET in_stock = $1 WHERE id = $2"
-        await self.execute(query, in_stock, product_id)
+        await self.execute(query, in_stock, product_id, query_name='update_product_stock')
+        catalog_cache.invalidate_availability()
+    
+    async def update_product_quantity(self, product_id, quantity):
+        """Установка количества товара на складе (из админки)"""
+        await self.execute("UPDATE products SET stock_quantity = $1 WHERE id = $2", quantity, product_id, query_name='update_product_quantity')
+        catalog_cache.invalidate_availability()
     
     async def decrease_product_quantity(self, product_id, quantity):
         """Уменьшение количества товара на складе"""
@@ -288,7 +462,8 @@ class Database:
             in_stock = CASE WHEN stock_quantity - $1 <= 0 THEN false ELSE in_stock END
         WHERE id = $2 AND stock_quantity >= $1
         """
-        await self.execute(query, quantity, product_id)
+        await self.execute(query, quantity, product_id, query_name='decrease_product_quantity')
+        catalog_cache.invalidate_availability()
     
     async def increase_product_quantity(self, product_id, quantity):
         """Увеличение количества товара на складе (при отмене заказа)"""
@@ -298,48 +473,81 @@ class Database:
             in_stock = true
         WHERE id = $2
         """
-        await self.execute(query, quantity, product_id)
+        await self.execute(query, quantity, product_id, query_name='increase_product_quantity')
+        catalog_cache.invalidate_availability()
+    
+    async def decrease_products_quantity(self, items, conn=None):
+        """Списание нескольких товаров со склада одним запросом
+        
+        items: [(product_id, quantity), ...]; повторяющиеся товары суммируются.
+        Товар, которого на складе меньше, чем нужно, не списывается (как в decrease_product_quantity).
+        conn: соединение открытой транзакции, если списание должно быть ее частью
+        """
+        query = """
+        UPDATE products p
+        SET stock_quantity = p.stock_quantity - i.quantity,
+            in_stock = CASE WHEN p.stock_quantity - i.quantity <= 0 THEN false ELSE p.in_stock END
+        FROM (
+            SELECT product_id, SUM(quantity) AS quantity
+            FROM unnest($1::integer[], $2::integer[]) AS t(product_id, quantity)
+            GROUP BY product_id
+        ) i
+        WHERE p.id = i.product_id AND p.stock_quantity >= i.quantity
+        """
+        await self._execute_items('decrease_products_quantity', query, items, conn)
+    
+    async def increase_products_quantity(self, items, conn=None):
+        """Возврат нескольких товаров на склад одним запросом (при отмене заказа)
+        
+        items: [(product_id, quantity), ...]; conn - как в decrease_products_quantity
+        """
+        query = """
+        UPDATE products p
+        SET stock_quantity = p.stock_quantity + i.quantity,
+            in_stock = true
+        FROM (
+            SELECT product_id, SUM(quantity) AS quantity
+            FROM unnest($1::integer[], $2::integer[]) AS t(product_id, quantity)
+            GROUP BY product_id
+        ) i
+        WHERE p.id = i.product_id
+        """
+        await self._execute_items('increase_products_quantity', query, items, conn)
+    
+    async def _execute_items(self, query_name, query, items, conn=None):
+        """Выполнить запрос над массивами (product_id[], quantity[])"""
+        items = list(items)
+        if not items:
+            return
+        product_ids = [int(product_id) for product_id, _ in items]
+        quantities = [int(quantity) for _, quantity in items]
+        if conn is not None:
+            await conn.execute(query, product_ids, quantities)
+        else:
+            await self.execute(query, product_ids, quantities, query_name=query_name)
+        catalog_cache.invalidate_availability()
     
     # Методы для работы с категориями вкусов
     async def get_flavor_categories(self, only_with_products=False) -> List[FlavorCategory]:
-        """Получение всех категорий вкусов"""
-        if only_with_products:
-            # Показывать только категории с товарами в наличии
-            query = """
-            SELECT DISTINCT fc.* 
-            FROM flavor_categories fc 
-            INNER JOIN products p ON fc.id = p.flavor_category_id 
-            WHERE p.in_stock = true 
-            ORDER BY fc.name
-            """
-        else:
-            query = "SELECT * FROM flavor_categories ORDER BY name"
-            
-        rows = await self.fetchall(query)
+        """Получение всех категорий вкусов (из кэша каталога)"""
+        catalog = await self._get_catalog()
+        if not only_with_products:
+            return list(catalog.flavor_categories)
+        
+        # Показывать только категории с товарами в наличии
+        availability = await self._get_availability()
         return [
-            FlavorCategory(
-                id=row['id'],
-                name=row['name'],
-                emoji=row['emoji'],
-                description=row['description'],
-                created_at=row['created_at'],
-                updated_at=row['updated_at']
-            ) for row in rows
+            flavor for flavor in catalog.flavor_categories
+            if any(availability.get(product_id, (False,))[0]
+                   for product_id in catalog.products_by_flavor.get(flavor.id, ()))
         ]
     
     async def get_flavor_category(self, category_id: int) -> Optional[FlavorCategory]:
-        """Получение категории вкуса по ID"""
-        query = "SELECT * FROM flavor_categories WHERE id = $1"
-        row = await self.fetchone(query, category_id)
-        if row:
-            return FlavorCategory(
-                id=row['id'],
-                name=row['name'],
-                emoji=row['emoji'],
-                description=row['description'],
-                created_at=row['created_at'],
-                updated_at=row['updated_at']
-            )
+        """Получение категории вкуса по ID (из кэша каталога)"""
+        catalog = await self._get_catalog()
+        for flavor in catalog.flavor_categories:
+            if flavor.id == category_id:
+                return flavor
         return None
     
     async def add_flavor_category(self, name: str, emoji: str = '', description: str = '') -> int:
@@ -349,7 +557,9 @@ class Database:
         VALUES ($1, $2, $3) 
         RETURNING id
         """
-        return await self.fetchval(query, name, emoji, description)
+        category_id = await self.fetchval(query, name, emoji, description, query_name='add_flavor_category')
+        catalog_cache.invalidate()
+        return category_id
     
     async def update_flavor_category(self, category_id: int, name: str, emoji: str = '', description: str = ''):
         """Обновление категории вкуса"""
@@ -358,83 +568,31 @@ class Database:
         SET name = $1, emoji = $2, description = $3, updated_at = CURRENT_TIMESTAMP 
         WHERE id = $4
         """
-        await self.execute(query, name, emoji, description, category_id)
+        await self.execute(query, name, emoji, description, category_id, query_name='update_flavor_category')
+        catalog_cache.invalidate()
     
     async def delete_flavor_category(self, category_id: int):
         """Удаление категории вкуса"""
         # Сначала убираем связи у всех товаров
-        await self.execute("UPDATE products SET flavor_category_id = NULL WHERE flavor_category_id = $1", category_id)
+        await self.execute("UPDATE products SET flavor_category_id = NULL WHERE flavor_category_id = $1", category_id, query_name='unlink_flavor_category_products')
         # Затем удаляем категорию
-        await self.execute("DELETE FROM flavor_categories WHERE id = $1", category_id)
+        await self.execute("DELETE FROM flavor_categories WHERE id = $1", category_id, query_name='delete_flavor_category')
+        catalog_cache.invalidate()
     
     async def get_products_by_flavor(self, flavor_category_id: int) -> List[Product]:
-        """Получение всех товаров определенного вкуса с учетом резервов (оптимизированная версия)"""
-        await self.cleanup_if_needed()  # Кэшированная очистка
-        
-        # Получаем все товары вкуса сразу с расчетом доступного количества
-        query = """
-        SELECT 
-            p.*,
-            GREATEST(0, 
-                p.stock_quantity - 
-                COALESCE(cart_reserved.quantity, 0) - 
-                COALESCE(order_reserved.quantity, 0)
-            ) as available_quantity
-        FROM products p
-        LEFT JOIN (
-            SELECT 
-                product_id, 
-                SUM(quantity) as quantity
-            FROM cart
-            WHERE reserved_until > CURRENT_TIMESTAMP
-            GROUP BY product_id
-        ) cart_reserved ON p.id = cart_reserved.product_id
-        LEFT JOIN (
-            SELECT 
-                CAST(product_key AS INTEGER) as product_id,
-                SUM((reserved_products->>product_key)::integer) as quantity
-            FROM order_reservations ord_res
-            JOIN orders o ON ord_res.order_id = o.id
-            CROSS JOIN LATERAL jsonb_object_keys(reserved_products) as product_key
-            WHERE ord_res.reserved_until > CURRENT_TIMESTAMP 
-            AND o.status = 'waiting_payment'
-            GROUP BY product_key
-        ) order_reserved ON p.id = order_reserved.product_id
-        WHERE p.flavor_category_id = $1 AND p.in_stock = true
-        ORDER BY p.name
-        """
-        rows = await self.fetchall(query, flavor_category_id)
-        
-        products = []
-        for row in rows:
-            available_quantity = row['available_quantity']
-            # Фильтруем товары с доступным количеством > 0
-            if available_quantity > 0:
-                products.append(Product(
-                    id=row['id'],
-                    name=row['name'],
-                    price=row['price'],
-                    description=row['description'],
-                    photo=row['photo'],
-                    category_id=row['category_id'],
-                    in_stock=row['in_stock'],
-                    created_at=row['created_at'],
-                    stock_quantity=available_quantity,
-                    flavor_category_id=row.get('flavor_category_id')
-                ))
-        return products
+        """Получение всех товаров определенного вкуса с учетом резервов (из кэша каталога)"""
+        catalog = await self._get_catalog()
+        return await self._get_catalog_products(catalog.products_by_flavor.get(flavor_category_id, ()))
     
     async def update_product_flavor(self, product_id: int, flavor_category_id: Optional[int]):
         """Обновление категории вкуса у товара"""
         query = "UPDATE products SET flavor_category_id = $1 WHERE id = $2"
-        await self.execute(query, flavor_category_id, product_id)
+        await self.execute(query, flavor_category_id, product_id, query_name='update_product_flavor')
+        catalog_cache.invalidate()
     
     # Методы для работы с корзиной
     async def add_to_cart(self, user_id, product_id, quantity=1):
         """Добавление товара в корзину с резервированием"""
-        # Сначала очищаем просроченные резервы
-        await self.cleanup_expired_reservations()
-        
         # Проверяем доступное количество товара
         available = await self.get_available_product_quantity(product_id)
         if available < quantity:
@@ -444,42 +602,47 @@ class Database:
         query = """INSERT INTO cart (user_id, product_id, quantity, reserved_until) 
                    VALUES ($1, $2, $3, CURRENT_TIMESTAMP + INTERVAL '15 minutes') 
                    ON CONFLICT (user_id, product_id) 
-                   DO UPDATE SET quantity = $3, reserved_until = CURRENT_TIMESTAMP + INTERVAL '15 minutes'"""
-        await self.execute(query, user_id, product_id, quantity)
+                   DO UPDATE SET quantity = $3, reserved_until = CURRENT_TIMESTAMP + INTERVAL '15 minutes'
+                   RETURNING EXTRACT(EPOCH FROM (reserved_until - CURRENT_TIMESTAMP))"""
+        seconds_left = await self.fetchval(query, user_id, product_id, quantity, query_name='add_to_cart')
+        catalog_cache.invalidate_availability()
+        
+        from reservation_scheduler import reservation_scheduler
+        reservation_scheduler.schedule_cart_expiry(seconds_left)
         return True
     
     async def get_cart(self, user_id) -> List[CartItem]:
         """Получение корзины пользователя (только активные резервы)"""
-        # Сначала очищаем просроченные резервы
-        await self.cleanup_expired_reservations()
-        
-        query = """
-        SELECT c.product_id, c.quantity, p.name, p.price, p.photo, c.reserved_until
-        FROM cart c 
-        JOIN products p ON c.product_id = p.id 
-        WHERE c.user_id = $1 AND p.in_stock = true AND c.reserved_until > CURRENT_TIMESTAMP
-        """
-        rows = await self.fetchall(query, user_id)
+        rows = await self.fetchall_prepared('get_cart', user_id)
         return [CartItem(*row) for row in rows]
     
     async def get_product_quantity_in_cart(self, user_id, product_id) -> int:
         """Быстрое получение количества конкретного товара в корзине пользователя"""
-        query = """SELECT COALESCE(quantity, 0) 
-                   FROM cart 
-                   WHERE user_id = $1 AND product_id = $2 AND reserved_until > CURRENT_TIMESTAMP"""
-        
-        row = await self.fetchone(query, user_id, product_id)
-        return row[0] if row else 0
+        quantity = await self.fetchval_prepared('get_product_quantity_in_cart', user_id, product_id)
+        return quantity or 0
     
     async def remove_from_cart(self, user_id, product_id):
         """Удаление товара из корзины"""
         query = "DELETE FROM cart WHERE user_id = $1 AND product_id = $2"
-        await self.execute(query, user_id, product_id)
+        await self.execute(query, user_id, product_id, query_name='remove_from_cart')
+        catalog_cache.invalidate_availability()
     
     async def clear_cart(self, user_id):
-        """Очистка корзины"""
-        query = "DELETE FROM cart WHERE user_id = $1"
-        await self.execute(query, user_id)
+        """Очистка корзины
+        
+        Товары корзины сначала блокируются в порядке id, как в create_order:
+        триггер учета резервов обновляет их при удалении строк корзины.
+        """
+        async with self.transaction() as conn:
+            locked = await conn.fetch("""
+            SELECT id FROM products
+            WHERE id IN (SELECT product_id FROM cart WHERE user_id = $1)
+            ORDER BY id
+            FOR UPDATE
+            """, user_id)
+            await conn.execute("DELETE FROM cart WHERE user_id = $1 AND product_id = ANY($2::integer[])",
+                               user_id, [row['id'] for row in locked])
+        catalog_cache.invalidate_availability()
     
     async def update_cart_quantity(self, user_id, product_id, quantity):
         """Обновление количества товара в корзине с проверкой наличия"""
@@ -503,7 +666,8 @@ class Database:
             
             query = """UPDATE cart SET quantity = $1, reserved_until = CURRENT_TIMESTAMP + INTERVAL '15 minutes' 
                        WHERE user_id = $2 AND product_id = $3"""
-            await self.execute(query, quantity, user_id, product_id)
+            await self.execute(query, quantity, user_id, product_id, query_name='update_cart_quantity')
+            catalog_cache.invalidate_availability()
             return True
     
     async def update_cart_quantity_fast(self, user_id, product_id, quantity):
@@ -513,53 +677,78 @@ class Database:
         else:
             query = """UPDATE cart SET quantity = $1, reserved_until = CURRENT_TIMESTAMP + INTERVAL '15 minutes' 
                        WHERE user_id = $2 AND product_id = $3"""
-            await self.execute(query, quantity, user_id, product_id)
+            await self.execute(query, quantity, user_id, product_id, query_name='update_cart_quantity_fast')
+            catalog_cache.invalidate_availability()
         return True
     
     # Методы для работы с заказами
     async def create_order(self, user_id, products, total_price, delivery_zone, delivery_price, phone, address, latitude=None, longitude=None):
-        """Создание заказа с резервированием товаров"""
-        import random
-        
-        # Проверяем наличие всех товаров перед созданием заказа
-        for product in products:
-            available = await self.get_available_product_quantity(product['id'])
-            if available < product['quantity']:
-                logger.error(f"Недостаточно товара {product['id']} для заказа. Доступно: {available}, требуется: {product['quantity']}")
-                return None
-        
-        # Генерируем уникальный номер заказа (5-6 цифр)
-        while True:
-            order_number = random.randint(10000, 999999)
-            # Проверяем что такого номера еще нет
-            existing = await self.fetchone("SELECT id FROM orders WHERE order_number = $1", order_number)
-            if not existing:
-                break
+        """Создание заказа с резервированием товаров
         
-        query = """
-        INSERT INTO orders (order_number, user_id, products, total_price, delivery_zone, delivery_price, phone, address, latitude, longitude) 
-        VALUES ($1, $2, $3, $4, $5, $6, $7, $8, $9, $10) RETURNING id, order_number
+        Одна транзакция: строки товаров блокируются (FOR UPDATE), наличие проверяется
+        с учетом собственной корзины пользователя, после чего заказ, его позиции и
+        резерв создаются одним запросом, а резерв корзины по этим товарам снимается.
+        Номер заказа берется из последовательности order_number_seq.
         """
-        # Преобразуем цены в float для корректной сериализации
-        total_price_float = float(total_price)
-        delivery_price_float = float(delivery_price)
-        
-        result = await self.fetchone(query, order_number, user_id, json.dumps(products), total_price_float, 
-                                   delivery_zone, delivery_price_float, phone, address, latitude, longitude)
+        product_ids = [product['id'] for product in products]
+        quantities = [product['quantity'] for product in products]
+        names = [product.get('name') for product in products]
+        prices = [float(product.get('price', 0)) for product in products]
         
-        if not result:
-            return None
+        lock_query = """
+        SELECT p.id, p.stock_quantity - p.reserved_quantity + COALESCE(c.quantity, 0) as available
+        FROM products p
+        LEFT JOIN cart c ON c.product_id = p.id AND c.user_id = $2
+        WHERE p.id = ANY($1::integer[]) AND p.in_stock = true
+        ORDER BY p.id
+        FOR UPDATE OF p
+        """
         
-        order_id = result['id']
+        insert_query = """
+        WITH new_order AS (
+            INSERT INTO orders (user_id, products, total_price, delivery_zone, delivery_price, phone, address, latitude, longitude) 
+            VALUES ($1, $2, $3, $4, $5, $6, $7, $8, $9)
+            RETURNING id, order_number
+        ), items AS (
+            INSERT INTO order_items (order_id, product_id, product_name, price, quantity)
+            SELECT new_order.id, r.product_id, r.name, r.price, r.quantity
+            FROM new_order, unnest($10::integer[], $11::integer[], $12::text[], $13::numeric[]) AS r(product_id, quantity, name, price)
+        ), reservation AS (
+            INSERT INTO order_reservations (order_id)
+            SELECT id FROM new_order
+            RETURNING order_id, EXTRACT(EPOCH FROM (reserved_until - CURRENT_TIMESTAMP)) as seconds_left
+        ), reserved_items AS (
+            INSERT INTO reservation_items (order_id, product_id, quantity)
+            SELECT reservation.order_id, r.product_id, r.quantity
+            FROM reservation, unnest($10::integer[], $11::integer[]) AS r(product_id, quantity)
+        ), released_cart AS (
+            DELETE FROM cart WHERE user_id = $1 AND product_id = ANY($10::integer[])
+        )
+        SELECT new_order.id, new_order.order_number, reservation.seconds_left
+        FROM new_order, reservation
+        """
         
-        # Создаем резервирование товаров на 5 минут
-        products_reservation = {}
-        for product in products:
-            products_reservation[str(product['id'])] = product['quantity']
+        async with self.transaction() as conn:
+            # Проверяем наличие всех товаров под блокировкой строк
+            rows = await conn.fetch(lock_query, product_ids, user_id)
+            available_by_id = {row['id']: row['available'] for row in rows}
+            for product in products:
+                available = max(0, available_by_id.get(product['id'], 0))
+                if available < product['quantity']:
+                    logger.error(f"Недостаточно товара {product['id']} для заказа. Доступно: {available}, требуется: {product['quantity']}")
+                    return None
+            
+            # Преобразуем цены в float для корректной сериализации
+            result = await conn.fetchrow(insert_query, user_id, json.dumps(products), float(total_price),
+                                         delivery_zone, float(delivery_price), phone, address, latitude, longitude,
+                                         product_ids, quantities, names, prices)
+        catalog_cache.invalidate_availability()
+        order_counts_cache.invalidate()
         
-        await self.create_order_reservation(order_id, products_reservation)
+        from reservation_scheduler import reservation_scheduler
+        reservation_scheduler.schedule_order_expiry(result['id'], result['seconds_left'])
         
-        logger.info(f"Заказ #{order_number} создан с резервированием товаров на 5 минут")
+        logger.info(f"Заказ #{result['order_number']} создан с резервированием товаров на 5 минут")
         
         # Товары НЕ списываются при создании заказа
         # Списание происходит только при подтверждении платежа админом
@@ -568,18 +757,23 @@ class Database:
     
     async def get_order(self, order_id) -> Optional[Order]:
         """Получение заказа по ID"""
-        query = "SELECT id, order_number, user_id, products, total_price, delivery_zone, delivery_price, phone, address, status, payment_screenshot, created_at, latitude, longitude FROM orders WHERE id = $1"
-        row = await self.fetchone(query, order_id)
+        row = await self.fetchone_prepared('get_order', order_id)
         return Order(*row) if row else None
     
     async def get_order_by_number(self, order_number) -> Optional[Order]:
         """Получение заказа по номеру заказа"""
-        query = "SELECT id, order_number, user_id, products, total_price, delivery_zone, delivery_price, phone, address, status, payment_screenshot, created_at, latitude, longitude FROM orders WHERE order_number = $1"
-        row = await self.fetchone(query, order_number)
+        row = await self.fetchone_prepared('get_order_by_number', order_number)
         return Order(*row) if row else None
     
-    async def get_user_orders(self, user_id, status_filter=None, search_query=None, limit=50):
-        """Получение заказов пользователя с фильтрацией и поиском"""
+    @staticmethod
+    def _like_pattern(text: str) -> str:
+        """Шаблон ILIKE '%text%' с экранированием спецсимволов"""
+        escaped = text.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_')
+        return f'%{escaped}%'
+    
+    @classmethod
+    def _user_orders_conditions(cls, user_id, status_filter=None, search_query=None):
+        """Условия WHERE и параметры для заказов пользователя с фильтром и поиском"""
         conditions = ["user_id = $1"]
         params = [user_id]
         param_count = 1
@@ -605,10 +799,16 @@ class Database:
                 conditions.append(f"order_number = ${param_count}")
                 params.append(order_number)
             except ValueError:
-                # Если не число, ищем в товарах
+                # Если не число, ищем по названиям товаров (триграммный индекс order_items)
                 param_count += 1
-                conditions.append(f"products ILIKE ${param_count}")
-                params.append(f'%{search_query}%')
+                conditions.append(f"id IN (SELECT order_id FROM order_items WHERE product_name ILIKE ${param_count})")
+                params.append(cls._like_pattern(search_query))
+        
+        return conditions, params
+    
+    async def get_user_orders(self, user_id, status_filter=None, search_query=None, limit=50):
+        """Получение заказов пользователя с фильтрацией и поиском"""
+        conditions, params = self._user_orders_conditions(user_id, status_filter, search_query)
         
         where_clause = " AND ".join(conditions)
         query = f"""
@@ -617,17 +817,79 @@ class Database:
         FROM orders 
         WHERE {where_clause} 
         ORDER BY created_at DESC 
-        LIMIT ${param_count + 1}
+        LIMIT ${len(params) + 1}
         """
         params.append(limit)
         
-        rows = await self.fetchall(query, *params)
+        rows = await self.fetchall(query, *params, query_name='get_user_orders')
+        return [Order(*row) for row in rows]
+    
+    async def get_user_orders_page(self, user_id, status_filter=None, search_query=None, page=1, per_page=5) -> dict:
+        """Страница заказов пользователя вместе со счетчиками по статусам одним запросом
+        
+        Возвращает {'orders': [...], 'reservation_minutes': {order_id: минут до
+        конца резерва}, 'stats': как get_user_orders_stats, 'matched': число
+        заказов под фильтром, 'page': номер страницы (не больше последней)}.
+        """
+        conditions, params = self._user_orders_conditions(user_id, status_filter, search_query)
+        where_clause = " AND ".join(conditions)
+        query = f"""
+        WITH stats AS (
+            SELECT COUNT(*) AS total,
+                   COUNT(*) FILTER (WHERE status IN ('waiting_payment', 'payment_check', 'paid', 'shipping')) AS active,
+                   COUNT(*) FILTER (WHERE status = 'delivered') AS completed,
+                   COUNT(*) FILTER (WHERE status = 'cancelled') AS cancelled,
+                   COUNT(*) FILTER (WHERE {where_clause}) AS matched
+            FROM orders
+            WHERE user_id = $1
+        ), page AS (
+            SELECT o.*, FLOOR(EXTRACT(EPOCH FROM (r.reserved_until - CURRENT_TIMESTAMP)) / 60)::int AS minutes_left
+            FROM (
+                SELECT {_ORDER_COLUMNS}
+                FROM orders
+                WHERE {where_clause}
+                ORDER BY created_at DESC, id DESC
+                LIMIT ${len(params) + 1} OFFSET ${len(params) + 2}
+            ) o
+            LEFT JOIN order_reservations r ON r.order_id = o.id AND r.reserved_until > CURRENT_TIMESTAMP
+        )
+        SELECT stats.*, page.* FROM stats LEFT JOIN page ON TRUE
+        ORDER BY page.created_at DESC, page.id DESC
+        """
+        page = max(page, 1)
+        rows = await self.fetchall(query, *params, per_page, (page - 1) * per_page, query_name='get_user_orders_page')
+        
+        matched = rows[0]['matched']
+        last_page = max((matched + per_page - 1) // per_page, 1)
+        if page > last_page:
+            # Страница исчезла (заказы отменили/удалили) - показываем последнюю
+            return await self.get_user_orders_page(user_id, status_filter, search_query, last_page, per_page)
+        
+        order_rows = [row for row in rows if row['id'] is not None]
+        return {
+            'orders': [Order(*(row[column] for column in _ORDER_FIELDS)) for row in order_rows],
+            'reservation_minutes': {row['id']: max(0, row['minutes_left']) for row in order_rows
+                                    if row['minutes_left'] is not None},
+            'stats': {key: rows[0][key] for key in ('active', 'completed', 'cancelled', 'total')},
+            'matched': matched,
+            'page': page,
+        }
+    
+    async def search_orders_by_item(self, query: str, limit: int = 10) -> List[Order]:
+        """Поиск заказов по названию товара в позициях (новые сначала)"""
+        rows = await self.fetchall(f"""
+        SELECT {_ORDER_COLUMNS}
+        FROM orders
+        WHERE id IN (SELECT order_id FROM order_items WHERE product_name ILIKE $1)
+        ORDER BY created_at DESC, id DESC
+        LIMIT $2
+        """, self._like_pattern(query), limit, query_name='search_orders_by_item')
         return [Order(*row) for row in rows]
     
     async def get_user_orders_count(self, user_id) -> int:
         """Получение количества заказов пользователя"""
         query = "SELECT COUNT(*) FROM orders WHERE user_id = $1"
-        row = await self.fetchone(query, user_id)
+        row = await self.fetchone(query, user_id, query_name='get_user_orders_count')
         return row[0] if row else 0
     
     async def get_user_orders_stats(self, user_id) -> dict:
@@ -641,7 +903,7 @@ class Database:
         FROM orders 
         WHERE user_id = $1
         """
-        row = await self.fetchone(query, user_id)
+        row = await self.fetchone(query, user_id, query_name='get_user_orders_stats')
         if row:
             return {
                 'active': row['active'],
@@ -651,46 +913,58 @@ class Database:
             }
         return {'active': 0, 'completed': 0, 'cancelled': 0, 'total': 0}
     
-    async def get_order_items(self, order_id):
+    async def get_order_items(self, order_id) -> List[OrderItem]:
         """Получение товаров заказа"""
-        # Пока что возвращаем пустой список, так как структура заказов хранится в JSON
-        # В будущем можно добавить отдельную таблицу order_items
-        return []
+        query = """SELECT order_id, product_id, product_name, price, quantity
+                   FROM order_items WHERE order_id = $1 ORDER BY id"""
+        rows = await self.fetchall(query, order_id, query_name='get_order_items')
+        return [OrderItem(*row) for row in rows]
     
     async def update_order_status(self, order_id, status):
-        """Обновление статуса заказа с обработкой резервирования и уведомлениями"""
+        """Обновление статуса заказа с обработкой резервирования и уведомлениями
+        
+        Смена статуса, движение товаров на складе и снятие резерва выполняются
+        в одной транзакции: заказ не может остаться частично списанным.
+        """
         old_order = await self.get_order(order_id)
         if not old_order:
             return
         
-        old_status = old_order.status
-        
-        # Обновляем статус
-        query = "UPDATE orders SET status = $1 WHERE id = $2"
-        await self.execute(query, status, order_id)
+        items = [(product['id'], product['quantity']) for product in old_order.products_data]
         
-        # Если заказ подтверждается (переходит в paid), списываем товары и убираем резерв
-        if status == 'paid' and old_order.status in ['waiting_payment', 'payment_check']:
-            products_data = old_order.products_data
-            for product in products_data:
-                await self.decrease_product_quantity(product['id'], product['quantity'])
+        async with self.transaction() as conn:
+            # Актуальный статус под блокировкой строки заказа
+            old_status = await conn.fetchval(
+                "SELECT status FROM orders WHERE id = $1 FOR UPDATE", order_id
+            )
+            if old_status is None:
+                return
             
-            # Убираем резервирование
-            await self.remove_order_reservation(order_id)
-            logger.info(f"Товары списаны и резерв снят для заказа #{old_order.order_number}")
-        
-        # Если заказ отменяется, убираем резерв
-        elif status == 'cancelled':
-            await self.remove_order_reservation(order_id)
-            logger.info(f"Резерв снят для отмененного заказа #{old_order.order_number}")
+            await conn.execute("UPDATE orders SET status = $1 WHERE id = $2", status, order_id)
+            
+            # Если заказ подтверждается (переходит в paid), списываем товары и убираем резерв
+            if status == 'paid' and old_status in ['waiting_payment', 'payment_check']:
+                await self.decrease_products_quantity(items, conn)
+                await conn.execute("DELETE FROM order_reservations WHERE order_id = $1", order_id)
+                logger.info(f"Товары списаны и резерв снят для заказа #{old_order.order_number}")
+            
+            # Если заказ отменяется, убираем резерв и возвращаем уже списанные товары
+            elif status == 'cancelled':
+                if old_status in ['paid', 'shipping', 'delivered']:
+                    await self.increase_products_quantity(items, conn)
+                    logger.info(f"Товары возвращены на склад для заказа #{old_order.order_number}")
+                await conn.execute("DELETE FROM order_reservations WHERE order_id = $1", order_id)
+                logger.info(f"Резерв снят для отмененного заказа #{old_order.order_number}")
+        # Смена статуса меняет учет резервов заказа (триггер order_status_ledger)
+        catalog_cache.invalidate_availability()
+        order_counts_cache.invalidate()
         
         # Если заказ возвращается в ожидание оплаты, продлеваем резерв
-        elif status == 'waiting_payment' and old_order.status != 'waiting_payment':
+        if status == 'waiting_payment' and old_status != 'waiting_payment':
             # Создаем новый резерв на 5 минут
-            products_data = old_order.products_data
             products_reservation = {}
-            for product in products_data:
-                products_reservation[str(product['id'])] = product['quantity']
+            for product_id, quantity in items:
+                products_reservation[str(product_id)] = products_reservation.get(str(product_id), 0) + quantity
             await self.create_order_reservation(order_id, products_reservation)
             logger.info(f"Создан новый резерв для заказа #{old_order.order_number}")
         
@@ -706,7 +980,7 @@ class Database:
     async def update_order_screenshot(self, order_id, screenshot):
         """Обновление скриншота оплаты"""
         query = "UPDATE orders SET payment_screenshot = $1 WHERE id = $2"
-        await self.execute(query, screenshot, order_id)
+        await self.execute(query, screenshot, order_id, query_name='update_order_screenshot')
     
     async def update_order_status_by_number(self, order_number, status):
         """Обновление статуса заказа по номеру заказа"""
@@ -717,36 +991,75 @@ class Database:
         else:
             # Если заказ не найден, просто обновляем статус без логики резервирования
             query = "UPDATE orders SET status = $1 WHERE order_number = $2"
-            await self.execute(query, status, order_number)
+            await self.execute(query, status, order_number, query_name='update_order_status_by_number')
+            order_counts_cache.invalidate()
     
     async def update_order_screenshot_by_number(self, order_number, screenshot):
         """Обновление скриншота оплаты по номеру заказа"""
         query = "UPDATE orders SET payment_screenshot = $1 WHERE order_number = $2"
-        await self.execute(query, screenshot, order_number)
+        await self.execute(query, screenshot, order_number, query_name='update_order_screenshot_by_number')
     
     async def get_pending_orders(self):
         """Получение заказов ожидающих обработки"""
         query = "SELECT id, order_number, user_id, products, total_price, delivery_zone, delivery_price, phone, address, status, payment_screenshot, created_at, latitude, longitude FROM orders WHERE status IN ('waiting_payment', 'payment_check', 'paid', 'shipping') ORDER BY created_at"
-        rows = await self.fetchall(query)
+        rows = await self.fetchall(query, query_name='get_pending_orders')
         return [Order(*row) for row in rows]
     
     async def get_all_orders(self, limit=50):
         """Получение всех заказов (для админа)"""
         query = "SELECT id, order_number, user_id, products, total_price, delivery_zone, delivery_price, phone, address, status, payment_screenshot, created_at, latitude, longitude FROM orders ORDER BY created_at DESC LIMIT $1"
-        rows = await self.fetchall(query, limit)
+        rows = await self.fetchall(query, limit, query_name='get_all_orders')
         return [Order(*row) for row in rows]
     
+    async def get_orders_page(self, status=None, after_created_at=None, after_id=None, limit=8, backward=False) -> List[Order]:
+        """Страница заказов (новые сначала) по ключу (created_at, id) вместо OFFSET
+        
+        after_created_at/after_id - последний заказ предыдущей страницы; при
+        backward=True это первый заказ следующей страницы и возвращаются заказы
+        перед ним. Порядок результата всегда от новых к старым.
+        """
+        conditions = []
+        params = []
+        if status:
+            params.append(status)
+            conditions.append(f"status = ${len(params)}")
+        if after_created_at is not None:
+            params.extend([after_created_at, after_id])
+            operator = '>' if backward else '<'
+            conditions.append(f"(created_at, id) {operator} (${len(params) - 1}, ${len(params)})")
+        params.append(limit)
+        
+        where = f"WHERE {' AND '.join(conditions)}" if conditions else ""
+        direction = 'ASC' if backward else 'DESC'
+        query = f"""SELECT {_ORDER_COLUMNS} FROM orders {where}
+                    ORDER BY created_at {direction}, id {direction} LIMIT ${len(params)}"""
+        rows = await self.fetchall(query, *params, query_name='get_orders_page')
+        orders = [Order(*row) for row in rows]
+        if backward:
+            orders.reverse()
+        return orders
+    
+    async def get_order_status_counts(self) -> dict:
+        """Количество заказов по статусам (кэшируется на ORDER_COUNTS_TTL секунд, см. catalog_cache.py)"""
+        counts = order_counts_cache.get()
+        if counts is None:
+            version = order_counts_cache.version
+            rows = await self.fetchall("SELECT status, COUNT(*) FROM orders GROUP BY status", query_name='get_order_status_counts')
+            counts = {row[0]: row[1] for row in rows}
+            order_counts_cache.store(version, counts)
+        return counts
+    
     async def get_orders_by_status(self, status, limit=50):
         """Получение заказов по статусу"""
         query = "SELECT id, order_number, user_id, products, total_price, delivery_zone, delivery_price, phone, address, status, payment_screenshot, created_at, latitude, longitude FROM orders WHERE status = $1 ORDER BY created_at DESC LIMIT $2"
-        rows = await self.fetchall(query, status, limit)
+        rows = await self.fetchall(query, status, limit, query_name='get_orders_by_status')
         return [Order(*row) for row in rows]
     
     async def get_orders_by_multiple_statuses(self, statuses, limit=50):
         """Получение заказов по нескольким статусам"""
         placeholders = ', '.join([f'${i+1}' for i in range(len(statuses))])
         query = f"SELECT id, order_number, user_id, products, total_price, delivery_zone, delivery_price, phone, address, status, payment_screenshot, created_at, latitude, longitude FROM orders WHERE status IN ({placeholders}) ORDER BY created_at DESC LIMIT ${len(statuses)+1}"
-        rows = await self.fetchall(query, *statuses, limit)
+        rows = await self.fetchall(query, *statuses, limit, query_name='get_orders_by_multiple_statuses')
         return [Order(*row) for row in rows]
     
     async def get_new_orders(self, limit=50):
@@ -773,6 +1086,75 @@ class Database:
         """Получение отмененных заказов"""
         return await self.get_orders_by_status('cancelled', limit)
     
+    # Методы для рассылок
+    async def create_broadcast_job(self, admin_id, status_chat_id, status_message_id, mode, language, messages):
+        """Создать задание рассылки; language=None - все активные пользователи"""
+        query = """
+        INSERT INTO broadcast_jobs (admin_id, status_chat_id, status_message_id, mode, language, messages, total)
+        VALUES ($1, $2, $3, $4, $5, $6,
+                (SELECT COUNT(*) FROM users WHERE is_active AND ($5::text IS NULL OR language_code = $5)))
+        RETURNING id
+        """
+        return await self.fetchval(query, admin_id, status_chat_id, status_message_id, mode, language,
+                                   json.dumps(messages), query_name='create_broadcast_job')
+    
+    async def get_broadcast_job(self, job_id):
+        """Получить задание рассылки"""
+        return await self.fetchone("SELECT * FROM broadcast_jobs WHERE id = $1", job_id, query_name='get_broadcast_job')
+    
+    async def get_running_broadcast_jobs(self) -> List[int]:
+        """ID незавершенных рассылок"""
+        rows = await self.fetchall("SELECT id FROM broadcast_jobs WHERE status = 'running' ORDER BY id", query_name='get_running_broadcast_jobs')
+        return [row['id'] for row in rows]
+    
+    async def iter_broadcast_recipients(self, language, after_user_id=0, chunk_size=100):
+        """Активные получатели рассылки после after_user_id пачками по chunk_size
+        
+        Keyset-пагинация по первичному ключу: каждая пачка - отдельный короткий
+        запрос (без долгой транзакции), память не растет вместе с таблицей users.
+        """
+        query = """
+        SELECT user_id, language_code FROM users
+        WHERE is_active AND user_id > $1 AND ($2::text IS NULL OR language_code = $2)
+        ORDER BY user_id
+        LIMIT $3
+        """
+        while True:
+            rows = await self.fetchall(query, after_user_id, language, chunk_size, query_name='iter_broadcast_recipients')
+            if not rows:
+                return
+            yield rows
+            if len(rows) < chunk_size:
+                return
+            after_user_id = rows[-1]['user_id']
+    
+    async def save_broadcast_progress(self, job_id, last_user_id, sent, failed, blocked, lang_stats, blocked_user_ids):
+        """Сохранить прогресс после пачки и пометить заблокировавших бота
+        
+        Возвращает текущий статус задания (cancelled - рассылку остановили).
+        """
+        async with self.transaction() as conn:
+            if blocked_user_ids:
+                await conn.execute("UPDATE users SET is_active = FALSE WHERE user_id = ANY($1::bigint[])",
+                                   blocked_user_ids)
+            return await conn.fetchval("""
+            UPDATE broadcast_jobs
+            SET last_user_id = $2, sent = $3, failed = $4, blocked = $5, lang_stats = $6
+            WHERE id = $1
+            RETURNING status
+            """, job_id, last_user_id, sent, failed, blocked, json.dumps(lang_stats))
+    
+    async def finish_broadcast_job(self, job_id):
+        """Отметить рассылку завершенной"""
+        await self.execute("""UPDATE broadcast_jobs SET status = 'completed', finished_at = CURRENT_TIMESTAMP
+                              WHERE id = $1 AND status = 'running'""", job_id, query_name='finish_broadcast_job')
+    
+    async def cancel_broadcast_job(self, job_id) -> bool:
+        """Остановить рассылку; False, если она уже не выполняется"""
+        result = await self.execute("""UPDATE broadcast_jobs SET status = 'cancelled', finished_at = CURRENT_TIMESTAMP
+                                       WHERE id = $1 AND status = 'running'""", job_id, query_name='cancel_broadcast_job')
+        return result.endswith(' 1')
+    
     # Методы для работы с администраторами
     async def add_admin(self, user_id, username, first_name, added_by):
         """Добавить администратора"""
@@ -780,77 +1162,78 @@ class Database:
                    VALUES ($1, $2, $3, $4) 
                    ON CONFLICT (user_id) DO UPDATE 
                    SET username = $2, first_name = $3"""
-        await self.execute(query, user_id, username, first_name, added_by)
+        await self.execute(query, user_id, username, first_name, added_by, query_name='add_admin')
     
     async def remove_admin(self, user_id):
         """Удалить администратора"""
         query = "DELETE FROM admins WHERE user_id = $1"
-        await self.execute(query, user_id)
+        await self.execute(query, user_id, query_name='remove_admin')
     
     async def get_all_admins(self):
         """Получить список всех администраторов из БД"""
         query = "SELECT * FROM admins ORDER BY added_at DESC"
-        rows = await self.fetchall(query)
+        rows = await self.fetchall(query, query_name='get_all_admins')
         return rows
     
     async def is_admin_in_db(self, user_id):
         """Проверить, является ли пользователь администратором в БД"""
-        query = "SELECT user_id FROM admins WHERE user_id = $1"
-        result = await self.fetchone(query, user_id)
+        result = await self.fetchone_prepared('is_admin_in_db', user_id)
         return result is not None
     
     # Методы для резервирования товаров
     async def get_available_product_quantity(self, product_id):
-        """Получить доступное количество товара с учетом резервов в корзинах и заказах"""
-        # Очищаем просроченные резервы
-        await self.cleanup_expired_reservations()
-        await self.cleanup_expired_order_reservations()
-        
-        # Получаем количество в корзинах
-        cart_reserved = await self.get_reserved_quantity(product_id)
-        
-        # Получаем количество в заказах
-        order_reserved = await self.get_reserved_quantity_by_orders(product_id)
-        
-        # Получаем общий stock товара
-        query = "SELECT stock_quantity FROM products WHERE id = $1 AND in_stock = true"
-        row = await self.fetchone(query, product_id)
-        if not row:
-            return 0
-        
-        total_stock = row['stock_quantity']
-        available = total_stock - cart_reserved - order_reserved
-        return max(0, available)
-    
-    async def cleanup_expired_reservations(self):
-        """Очистка просроченных резервов в корзинах"""
-        query = "DELETE FROM cart WHERE reserved_until <= CURRENT_TIMESTAMP"
-        await self.execute(query)
-    
-    async def cleanup_if_needed(self):
-        """Оптимизированная очистка с кэшированием - выполняется максимум раз в 30 секунд"""
-        import time
-        current_time = time.time()
+        """Получить доступное количество товара с учетом резервов в корзинах и заказах
+
+        Резервы ведутся в products.reserved_quantity триггерами на cart,
+        order_reservations и смену статуса заказа, поэтому здесь одно чтение
+        по первичному ключу вместо пересчета сумм.
+        """
+        available = await self.fetchval_prepared('get_available_product_quantity', product_id)
+        return available or 0
+
+    async def rebuild_availability_ledger(self):
+        """Пересчитать products.reserved_quantity по текущим резервам"""
+        await self.execute(REBUILD_AVAILABILITY_LEDGER_SQL, query_name='rebuild_availability_ledger')
+
+    async def cleanup_expired_reservations(self, limit=None) -> int:
+        """Очистка просроченных резервов в корзинах
         
-        # Выполняем cleanup только если прошло больше 30 секунд с последнего раза
-        if current_time - self._last_cleanup_time > 30:
-            await self.cleanup_expired_reservations()
-            await self.cleanup_expired_order_reservations()
-            self._last_cleanup_time = current_time
+        Вызывается только фоновым планировщиком; чтения фильтруют по reserved_until.
+        limit ограничивает число удаляемых строк за один запрос.
+        Товары удаляемых строк блокируются в порядке id до удаления (см. clear_cart).
+        Возвращает количество удаленных строк.
+        """
+        async with self.transaction() as conn:
+            # LIMIT NULL - без ограничения
+            expired = await conn.fetch(
+                "SELECT user_id, product_id FROM cart WHERE reserved_until <= CURRENT_TIMESTAMP LIMIT $1", limit
+            )
+            if not expired:
+                return 0
+            await conn.execute("SELECT id FROM products WHERE id = ANY($1::integer[]) ORDER BY id FOR UPDATE",
+                               [row['product_id'] for row in expired])
+            # Резерв мог быть продлен после выборки - срок проверяется повторно
+            result = await conn.execute("""
+            DELETE FROM cart USING unnest($1::bigint[], $2::integer[]) AS e(user_id, product_id)
+            WHERE cart.user_id = e.user_id AND cart.product_id = e.product_id
+            AND cart.reserved_until <= CURRENT_TIMESTAMP
+            """, [row['user_id'] for row in expired], [row['product_id'] for row in expired])
+        deleted = int(result.split()[-1])
+        if deleted:
+            catalog_cache.invalidate_availability()
+        return deleted
     
     async def get_reserved_quantity(self, product_id):
         """Получить зарезервированное количество товара"""
-        await self.cleanup_expired_reservations()
-        
         query = "SELECT COALESCE(SUM(quantity), 0) FROM cart WHERE product_id = $1 AND reserved_until > CURRENT_TIMESTAMP"
-        row = await self.fetchone(query, product_id)
+        row = await self.fetchone(query, product_id, query_name='get_reserved_quantity')
         return row[0] if row else 0
     
     async def extend_cart_reservation(self, user_id, product_id):
         """Продлить резервирование товара в корзине на 15 минут"""
         query = """UPDATE cart SET reserved_until = CURRENT_TIMESTAMP + INTERVAL '15 minutes' 
                    WHERE user_id = $1 AND product_id = $2"""
-        await self.execute(query, user_id, product_id)
+        await self.execute(query, user_id, product_id, query_name='extend_cart_reservation')
     
     async def get_cart_expiry_time(self, user_id):
         """Получить время истечения резервов в корзине пользователя"""
@@ -858,7 +1241,7 @@ class Database:
                           EXTRACT(EPOCH FROM (MIN(reserved_until) - CURRENT_TIMESTAMP))/60 as minutes_left
                    FROM cart 
                    WHERE user_id = $1 AND reserved_until > CURRENT_TIMESTAMP"""
-        row = await self.fetchone(query, user_id)
+        row = await self.fetchone(query, user_id, query_name='get_cart_expiry_time')
         if row and row['expiry']:
             return {
                 'expiry_time': row['expiry'],
@@ -868,60 +1251,108 @@ class Database:
     
     # Методы для работы с резервированием товаров в заказах
     async def create_order_reservation(self, order_id, products_data):
-        """Создать резервирование товаров для заказа на 5 минут"""
-        import json
+        """Создать резервирование товаров для заказа на 5 минут
         
-        query = """
-        INSERT INTO order_reservations (order_id, reserved_products) 
-        VALUES ($1, $2)
-        ON CONFLICT (order_id) DO UPDATE SET 
-            reserved_products = $2,
-            reserved_until = CURRENT_TIMESTAMP + INTERVAL '5 minutes'
+        products_data: {product_id: quantity}; позиции хранятся в reservation_items
         """
-        await self.execute(query, order_id, json.dumps(products_data))
+        async with self.transaction() as conn:
+            seconds_left = await conn.fetchval("""
+            INSERT INTO order_reservations (order_id) 
+            VALUES ($1)
+            ON CONFLICT (order_id) DO UPDATE SET 
+                reserved_until = CURRENT_TIMESTAMP + INTERVAL '5 minutes'
+            RETURNING EXTRACT(EPOCH FROM (reserved_until - CURRENT_TIMESTAMP))
+            """, order_id)
+            await conn.execute("DELETE FROM reservation_items WHERE order_id = $1", order_id)
+            await conn.executemany(
+                "INSERT INTO reservation_items (order_id, product_id, quantity) VALUES ($1, $2, $3)",
+                [(order_id, int(product_id), quantity) for product_id, quantity in products_data.items()]
+            )
+        catalog_cache.invalidate_availability()
+        
+        from reservation_scheduler import reservation_scheduler
+        reservation_scheduler.schedule_order_expiry(order_id, seconds_left)
     
     async def get_order_reservation(self, order_id):
         """Получить резервирование товаров для заказа"""
         query = """
-        SELECT reserved_products, reserved_until,
-               EXTRACT(EPOCH FROM (reserved_until - CURRENT_TIMESTAMP))/60 as minutes_left
-        FROM order_reservations 
-        WHERE order_id = $1 AND reserved_until > CURRENT_TIMESTAMP
+        SELECT ord_res.reserved_until,
+               EXTRACT(EPOCH FROM (ord_res.reserved_until - CURRENT_TIMESTAMP))/60 as minutes_left,
+               ri.product_id, ri.quantity
+        FROM order_reservations ord_res
+        LEFT JOIN reservation_items ri ON ri.order_id = ord_res.order_id
+        WHERE ord_res.order_id = $1 AND ord_res.reserved_until > CURRENT_TIMESTAMP
         """
-        row = await self.fetchone(query, order_id)
-        if row:
-            import json
+        rows = await self.fetchall(query, order_id, query_name='get_order_reservation')
+        if rows:
             return {
-                'products': json.loads(row['reserved_products']),
-                'reserved_until': row['reserved_until'],
-                'minutes_left': max(0, int(row['minutes_left']))
+                'products': {str(row['product_id']): row['quantity'] for row in rows if row['product_id'] is not None},
+                'reserved_until': rows[0]['reserved_until'],
+                'minutes_left': max(0, int(rows[0]['minutes_left']))
             }
         return None
     
     async def remove_order_reservation(self, order_id):
         """Удалить резервирование товаров для заказа"""
         query = "DELETE FROM order_reservations WHERE order_id = $1"
-        await self.execute(query, order_id)
+        await self.execute(query, order_id, query_name='remove_order_reservation')
     
-    async def cleanup_expired_order_reservations(self):
-        """Очистка просроченных резервов заказов и отмена заказов"""
-        # Получаем просроченные заказы
-        query = """
-        SELECT o.id, o.order_number, ord_res.reserved_products
-        FROM orders o
-        JOIN order_reservations ord_res ON o.id = ord_res.order_id
-        WHERE ord_res.reserved_until <= CURRENT_TIMESTAMP AND o.status = 'waiting_payment'
+    async def cleanup_expired_order_reservations(self, limit=None) -> int:
+        """Очистка просроченных резервов заказов и отмена заказов
+        
+        Все просроченные заказы в waiting_payment отменяются одним UPDATE ... RETURNING
+        в одной транзакции вместе с удалением резервов; уведомления рассылаются после
+        фиксации транзакции с ограниченной параллельностью.
+        limit ограничивает число заказов/резервов за один вызов.
+        Возвращает количество удаленных резервов (включая резервы отмененных заказов).
         """
-        expired_orders = await self.fetchall(query)
+        async with self.transaction() as conn:
+            cancelled_orders = await conn.fetch("""
+            WITH expired AS (
+                SELECT o.id
+                FROM orders o
+                JOIN order_reservations ord_res ON o.id = ord_res.order_id
+                WHERE ord_res.reserved_until <= CURRENT_TIMESTAMP AND o.status = 'waiting_payment'
+                ORDER BY ord_res.reserved_until
+                LIMIT $1
+                FOR UPDATE OF o SKIP LOCKED
+            )
+            UPDATE orders SET status = 'cancelled'
+            FROM expired
+            WHERE orders.id = expired.id AND orders.status = 'waiting_payment'
+            RETURNING orders.id, orders.order_number, orders.user_id
+            """, limit)
+            
+            # Удаляем резервы отмененных заказов и прочие просроченные резервы. Резервы
+            # заказов, еще ждущих оплаты (пропущенных SKIP LOCKED или LIMIT), не трогаем:
+            # без них заказ больше никогда не отменится по просрочке
+            result = await conn.execute("""
+            DELETE FROM order_reservations WHERE order_id = ANY($1::integer[]) OR order_id IN (
+                SELECT order_id FROM order_reservations
+                WHERE reserved_until <= CURRENT_TIMESTAMP
+                AND NOT EXISTS (
+                    SELECT 1 FROM orders o
+                    WHERE o.id = order_reservations.order_id AND o.status = 'waiting_payment'
+                )
+                LIMIT $2
+            )
+            """, [order['id'] for order in cancelled_orders], limit)
         
-        # Отменяем просроченные заказы
-        for order in expired_orders:
-            await self.update_order_status(order['id'], 'cancelled')
+        for order in cancelled_orders:
             logger.info(f"Заказ #{order['order_number']} отменен из-за просрочки резерва")
+        if cancelled_orders:
+            catalog_cache.invalidate_availability()
+            order_counts_cache.invalidate()
         
-        # Удаляем просроченные резервы
-        query = "DELETE FROM order_reservations WHERE reserved_until <= CURRENT_TIMESTAMP"
-        await self.execute(query)
+        if cancelled_orders:
+            try:
+                from notifications import notification_system
+                if notification_system:
+                    await notification_system.notify_status_changes(cancelled_orders, 'waiting_payment', 'cancelled')
+            except Exception as e:
+                logger.error(f"Ошибка отправки уведомлений об отмене просроченных заказов: {e}")
+        
+        return int(result.split()[-1])
     
     async def extend_order_reservation(self, order_id):
         """Продлить резервирование заказа на 5 минут"""
@@ -929,23 +1360,27 @@ class Database:
         UPDATE order_reservations 
         SET reserved_until = CURRENT_TIMESTAMP + INTERVAL '5 minutes'
         WHERE order_id = $1 AND reserved_until > CURRENT_TIMESTAMP
+        RETURNING EXTRACT(EPOCH FROM (reserved_until - CURRENT_TIMESTAMP))
         """
-        await self.execute(query, order_id)
+        seconds_left = await self.fetchval(query, order_id, query_name='extend_order_reservation')
+        
+        if seconds_left is not None:
+            from reservation_scheduler import reservation_scheduler
+            reservation_scheduler.schedule_order_expiry(order_id, seconds_left)
     
     async def get_reserved_quantity_by_orders(self, product_id):
         """Получить количество товара, зарезервированного в заказах"""
-        await self.cleanup_expired_order_reservations()
-        
         query = """
-        SELECT COALESCE(SUM((reserved_products->>$2)::integer), 0) as reserved
-        FROM order_reservations ord_res
-        JOIN orders o ON ord_res.order_id = o.id
-        WHERE ord_res.reserved_until > CURRENT_TIMESTAMP 
+        SELECT COALESCE(SUM(ri.quantity), 0) as reserved
+        FROM reservation_items ri
+        JOIN order_reservations ord_res ON ri.order_id = ord_res.order_id
+        JOIN orders o ON ri.order_id = o.id
+        WHERE ri.product_id = $1
+        AND ord_res.reserved_until > CURRENT_TIMESTAMP 
         AND o.status = 'waiting_payment'
-        AND reserved_products ? $1
         """
         
-        row = await self.fetchone(query, str(product_id), str(product_id))
+        row = await self.fetchone(query, product_id, query_name='get_reserved_quantity_by_orders')
         return row['reserved'] if row else 0
 
 
@@ -977,6 +1412,29 @@ async def init_db():
     except asyncpg.exceptions.DuplicateColumnError:
         pass  # Колонка уже существует
     
+    # Пользователи, заблокировавшие бота, не получают рассылки
+    await conn.execute('ALTER TABLE users ADD COLUMN IF NOT EXISTS is_active BOOLEAN NOT NULL DEFAULT TRUE')
+    
+    # Задания рассылок (для продолжения после перезапуска)
+    await conn.execute('''CREATE TABLE IF NOT EXISTS broadcast_jobs (
+        id SERIAL PRIMARY KEY,
+        admin_id BIGINT NOT NULL,
+        status_chat_id BIGINT NOT NULL,
+        status_message_id BIGINT NOT NULL,
+        mode TEXT NOT NULL,
+        language TEXT,
+        messages JSONB NOT NULL,
+        status TEXT NOT NULL DEFAULT 'running',
+        total INTEGER NOT NULL DEFAULT 0,
+        last_user_id BIGINT NOT NULL DEFAULT 0,
+        sent INTEGER NOT NULL DEFAULT 0,
+        failed INTEGER NOT NULL DEFAULT 0,
+        blocked INTEGER NOT NULL DEFAULT 0,
+        lang_stats JSONB NOT NULL DEFAULT '{}',
+        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+        finished_at TIMESTAMP
+    )''')
+    
     # Таблица категорий
     await conn.execute('''CREATE TABLE IF NOT EXISTS categories (
         id SERIAL PRIMARY KEY,
@@ -1023,6 +1481,15 @@ async def init_db():
     except:
         pass  # Поле уже существует
     
+    # Номера заказов выдаются последовательностью (вместо случайного подбора)
+    await conn.execute('CREATE SEQUENCE IF NOT EXISTS order_number_seq')
+    await conn.execute('''SELECT setval('order_number_seq', GREATEST(
+        (SELECT COALESCE(MAX(order_number), 0) FROM orders),
+        (SELECT last_value FROM order_number_seq),
+        10000
+    ))''')
+    await conn.execute("ALTER TABLE orders ALTER COLUMN order_number SET DEFAULT nextval('order_number_seq')")
+    
     # Добавляем поля координат если их нет (для существующих баз)
     try:
         await conn.execute('ALTER TABLE orders ADD COLUMN latitude DECIMAL(10,8)')
@@ -1030,6 +1497,12 @@ async def init_db():
     except:
         pass  # Поля уже существуют
     
+    # "Мои заказы": страница заказов пользователя, новые сначала
+    await conn.execute('CREATE INDEX IF NOT EXISTS idx_orders_user_created_at_id ON orders (user_id, created_at DESC, id DESC)')
+    # Списки заказов в админке листаются по ключу (created_at, id), в том числе внутри статуса
+    await conn.execute('CREATE INDEX IF NOT EXISTS idx_orders_created_at_id ON orders (created_at DESC, id DESC)')
+    await conn.execute('CREATE INDEX IF NOT EXISTS idx_orders_status_created_at_id ON orders (status, created_at DESC, id DESC)')
+    
     # Таблица корзины
     await conn.execute('''CREATE TABLE IF NOT EXISTS cart (
         user_id BIGINT,
@@ -1059,13 +1532,165 @@ async def init_db():
     # Таблица резервирования товаров для заказов в ожидании оплаты
     await conn.execute('''CREATE TABLE IF NOT EXISTS order_reservations (
         order_id INTEGER PRIMARY KEY,
-        reserved_products JSONB NOT NULL,
+        reserved_products JSONB,
         reserved_until TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP + INTERVAL '5 minutes',
         created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
         FOREIGN KEY (order_id) REFERENCES orders (id) ON DELETE CASCADE
     )''')
     
+    # Позиции резерва хранятся в reservation_items, JSON-колонка оставлена только для старых записей
+    await conn.execute('ALTER TABLE order_reservations ALTER COLUMN reserved_products DROP NOT NULL')
+    
+    # Позиции заказов (нормализованная копия orders.products)
+    await conn.execute('''CREATE TABLE IF NOT EXISTS order_items (
+        id SERIAL PRIMARY KEY,
+        order_id INTEGER NOT NULL REFERENCES orders (id) ON DELETE CASCADE,
+        product_id INTEGER NOT NULL,
+        product_name TEXT,
+        price DECIMAL(10,2),
+        quantity INTEGER NOT NULL
+    )''')
+    await conn.execute('CREATE INDEX IF NOT EXISTS idx_order_items_order_id ON order_items (order_id)')
+    await conn.execute('CREATE INDEX IF NOT EXISTS idx_order_items_product_id ON order_items (product_id)')
+    
+    # Поиск заказов по названиям товаров: триграммный индекс обслуживает ILIKE '%...%'
+    try:
+        await conn.execute('CREATE EXTENSION IF NOT EXISTS pg_trgm')
+        await conn.execute('CREATE INDEX IF NOT EXISTS idx_order_items_product_name_trgm ON order_items USING gin (product_name gin_trgm_ops)')
+    except Exception as e:
+        logger.warning(f"⚠️ Триграммный индекс для поиска заказов не создан, поиск будет без индекса: {e}")
+    
+    # Позиции резервов заказов
+    await conn.execute('''CREATE TABLE IF NOT EXISTS reservation_items (
+        order_id INTEGER NOT NULL REFERENCES order_reservations (order_id) ON DELETE CASCADE,
+        product_id INTEGER NOT NULL,
+        quantity INTEGER NOT NULL,
+        PRIMARY KEY (order_id, product_id)
+    )''')
+    await conn.execute('CREATE INDEX IF NOT EXISTS idx_reservation_items_product_id ON reservation_items (product_id)')
+    
+    # Перенос данных из JSON (идемпотентно: только заказы/резервы без позиций).
+    # Одна транзакция: JSON резерва очищается только вместе с записью его позиций.
+    # Некорректный JSON и нечисловые id/количества пропускаются, а не прерывают запуск
+    async with conn.transaction():
+        await conn.execute('''CREATE OR REPLACE FUNCTION pg_temp.try_jsonb(value TEXT) RETURNS JSONB AS $$
+        BEGIN
+            RETURN value::jsonb;
+        EXCEPTION WHEN others THEN
+            RETURN NULL;
+        END;
+        $$ LANGUAGE plpgsql''')
+        await conn.execute('''
+        INSERT INTO order_items (order_id, product_id, product_name, price, quantity)
+        SELECT o.id, (item->>'id')::integer, item->>'name',
+               CASE WHEN jsonb_typeof(item->'price') = 'number' THEN (item->>'price')::numeric END,
+               (item->>'quantity')::integer
+        FROM orders o
+        CROSS JOIN LATERAL pg_temp.try_jsonb(o.products) parsed
+        CROSS JOIN LATERAL jsonb_array_elements(CASE WHEN jsonb_typeof(parsed) = 'array' THEN parsed ELSE '[]'::jsonb END) item
+        WHERE o.products IS NOT NULL
+        AND jsonb_typeof(item) = 'object'
+        AND item->>'id' ~ '^\\d{1,9}$'
+        AND item->>'quantity' ~ '^\\d{1,9}$'
+        AND NOT EXISTS (SELECT 1 FROM order_items oi WHERE oi.order_id = o.id)
+        ''')
+        await conn.execute('''
+        INSERT INTO reservation_items (order_id, product_id, quantity)
+        SELECT ord_res.order_id, r.key::integer, r.value::integer
+        FROM order_reservations ord_res
+        CROSS JOIN LATERAL jsonb_each_text(
+            CASE WHEN jsonb_typeof(ord_res.reserved_products) = 'object' THEN ord_res.reserved_products ELSE '{}'::jsonb END
+        ) r
+        WHERE ord_res.reserved_products IS NOT NULL
+        AND r.key ~ '^\\d{1,9}$'
+        AND r.value ~ '^\\d{1,9}$'
+        AND NOT EXISTS (SELECT 1 FROM reservation_items ri WHERE ri.order_id = ord_res.order_id)
+        ON CONFLICT DO NOTHING
+        ''')
+        # JSON без единой корректной позиции оставляем как есть для ручного разбора
+        await conn.execute('''
+        UPDATE order_reservations SET reserved_products = NULL
+        WHERE reserved_products IS NOT NULL
+        AND EXISTS (SELECT 1 FROM reservation_items ri WHERE ri.order_id = order_reservations.order_id)
+        ''')
+        await conn.execute('DROP FUNCTION pg_temp.try_jsonb(TEXT)')
+    
+    # Учет резервов: products.reserved_quantity поддерживается триггерами
+    # в той же транзакции, что и изменение корзины/резерва/статуса заказа
+    await conn.execute('ALTER TABLE products ADD COLUMN IF NOT EXISTS reserved_quantity INTEGER NOT NULL DEFAULT 0')
+    
+    await conn.execute('''CREATE OR REPLACE FUNCTION cart_reserved_ledger() RETURNS trigger AS $$
+    BEGIN
+        IF TG_OP = 'UPDATE' AND NEW.product_id = OLD.product_id THEN
+            IF NEW.quantity <> OLD.quantity THEN
+                UPDATE products SET reserved_quantity = reserved_quantity + NEW.quantity - OLD.quantity
+                WHERE id = NEW.product_id;
+            END IF;
+            RETURN NULL;
+        END IF;
+        IF TG_OP IN ('UPDATE', 'DELETE') THEN
+            UPDATE products SET reserved_quantity = reserved_quantity - OLD.quantity WHERE id = OLD.product_id;
+        END IF;
+        IF TG_OP IN ('INSERT', 'UPDATE') THEN
+            UPDATE products SET reserved_quantity = reserved_quantity + NEW.quantity WHERE id = NEW.product_id;
+        END IF;
+        RETURN NULL;
+    END;
+    $$ LANGUAGE plpgsql''')
+    
+    # Резерв заказа учитывается только в статусе waiting_payment
+    await conn.execute('''CREATE OR REPLACE FUNCTION reservation_items_ledger() RETURNS trigger AS $$
+    BEGIN
+        IF TG_OP IN ('UPDATE', 'DELETE')
+           AND EXISTS (SELECT 1 FROM orders WHERE id = OLD.order_id AND status = 'waiting_payment') THEN
+            UPDATE products SET reserved_quantity = reserved_quantity - OLD.quantity WHERE id = OLD.product_id;
+        END IF;
+        IF TG_OP IN ('INSERT', 'UPDATE')
+           AND EXISTS (SELECT 1 FROM orders WHERE id = NEW.order_id AND status = 'waiting_payment') THEN
+            UPDATE products SET reserved_quantity = reserved_quantity + NEW.quantity WHERE id = NEW.product_id;
+        END IF;
+        RETURN NULL;
+    END;
+    $$ LANGUAGE plpgsql''')
+    
+    await conn.execute('''CREATE OR REPLACE FUNCTION order_status_ledger() RETURNS trigger AS $$
+    DECLARE
+        direction INTEGER;
+    BEGIN
+        IF OLD.status = 'waiting_payment' AND NEW.status IS DISTINCT FROM 'waiting_payment' THEN
+            direction := -1;
+        ELSIF OLD.status IS DISTINCT FROM 'waiting_payment' AND NEW.status = 'waiting_payment' THEN
+            direction := 1;
+        ELSE
+            RETURN NULL;
+        END IF;
+        UPDATE products p SET reserved_quantity = p.reserved_quantity + direction * ri.quantity
+        FROM reservation_items ri
+        WHERE ri.order_id = NEW.id AND p.id = ri.product_id;
+        RETURN NULL;
+    END;
+    $$ LANGUAGE plpgsql''')
+    
+    await conn.execute('''
+    DROP TRIGGER IF EXISTS cart_reserved_ledger ON cart;
+    CREATE TRIGGER cart_reserved_ledger AFTER INSERT OR UPDATE OR DELETE ON cart
+        FOR EACH ROW EXECUTE FUNCTION cart_reserved_ledger();
+    DROP TRIGGER IF EXISTS order_reserved_ledger ON order_reservations;
+    DROP FUNCTION IF EXISTS order_reserved_ledger();
+    DROP TRIGGER IF EXISTS reservation_items_ledger ON reservation_items;
+    CREATE TRIGGER reservation_items_ledger AFTER INSERT OR UPDATE OR DELETE ON reservation_items
+        FOR EACH ROW EXECUTE FUNCTION reservation_items_ledger();
+    DROP TRIGGER IF EXISTS order_status_ledger ON orders;
+    CREATE TRIGGER order_status_ledger AFTER UPDATE OF status ON orders
+        FOR EACH ROW EXECUTE FUNCTION order_status_ledger();
+    ''')
+    
+    # Выравниваем учет на случай изменений, сделанных до появления триггеров
+    await conn.execute(REBUILD_AVAILABILITY_LEDGER_SQL)
+    
     await conn.close()
 
 # Глобальная переменная базы данных
-db = Database()
\ No newline at end of file
+db = Database()
+# Те же методы на отдельном пуле: планировщик резервов, рассылки, статистика
+background_db = Database(background=True)
\ No newline at end of file
@@ -18,12 +18,13 @@ from aiohttp import web, ClientSession
 sys.path.insert(0, str(Path(__file__).parent))
 
 from config import BOT_TOKEN, ADMIN_IDS
-from database import db, init_db
+from database import db, background_db, init_db
+from reservation_scheduler import reservation_scheduler
 from keyboards import get_main_menu
 from handlers.user import router as user_router
 from handlers.admin import router as admin_router
 from i18n import _
-from middleware import AntiSpamMiddleware
+from middleware import AntiSpamMiddleware, UserLanguageMiddleware, MessageContentMiddleware
 from anti_spam import anti_spam
 
 # Настройка логирования
@@ -44,6 +45,10 @@ dp = Dispatcher(storage=storage)
 
 # Регистрация middleware
 dp.message.middleware(AntiSpamMiddleware(anti_spam))
+dp.message.middleware(UserLanguageMiddleware())
+dp.callback_query.middleware(UserLanguageMiddleware())
+# Правки сообщений в обход MessageManager сбрасывают запомненное им содержимое
+bot.session.middleware(MessageContentMiddleware())
 
 # Регистрация роутеров
 dp.include_router(user_router)
@@ -170,8 +175,15 @@ async def health_check(request):
 async def shutdown_handler():
     """Обработчик корректного завершения работы"""
     logger.info("Получен сигнал завершения работы...")
+    try:
+        # Останавливаем планировщик резервирования
+        await reservation_scheduler.stop()
+        logger.info("Планировщик резервирования остановлен")
+    except:
+        pass
     try:
         await db.close_pool()
+        await background_db.close_pool()
     except:
         pass
     try:
@@ -186,6 +198,16 @@ async def main():
         logger.info("🔥 Запуск бота в режиме разработки...")
         logger.info("Инициализация базы данных...")
         await init_db()
+        # Открываем соединения пула заранее, до первых запросов пользователей
+        await db.init_pool()
+        
+        # Продолжаем рассылки, прерванные перезапуском
+        from broadcast import broadcast_engine
+        await broadcast_engine.resume_jobs(bot)
+        
+        # Запускаем планировщик резервирования (единственная очистка просроченных резервов)
+        logger.info("Запуск планировщика резервирования товаров...")
+        await reservation_scheduler.start()
         
         # Удаляем webhook перед началом работы
         logger.info("Очистка webhook...")
@@ -3,6 +3,7 @@ from aiogram.types import CallbackQuery, Message, InlineKeyboardButton, InlineKe
 from aiogram.fsm.context import FSMContext
 from aiogram.fsm.state import State, StatesGroup
 
+from broadcast import broadcast_engine
 from database import db
 from filters.admin import admin_filter
 from i18n import _
@@ -10,31 +11,6 @@ from utils.safe_operations import safe_edit_message
 
 router = Router()
 
-def format_broadcast_message(text: str, user_id: int = None) -> str:
-    """
-    Форматирует сообщение рассылки с красивым оформлением
-    """
-    # Выбираем заголовок в зависимости от языка пользователя
-    from i18n import i18n
-    user_lang = i18n.get_user_language(user_id) if user_id else 'ru'
-    
-    headers = {
-        'ru': f"📢 <b>Новости от Tbilisi Vape Shop</b> 📢",
-        'ka': f"📢 <b>ახალი ამბები Tbilisi Vape Shop-დან</b> 📢", 
-        'en': f"📢 <b>News from Tbilisi Vape Shop</b> 📢"
-    }
-    
-    footers = {
-        'ru': f"\n\n━━━━━━━━━━━━━━━━━━━━━━━━\n💨 <i>Tbilisi Vape Shop</i>\n🛍️ <i>Лучшие цены на вейпы в Тбилиси</i>",
-        'ka': f"\n\n━━━━━━━━━━━━━━━━━━━━━━━━\n💨 <i>Tbilisi Vape Shop</i>\n🛍️ <i>საუკეთესო ფასები ვეიფზე თბილისში</i>",
-        'en': f"\n\n━━━━━━━━━━━━━━━━━━━━━━━━\n💨 <i>Tbilisi Vape Shop</i>\n🛍️ <i>Best vape prices in Tbilisi</i>"
-    }
-    
-    header = headers.get(user_lang, headers['ru'])
-    footer = footers.get(user_lang, footers['ru'])
-    
-    return f"{header}\n\n{text}{footer}"
-
 class CommunicationStates(StatesGroup):
     waiting_broadcast_message = State()
     waiting_broadcast_language = State()
@@ -43,7 +19,7 @@ class CommunicationStates(StatesGroup):
     waiting_general_client_message = State()
 
 async def process_broadcast_logic(message: Message, state: FSMContext):
-    """Логика обработки рассылки с красивым форматированием"""
+    """Запуск рассылки: задание выполняется в фоне движком рассылок (broadcast.py)"""
     data = await state.get_data()
     broadcast_mode = data.get('broadcast_mode')
     broadcast_text = message.text
@@ -55,108 +31,35 @@ async def process_broadcast_logic(message: Message, state: FSMContext):
     if broadcast_mode == "auto":
         # Многоязычная рассылка
         messages = data.get('messages', {})
-        from i18n import i18n
-        
-        users = await db.fetchall("SELECT user_id, language_code FROM users")
-        stats = {"ru": {"sent": 0, "failed": 0},
-                 "ka": {"sent": 0, "failed": 0}, 
-                 "en": {"sent": 0, "failed": 0}}
-        
+        language = None
         status_msg = await message.answer("📢 Отправка многоязычных сообщений...")
-        
-        for user in users:
-            user_id = user[0]
-            user_lang = user[1] if len(user) > 1 and user[1] else i18n.get_user_language(user_id)
-            
-            if user_lang not in messages:
-                user_lang = "ru"
-            
-            # Форматируем сообщение с брендингом
-            formatted_message = format_broadcast_message(messages[user_lang], user_id)
-            
-            try:
-                # Добавляем кнопку "Главное меню" к рассылке
-                keyboard = InlineKeyboardMarkup(inline_keyboard=[
-                    [InlineKeyboardButton(text="🏠 Главное меню", callback_data="back_to_menu")]
-                ])
-                await message.bot.send_message(user_id, formatted_message, parse_mode='HTML', reply_markup=keyboard)
-                stats[user_lang]["sent"] += 1
-            except:
-                stats[user_lang]["failed"] += 1
-        
-        total_sent = sum(s["sent"] for s in stats.values())
-        total_failed = sum(s["failed"] for s in stats.values())
-        
-        await status_msg.edit_text(
-            f"✅ <b>Многоязычная рассылка завершена!</b>\n\n"
-            f"📊 <b>Статистика по языкам:</b>\n\n"
-            f"🇷🇺 Русский: ✅ {stats['ru']['sent']} | ❌ {stats['ru']['failed']}\n"
-            f"🇬🇪 Грузинский: ✅ {stats['ka']['sent']} | ❌ {stats['ka']['failed']}\n"
-            f"🇬🇧 Английский: ✅ {stats['en']['sent']} | ❌ {stats['en']['failed']}\n\n"
-            f"📤 <b>Всего отправлено:</b> {total_sent}\n"
-            f"❌ <b>Не доставлено:</b> {total_failed}",
-            reply_markup=InlineKeyboardMarkup(inline_keyboard=[
-                [InlineKeyboardButton(text="🔙 Админ панель", callback_data="admin_panel")]
-            ]),
-            parse_mode='HTML'
-        )
     else:
         # Одноязычная рассылка
-        broadcast_lang = data.get('broadcast_lang')
-        users = await db.fetchall("SELECT user_id FROM users WHERE language_code = $1", broadcast_lang)
-        
-        sent = 0
-        failed = 0
-        
+        language = data.get('broadcast_lang')
+        messages = {language: broadcast_text}
         status_msg = await message.answer("📢 Отправка сообщений...")
-        
-        for user in users:
-            user_id = user[0]
-            # Форматируем с брендингом в зависимости от выбранного языка
-            formatted_message = format_broadcast_message(broadcast_text, user_id if broadcast_lang == 'auto' else None)
-            # Если конкретный язык, используем его для всех
-            if broadcast_lang != 'auto':
-                formatted_message = format_broadcast_message(broadcast_text).replace(
-                    format_broadcast_message("", None),
-                    format_broadcast_message("", user_id).replace(broadcast_text, "")
-                ).replace("", broadcast_text)
-                # Упрощенный подход - используем язык рассылки
-                headers = {
-                    'ru': f"📢 <b>Новости от Tbilisi Vape Shop</b> 📢",
-                    'ka': f"📢 <b>ახალი ამბები Tbilisi Vape Shop-დან</b> 📢", 
-                    'en': f"📢 <b>News from Tbilisi Vape Shop</b> 📢"
-                }
-                footers = {
-                    'ru': f"\n\n━━━━━━━━━━━━━━━━━━━━━━━━\n💨 <i>Tbilisi Vape Shop</i>\n🛍️ <i>Лучшие цены на вейпы в Тбилиси</i>",
-                    'ka': f"\n\n━━━━━━━━━━━━━━━━━━━━━━━━\n💨 <i>Tbilisi Vape Shop</i>\n🛍️ <i>საუკეთესო ფასები ვეიფზე თბილისში</i>",
-                    'en': f"\n\n━━━━━━━━━━━━━━━━━━━━━━━━\n💨 <i>Tbilisi Vape Shop</i>\n🛍️ <i>Best vape prices in Tbilisi</i>"
-                }
-                formatted_message = f"{headers[broadcast_lang]}\n\n{broadcast_text}{footers[broadcast_lang]}"
-            
-            try:
-                # Добавляем кнопку "Главное меню" к рассылке
-                keyboard = InlineKeyboardMarkup(inline_keyboard=[
-                    [InlineKeyboardButton(text="🏠 Главное меню", callback_data="back_to_menu")]
-                ])
-                await message.bot.send_message(user_id, formatted_message, parse_mode='HTML', reply_markup=keyboard)
-                sent += 1
-            except Exception:
-                failed += 1
-        
-        lang_names = {"ru": "русском", "ka": "грузинском", "en": "английском"}
-        
-        await status_msg.edit_text(
-            f"✅ <b>Рассылка на {lang_names.get(broadcast_lang, broadcast_lang)} языке завершена!</b>\n\n"
-            f"📤 Отправлено: {sent}\n"
-            f"❌ Не доставлено: {failed}",
-            reply_markup=InlineKeyboardMarkup(inline_keyboard=[
-                [InlineKeyboardButton(text="🔙 Админ панель", callback_data="admin_panel")]
-            ]),
-            parse_mode='HTML'
-        )
+    
+    await broadcast_engine.start_job(
+        message.bot,
+        admin_id=message.from_user.id,
+        chat_id=status_msg.chat.id,
+        message_id=status_msg.message_id,
+        mode="auto" if broadcast_mode == "auto" else "single",
+        messages=messages,
+        language=language
+    )
     
     await state.clear()
 
+@router.callback_query(F.data.startswith("stop_broadcast_"), admin_filter)
+async def stop_broadcast(callback: CallbackQuery):
+    """Остановить выполняющуюся рассылку"""
+    job_id = int(callback.data.split("_")[2])
+    if await broadcast_engine.cancel_job(job_id):
+        await callback.answer("⛔ Рассылка будет остановлена после текущей пачки", show_alert=True)
+    else:
+        await callback.answer("Рассылка уже завершена", show_alert=True)
+
 @router.callback_query(F.data == "admin_broadcast", admin_filter)
 async def start_broadcast(callback: CallbackQuery, state: FSMContext):
     """Начать рассылку"""
@@ -275,7 +178,7 @@ async def start_message_to_client(callback: CallbackQuery, state: FSMContext):
     await state.set_state(CommunicationStates.waiting_client_message)
     
     from i18n import i18n
-    user_language = i18n.get_user_language(order.user_id)
+    user_language = await i18n.ensure_user_language(order.user_id)
     language_names = {'ru': 'Русский', 'ka': 'ქართული', 'en': 'English'}
     
     admin_language = 'ru'
@@ -410,7 +313,7 @@ async def process_client_id_input(message: Message, state: FSMContext):
         await state.set_state(CommunicationStates.waiting_general_client_message)
         
         from i18n import i18n
-        user_language = i18n.get_user_language(client_id)
+        user_language = await i18n.ensure_user_language(client_id)
         language_names = {'ru': 'Русский', 'ka': 'ქართული', 'en': 'English'}
         
         await message.answer(
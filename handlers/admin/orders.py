@@ -61,17 +61,18 @@ async def admin_all_orders_menu(callback: CallbackQuery):
 @router.callback_query(F.data.startswith("admin_all_orders_page_"), admin_filter)
 async def admin_all_orders_pagination(callback: CallbackQuery):
     """Пагинация для всех заказов админа"""
-    page = int(callback.data.split("_")[-1])
-    await admin_all_orders_page(callback, page)
+    from components.pagination import pagination
+    page, backward, cursor = pagination.parse_cursor_callback(callback.data, "admin_all_orders_page")
+    await admin_all_orders_page(callback, page, cursor, backward)
 
 @router.callback_query(F.data == "admin_search_order", admin_filter)
 async def admin_search_order(callback: CallbackQuery, state: FSMContext):
-    """Начать поиск заказа по номеру"""
+    """Начать поиск заказа по номеру или товару"""
     await state.set_state(OrderStates.waiting_order_search)
     try:
         await callback.message.edit_text(
             "🔍 <b>Поиск заказа</b>\n\n"
-            "Введите номер заказа для поиска:",
+            "Введите номер заказа или название товара:",
             reply_markup=InlineKeyboardMarkup(inline_keyboard=[
                 [InlineKeyboardButton(text="🔙 Все заказы", callback_data="admin_all_orders")]
             ]),
@@ -81,20 +82,39 @@ async def admin_search_order(callback: CallbackQuery, state: FSMContext):
         logger.warning(f"Не удалось отредактировать сообщение поиска заказов: {e}")
         await callback.message.answer(
             "🔍 <b>Поиск заказа</b>\n\n"
-            "Введите номер заказа для поиска:",
+            "Введите номер заказа или название товара:",
             reply_markup=InlineKeyboardMarkup(inline_keyboard=[
                 [InlineKeyboardButton(text="🔙 Все заказы", callback_data="admin_all_orders")]
             ]),
             parse_mode='HTML'
         )
 
-async def admin_all_orders_page(callback: CallbackQuery, page: int):
+async def _load_orders_page(status, page: int, cursor: str = None, backward: bool = False):
+    """Страница заказов по курсору и информация о пагинации"""
+    from components.pagination import pagination
+    
+    pagination.items_per_page = 8
+    after_created_at = after_id = None
+    if cursor:
+        after_created_at, after_id = pagination.parse_cursor(cursor)
+    else:
+        page = 1
+    
+    orders = await db.get_orders_page(status, after_created_at, after_id, pagination.items_per_page, backward)
+    counts = await db.get_order_status_counts()
+    total = counts.get(status, 0) if status else sum(counts.values())
+    return pagination.paginate_cursor(
+        orders, page, total,
+        cursor_of=lambda order: pagination.make_cursor(order.created_at, order.id)
+    )
+
+async def admin_all_orders_page(callback: CallbackQuery, page: int, cursor: str = None, backward: bool = False):
     """Отобразить страницу всех заказов"""
     from components.pagination import pagination
     
-    orders = await db.get_all_orders()
+    pagination_info = await _load_orders_page(None, page, cursor, backward)
     
-    if not orders:
+    if not pagination_info['items']:
         text = "📋 <b>Все заказы</b>\n\nЗаказов пока нет."
         
         try:
@@ -116,12 +136,9 @@ async def admin_all_orders_page(callback: CallbackQuery, page: int):
             )
         return
 
-    pagination.items_per_page = 8
-    pagination_info = pagination.paginate(orders, page)
-    
     text = f"📋 <b>Все заказы</b>\n\n"
     text += f"━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━\n"
-    text += f"{_('admin.total_orders', user_id=callback.from_user.id)} <b>{len(orders)}</b>\n"
+    text += f"{_('admin.total_orders', user_id=callback.from_user.id)} <b>{pagination_info['total_items']}</b>\n"
     text += pagination.get_page_info_text(pagination_info, user_id=callback.from_user.id)
     text += f"━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━\n\n"
     
@@ -154,7 +171,7 @@ async def admin_all_orders_page(callback: CallbackQuery, page: int):
             InlineKeyboardButton(text="📦 Доставлены", callback_data="filter_orders_delivered"),
             InlineKeyboardButton(text="❌ Отменены", callback_data="filter_orders_cancelled")
         ],
-        [InlineKeyboardButton(text="🔍 Поиск по номеру", callback_data="admin_search_order")],
+        [InlineKeyboardButton(text="🔍 Поиск заказа", callback_data="admin_search_order")],
         [InlineKeyboardButton(text="🔙 Админ панель", callback_data="admin_panel")]
     ]
 
@@ -194,7 +211,7 @@ async def reject_payment(callback: CallbackQuery, state: FSMContext):
     user_lang = 'ru'
     if user:
         from i18n import i18n
-        user_lang = i18n.get_user_language(order.user_id) or 'ru'
+        user_lang = await i18n.ensure_user_language(order.user_id) or 'ru'
     
     await state.update_data(
         order_id=order_id, 
@@ -266,7 +283,7 @@ async def show_admin_order(callback: CallbackQuery):
     order_time = order.created_at.replace(tzinfo=timezone.utc).astimezone(tbilisi_tz)
     
     from i18n import i18n
-    user_language = i18n.get_user_language(order.user_id)
+    user_language = await i18n.ensure_user_language(order.user_id)
     language_names = {'ru': 'Русский', 'ka': 'ქართული', 'en': 'English'}
     
     order_text = f"""📋 <b>Заказ #{order.order_number}</b>
@@ -345,14 +362,7 @@ async def confirm_payment(callback: CallbackQuery):
     
     # Создаем функцию для выполнения с лоадером
     async def confirm_payment_operation():
-        # Списываем товары со склада при подтверждении платежа
-        try:
-            products = order.products_data
-            for product in products:
-                await db.decrease_product_quantity(product['id'], product['quantity'])
-        except Exception as e:
-            print(f"Error decreasing stock on payment confirmation: {e}")
-        
+        # Товары списываются со склада в той же транзакции, что и смена статуса
         await db.update_order_status(order_id, 'paid')
         return order
     
@@ -399,20 +409,6 @@ async def confirm_payment(callback: CallbackQuery):
     
     await show_admin_order(callback)
 
-@router.message(admin_filter)
-async def debug_all_admin_messages(message: Message, state: FSMContext):
-    """Отладочный обработчик для всех админских сообщений"""
-    current_state = await state.get_state()
-    data = await state.get_data()
-    print("🐛" + "="*50)
-    print(f"🐛 ADMIN MESSAGE INTERCEPTED!")
-    print(f"🐛 User: {message.from_user.id}")
-    print(f"🐛 Text: '{message.text}'")
-    print(f"🐛 Current state: {current_state}")
-    print(f"🐛 State data: {data}")
-    print(f"🐛 Expected state: 'OrderStates:waiting_rejection_reason'")
-    print("🐛" + "="*50)
-
 @router.message(OrderStates.waiting_rejection_reason, admin_filter)
 async def process_rejection_reason(message: Message, state: FSMContext):
     """Обработка причины отклонения платежа"""
@@ -600,15 +596,7 @@ async def admin_cancel_order(callback: CallbackQuery):
         await callback.answer("❌ Заказ не найден", show_alert=True)
         return
     
-    # Возвращаем товары на склад только если заказ был подтвержден (товары были списаны)
-    if order.status in ['paid', 'shipping', 'delivered'] and order.status != 'cancelled':
-        try:
-            products = order.products_data
-            for product in products:
-                await db.increase_product_quantity(product['id'], product['quantity'])
-        except Exception as e:
-            print(f"Error returning products to stock: {e}")
-    
+    # Списанные товары возвращаются на склад внутри update_order_status
     await db.update_order_status(order_id, 'cancelled')
     
     try:
@@ -682,16 +670,8 @@ async def set_order_status(callback: CallbackQuery):
         await callback.answer("❌ Заказ не найден", show_alert=True)
         return
     
-    # Если заказ отменяется, возвращаем товары на склад только если они были списаны
+    # Если заказ отменяется, уведомляем клиента (списанные товары вернет update_order_status)
     if status == 'cancelled' and order.status in ['paid', 'shipping', 'delivered']:
-        try:
-            import json
-            products = order.products_data
-            for product in products:
-                await db.increase_product_quantity(product['id'], product['quantity'])
-        except Exception as e:
-            print(f"Error returning products to stock: {e}")
-        
         # Уведомляем клиента об отмене
         try:
             await callback.message.bot.send_message(
@@ -742,14 +722,7 @@ async def quick_confirm_payment(callback: CallbackQuery):
         await callback.answer("❌ Заказ не найден", show_alert=True)
         return
     
-    # Списываем товары со склада при подтверждении платежа
-    try:
-        products = order.products_data
-        for product in products:
-            await db.decrease_product_quantity(product['id'], product['quantity'])
-    except Exception as e:
-        print(f"Error decreasing stock on quick payment confirmation: {e}")
-    
+    # Товары списываются со склада в той же транзакции, что и смена статуса
     await db.update_order_status(order_id, 'paid')
     
     try:
@@ -838,7 +811,7 @@ async def quick_reject_with_reason(callback: CallbackQuery, state: FSMContext):
     user_lang = 'ru'
     if user:
         from i18n import i18n
-        user_lang = i18n.get_user_language(order.user_id) or 'ru'
+        user_lang = await i18n.ensure_user_language(order.user_id) or 'ru'
     
     await state.update_data(
         order_id=order_id, 
@@ -887,7 +860,7 @@ async def quick_message_client(callback: CallbackQuery, state: FSMContext):
     await state.set_state(CommunicationStates.waiting_client_message)
     
     from i18n import i18n
-    user_language = i18n.get_user_language(order.user_id)
+    user_language = await i18n.ensure_user_language(order.user_id)
     language_names = {'ru': 'Русский', 'ka': 'ქართული', 'en': 'English'}
     
     text = f"""💬 <b>Сообщение клиенту</b>
@@ -906,42 +879,31 @@ async def quick_message_client(callback: CallbackQuery, state: FSMContext):
     await safe_edit_message(callback, text, keyboard)
 
 
-@router.callback_query(F.data.startswith("filter_orders_"), admin_filter)
+# Фильтры списка заказов: тип в callback_data -> (статус, заголовок)
+ORDER_FILTERS = {
+    "pending": ("waiting_payment", "⏳ Ожидающие заказы"),
+    "checking": ("payment_check", "💰 Заказы на проверке"),
+    "paid": ("paid", "✅ Оплаченные заказы"),
+    "shipping": ("shipping", "🚚 Заказы в доставке"),
+    "delivered": ("delivered", "📦 Доставленные заказы"),
+    "cancelled": ("cancelled", "❌ Отмененные заказы"),
+}
+
+@router.callback_query(F.data.regexp(r"^filter_orders_[a-z]+$"), admin_filter)
 async def filter_orders(callback: CallbackQuery):
     """Фильтрация заказов по статусу"""
     filter_type = callback.data.split("_")[2]
     await show_filtered_orders_page(callback, filter_type, 1)
 
-async def show_filtered_orders_page(callback: CallbackQuery, filter_type: str, page: int):
+async def show_filtered_orders_page(callback: CallbackQuery, filter_type: str, page: int,
+                                    cursor: str = None, backward: bool = False):
     """Показать отфильтрованные заказы"""
     from components.pagination import pagination
     
-    all_orders = await db.get_all_orders()
-    
-    # Фильтруем заказы в зависимости от типа
-    if filter_type == "pending":
-        orders = [order for order in all_orders if order.status == "waiting_payment"]
-        title = "⏳ Ожидающие заказы"
-    elif filter_type == "checking":
-        orders = [order for order in all_orders if order.status == "payment_check"]
-        title = "💰 Заказы на проверке"
-    elif filter_type == "paid":
-        orders = [order for order in all_orders if order.status == "paid"]
-        title = "✅ Оплаченные заказы"
-    elif filter_type == "shipping":
-        orders = [order for order in all_orders if order.status == "shipping"]
-        title = "🚚 Заказы в доставке"
-    elif filter_type == "delivered":
-        orders = [order for order in all_orders if order.status == "delivered"]
-        title = "📦 Доставленные заказы"
-    elif filter_type == "cancelled":
-        orders = [order for order in all_orders if order.status == "cancelled"]
-        title = "❌ Отмененные заказы"
-    else:
-        orders = all_orders
-        title = "📋 Все заказы"
+    status, title = ORDER_FILTERS.get(filter_type, (None, "📋 Все заказы"))
+    pagination_info = await _load_orders_page(status, page, cursor, backward)
     
-    if not orders:
+    if not pagination_info['items']:
         text = f"{title}\n\nЗаказов нет."
         keyboard = InlineKeyboardMarkup(inline_keyboard=[
             [InlineKeyboardButton(text="📋 Все заказы", callback_data="admin_all_orders")],
@@ -955,12 +917,9 @@ async def show_filtered_orders_page(callback: CallbackQuery, filter_type: str, p
             await callback.message.answer(text, reply_markup=keyboard, parse_mode='HTML')
         return
     
-    pagination.items_per_page = 8
-    pagination_info = pagination.paginate(orders, page)
-    
     text = f"{title}\n\n"
     text += f"━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━\n"
-    text += f"Найдено заказов: <b>{len(orders)}</b>\n"
+    text += f"Найдено заказов: <b>{pagination_info['total_items']}</b>\n"
     text += pagination.get_page_info_text(pagination_info, user_id=callback.from_user.id)
     text += f"━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━\n\n"
     
@@ -1002,28 +961,62 @@ async def show_filtered_orders_page(callback: CallbackQuery, filter_type: str, p
 @router.callback_query(F.data.startswith("filter_orders_page_"), admin_filter)
 async def filter_orders_pagination(callback: CallbackQuery):
     """Пагинация для отфильтрованных заказов"""
-    parts = callback.data.split("_")
-    filter_type = parts[3]
-    page = int(parts[4])
-    await show_filtered_orders_page(callback, filter_type, page)
+    from components.pagination import pagination
+    filter_type = callback.data.split("_")[3]
+    page, backward, cursor = pagination.parse_cursor_callback(callback.data, f"filter_orders_page_{filter_type}")
+    await show_filtered_orders_page(callback, filter_type, page, cursor, backward)
+
+# Короче триграммы индекс не используется, а совпадений слишком много
+MIN_ITEM_SEARCH_LENGTH = 3
+
+async def _send_item_search_results(message: Message, state: FSMContext, query: str):
+    """Показать заказы, в которых есть товар с названием query"""
+    back_row = [InlineKeyboardButton(text="🔙 Все заказы", callback_data="admin_all_orders")]
+    
+    if len(query) < MIN_ITEM_SEARCH_LENGTH:
+        await message.bot.send_message(
+            chat_id=message.chat.id,
+            text=f"🔍 <b>Ошибка</b>\n\n❌ Введите номер заказа или не меньше {MIN_ITEM_SEARCH_LENGTH} символов названия товара:",
+            reply_markup=InlineKeyboardMarkup(inline_keyboard=[back_row]),
+            parse_mode='HTML'
+        )
+        return
+    
+    from html import escape
+    orders = await db.search_orders_by_item(query)
+    safe_query = escape(query)
+    keyboard = []
+    if not orders:
+        text = f"🔍 <b>Результат поиска</b>\n\n❌ Заказы с товаром «{safe_query}» не найдены\n\nПопробуйте другой запрос:"
+    else:
+        await state.clear()
+        text = f"🔍 <b>Заказы с товаром «{safe_query}»</b>\n\n"
+        text += "Показаны последние заказы, выберите нужный:"
+        for order in orders:
+            status_emoji = "⏳" if order.status == "waiting_payment" else "💰" if order.status == "payment_check" else "✅" if order.status == "paid" else "🚚" if order.status == "shipping" else "📦" if order.status == "delivered" else "❌"
+            keyboard.append([InlineKeyboardButton(
+                text=f"{status_emoji} №{order.order_number} - {order.total_price}₾",
+                callback_data=f"admin_order_{order.id}"
+            )])
+    keyboard.append(back_row)
+    
+    await message.bot.send_message(
+        chat_id=message.chat.id,
+        text=text,
+        reply_markup=InlineKeyboardMarkup(inline_keyboard=keyboard),
+        parse_mode='HTML'
+    )
 
 @router.message(OrderStates.waiting_order_search, admin_filter)
 async def process_order_search(message: Message, state: FSMContext):
-    """Обработка поиска заказа по номеру"""
-    order_number = message.text.strip()
+    """Обработка поиска заказа по номеру или названию товара"""
+    order_number = (message.text or "").strip()
     
     try:
         await message.delete()
         
         if not order_number.isdigit():
-            await message.bot.send_message(
-                chat_id=message.chat.id,
-                text="🔍 <b>Ошибка</b>\n\n❌ Номер заказа должен содержать только цифры\n\nВведите правильный номер заказа:",
-                reply_markup=InlineKeyboardMarkup(inline_keyboard=[
-                    [InlineKeyboardButton(text="🔙 Все заказы", callback_data="admin_all_orders")]
-                ]),
-                parse_mode='HTML'
-            )
+            await _send_item_search_results(message, state, order_number)
             return
         
         order_number_int = int(order_number)
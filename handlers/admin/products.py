@@ -147,7 +147,7 @@ async def delete_product(callback: CallbackQuery):
     
     # Создаем функцию для выполнения с лоадером
     async def delete_product_operation():
-        await db.execute("DELETE FROM products WHERE id = $1", product_id)
+        await db.delete_product(product_id)
         return {
             "text": "✅ Товар удален из каталога!",
             "keyboard": InlineKeyboardMarkup(inline_keyboard=[
@@ -482,7 +482,7 @@ async def process_quantity_input(message: Message, state: FSMContext):
     data = await state.get_data()
     product_id = data.get('product_id')
     
-    await db.execute("UPDATE products SET stock_quantity = $1 WHERE id = $2", quantity, product_id)
+    await db.update_product_quantity(product_id, quantity)
     
     product = await db.get_product(product_id)
     
@@ -19,7 +19,7 @@ async def show_antispam_menu(message: Message):
         text = f"""🛡 <b>Анти-спам система</b>
 
 📊 <b>Статистика:</b>
-• Всего пользователей: {total_users}
+• Активных пользователей: {total_users}
 • Заблокированных: {blocked_count}
 
 ⚙️ <b>Настройки:</b>
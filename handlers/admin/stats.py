@@ -1,8 +1,8 @@
 from aiogram import Router, F
-from aiogram.types import CallbackQuery
+from aiogram.types import CallbackQuery, Message
 from datetime import datetime, timedelta
 
-from database import db
+from database import background_db
 from filters.admin import admin_filter
 from keyboards import get_admin_keyboard
 from utils.safe_operations import safe_edit_message
@@ -12,9 +12,9 @@ router = Router()
 @router.callback_query(F.data == "admin_stats", admin_filter)
 async def show_stats(callback: CallbackQuery):
     """Показать статистику"""
-    all_orders = await db.fetchall("SELECT status FROM orders")
-    users_count = (await db.fetchone("SELECT COUNT(*) FROM users"))[0]
-    products_count = (await db.fetchone("SELECT COUNT(*) FROM products WHERE in_stock = true"))[0]
+    all_orders = await background_db.fetchall("SELECT status FROM orders", query_name='stats_order_statuses')
+    users_count = (await background_db.fetchone("SELECT COUNT(*) FROM users", query_name='stats_users_count'))[0]
+    products_count = (await background_db.fetchone("SELECT COUNT(*) FROM products WHERE in_stock = true", query_name='stats_products_count'))[0]
     
     status_counts = {
         'waiting_payment': 0,
@@ -30,32 +30,35 @@ async def show_stats(callback: CallbackQuery):
         if status in status_counts:
             status_counts[status] += 1
     
-    delivered_orders = await db.fetchall("SELECT total_price FROM orders WHERE status = 'delivered'")
+    delivered_orders = await background_db.fetchall("SELECT total_price FROM orders WHERE status = 'delivered'", query_name='stats_delivered_revenue')
     total_revenue = sum(order[0] for order in delivered_orders)
     
     # Статистика за сегодня
     today = datetime.now().date()
-    today_orders = await db.fetchall(
+    today_orders = await background_db.fetchall(
         "SELECT COUNT(*), SUM(total_price) FROM orders WHERE DATE(created_at) = $1",
-        today
+        today,
+        query_name='stats_orders_today'
     )
     today_count = today_orders[0][0] if today_orders[0][0] else 0
     today_revenue = today_orders[0][1] if today_orders[0][1] else 0
     
     # Статистика за неделю
     week_ago = today - timedelta(days=7)
-    week_orders = await db.fetchall(
+    week_orders = await background_db.fetchall(
         "SELECT COUNT(*), SUM(total_price) FROM orders WHERE DATE(created_at) >= $1",
-        week_ago
+        week_ago,
+        query_name='stats_orders_week'
     )
     week_count = week_orders[0][0] if week_orders[0][0] else 0
     week_revenue = week_orders[0][1] if week_orders[0][1] else 0
     
     # Статистика за месяц
     month_ago = today - timedelta(days=30)
-    month_orders = await db.fetchall(
+    month_orders = await background_db.fetchall(
         "SELECT COUNT(*), SUM(total_price) FROM orders WHERE DATE(created_at) >= $1",
-        month_ago
+        month_ago,
+        query_name='stats_orders_month'
     )
     month_count = month_orders[0][0] if month_orders[0][0] else 0
     month_revenue = month_orders[0][1] if month_orders[0][1] else 0
@@ -92,4 +95,47 @@ async def show_stats(callback: CallbackQuery):
         stats_text,
         reply_markup=get_admin_keyboard(),
         parse_mode='HTML'
-    )
\ No newline at end of file
+    )
+
+@router.message(F.text.in_({"/dbstats", "/dbstats reset"}), admin_filter)
+async def show_query_stats(message: Message):
+    """Показать статистику времени выполнения запросов к БД"""
+    from query_stats import query_stats
+    
+    if message.text == "/dbstats reset":
+        query_stats.reset()
+        await message.answer("🔄 Статистика запросов сброшена")
+        return
+    
+    summary = query_stats.get_summary()
+    if not summary:
+        await message.answer("📋 Запросов пока не было")
+        return
+    
+    uptime_minutes = int((datetime.now().timestamp() - query_stats.started_at) / 60)
+    lines = [f"⏱ <b>Запросы к БД</b> (за {uptime_minutes} мин, по p95)\n"]
+    for item in summary:
+        lines.append(
+            f"<code>{item['name']}</code>\n"
+            f"• {item['count']} выз., {item['rows']} строк\n"
+            f"• p50 {item['p50']:.1f} / p95 {item['p95']:.1f} / p99 {item['p99']:.1f} / max {item['max']:.1f} мс"
+        )
+    lines.append("\n/dbstats reset - сбросить")
+    
+    await message.answer("\n".join(lines), parse_mode='HTML')
+
+@router.message(F.text == "/reload_translations", admin_filter)
+async def reload_translations(message: Message):
+    """Перечитать файлы переводов без перезапуска бота"""
+    from i18n import i18n
+    
+    from pages.base import render_cache
+    
+    errors = await i18n.reload_translations()
+    if errors:
+        await message.answer("❌ Переводы не обновлены:\n" + "\n".join(errors))
+        return
+    render_cache.invalidate()  # Старые записи и так недостижимы (версия переводов), освобождаем память
+    
+    languages = ", ".join(sorted(i18n.get_available_languages()))
+    await message.answer(f"✅ Переводы перезагружены ({languages})")
@@ -523,7 +523,8 @@ async def cancel_quantity_input(callback: CallbackQuery, state: FSMContext):
         cart_text,
         reply_markup=keyboard,
         menu_state='cart',
-        force_new=True  # Создаем новое сообщение чтобы избежать дубликатов
+        force_new=True,  # Создаем новое сообщение чтобы избежать дубликатов
+        from_callback=True
     )
 
 
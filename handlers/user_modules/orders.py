@@ -104,7 +104,7 @@ async def orders_search_start(callback: CallbackQuery, state: FSMContext):
     try:
         await callback.message.edit_text(
             "🔍 <b>Поиск заказов</b>\n\n"
-            "Введите номер заказа для поиска:",
+            "Введите номер заказа или название товара:",
             reply_markup=InlineKeyboardMarkup(inline_keyboard=[
                 [InlineKeyboardButton(text="❌ Отменить", callback_data="my_orders")]
             ])
@@ -113,7 +113,7 @@ async def orders_search_start(callback: CallbackQuery, state: FSMContext):
         logger.warning(f"Не удалось отредактировать сообщение поиска заказов: {e}")
         await callback.message.answer(
             "🔍 <b>Поиск заказов</b>\n\n"
-            "Введите номер заказа для поиска:",
+            "Введите номер заказа или название товара:",
             reply_markup=InlineKeyboardMarkup(inline_keyboard=[
                 [InlineKeyboardButton(text="❌ Отменить", callback_data="my_orders")]
             ])
@@ -2,75 +2,167 @@
 """
 Система интернационализации (i18n) для бота
 """
+import asyncio
 import json
 import os
-from typing import Dict, Any
+from collections import OrderedDict
+from typing import Dict, Any, Callable, FrozenSet, List, Tuple, Union
+
+TRANSLATIONS_DIR = "translations"
+
+# Скомпилированный перевод: готовая строка или подготовленный форматтер шаблона
+CompiledTranslation = Union[str, Callable[[dict], str]]
+
+
+def _flatten(tree: Dict[str, Any], prefix: str = "", flat: Dict[str, Any] = None) -> Dict[str, Any]:
+    """Развернуть вложенные переводы в словарь "полный.ключ" -> значение"""
+    if flat is None:
+        flat = {}
+    for name, value in tree.items():
+        key = prefix + name
+        flat[key] = value
+        if isinstance(value, dict):
+            _flatten(value, key + ".", flat)
+    return flat
+
+
+def _compile_translation(value: Any) -> CompiledTranslation:
+    """Строки без подстановок хранятся как есть, шаблоны - как format_map"""
+    if not isinstance(value, str):
+        return str(value)
+    if "{" not in value and "}" not in value:
+        return value
+    return value.format_map
+
+
+def _read_translations(translations_dir: str) -> Tuple[Dict[str, Dict[str, Any]], List[str]]:
+    """Прочитать все JSON файлы переводов: (language -> дерево, ошибки)"""
+    translations = {}
+    errors = []
+    for filename in os.listdir(translations_dir):
+        if filename.endswith('.json'):
+            language = filename[:-5]  # убираем .json
+            filepath = os.path.join(translations_dir, filename)
+            
+            try:
+                with open(filepath, 'r', encoding='utf-8') as f:
+                    translations[language] = json.load(f)
+            except Exception as e:
+                errors.append(f"Ошибка загрузки переводов для {language}: {e}")
+    return translations, errors
+
+
+class UserLanguageCache:
+    """LRU-кэш языков пользователей ограниченного размера"""
+
+    def __init__(self, maxsize: int):
+        self.maxsize = maxsize
+        self._languages: "OrderedDict[int, str]" = OrderedDict()
+
+    def get(self, user_id: int, default: str = None) -> str:
+        language = self._languages.get(user_id)
+        if language is None:
+            return default
+        self._languages.move_to_end(user_id)
+        return language
+
+    def __setitem__(self, user_id: int, language: str):
+        self._languages[user_id] = language
+        self._languages.move_to_end(user_id)
+        if len(self._languages) > self.maxsize:
+            self._languages.popitem(last=False)
+
+    def __contains__(self, user_id: int) -> bool:
+        return user_id in self._languages
+
+    def __len__(self) -> int:
+        return len(self._languages)
+
 
 class I18n:
     def __init__(self, default_language: str = "ru"):
         self.default_language = default_language
         self.translations: Dict[str, Dict[str, Any]] = {}
         self.current_language = default_language
-        self.user_languages: Dict[int, str] = {}  # user_id -> language
+        # user_id -> language, заполняется по мере обращений пользователей
+        from config import USER_LANGUAGE_CACHE_SIZE
+        self.user_languages = UserLanguageCache(USER_LANGUAGE_CACHE_SIZE)
+        # language -> {"полный.ключ": перевод} с уже подставленным запасным языком
+        self.catalog: Dict[str, Dict[str, CompiledTranslation]] = {}
+        # Текст перевода на любом языке -> ключи, у которых он такой (для кнопок)
+        self.text_index: Dict[str, FrozenSet[str]] = {}
+        # Растет при каждой подмене переводов (для кэшей, собранных из них)
+        self.version = 0
         self.load_translations()
     
     def load_translations(self):
         """Загрузить переводы из файлов"""
-        translations_dir = "translations"
-        
-        if not os.path.exists(translations_dir):
-            os.makedirs(translations_dir)
+        if not os.path.exists(TRANSLATIONS_DIR):
+            os.makedirs(TRANSLATIONS_DIR)
         
-        # Просто проверяем существование директории
-        if not os.path.exists(translations_dir):
-            print(f"Внимание: Директория {translations_dir} не найдена. Создайте JSON файлы переводов.")
-            return
+        translations, errors = _read_translations(TRANSLATIONS_DIR)
+        for error in errors:
+            print(error)
+        self._apply(translations)
+    
+    async def reload_translations(self) -> List[str]:
+        """Перечитать файлы переводов без перезапуска; возвращает список ошибок
         
-        # Загружаем все файлы переводов
-        for filename in os.listdir(translations_dir):
-            if filename.endswith('.json'):
-                language = filename[:-5]  # убираем .json
-                filepath = os.path.join(translations_dir, filename)
-                
-                try:
-                    with open(filepath, 'r', encoding='utf-8') as f:
-                        self.translations[language] = json.load(f)
-                except Exception as e:
-                    print(f"Ошибка загрузки переводов для {language}: {e}")
+        Чтение и компиляция идут в отдельном потоке, затем новые каталоги
+        подменяются целиком. При любой ошибке остаются прежние переводы.
+        """
+        translations, errors = await asyncio.to_thread(_read_translations, TRANSLATIONS_DIR)
+        if not errors and self.default_language not in translations:
+            errors.append(f"Нет файла переводов языка по умолчанию ({self.default_language}.json)")
+        if errors:
+            return errors
+        compiled = await asyncio.to_thread(self.compile_catalog, translations)
+        self._apply(translations, compiled)
+        return []
     
+    def _apply(self, translations: Dict[str, Dict[str, Any]], compiled=None):
+        """Подменить переводы и собранные из них каталоги (без await между присваиваниями)"""
+        catalog, text_index = compiled or self.compile_catalog(translations)
+        self.translations = translations
+        self.catalog = catalog
+        self.text_index = text_index
+        self.version += 1
+    
+    def compile_catalog(self, translations: Dict[str, Dict[str, Any]]
+                        ) -> Tuple[Dict[str, Dict[str, CompiledTranslation]], Dict[str, FrozenSet[str]]]:
+        """Собрать плоские каталоги переводов для всех языков и индекс текстов кнопок"""
+        default_flat = _flatten(translations.get(self.default_language, {}))
+        catalog = {}
+        text_keys: Dict[str, set] = {}
+        for language, tree in translations.items():
+            own_flat = _flatten(tree)
+            for key, value in own_flat.items():
+                if value and isinstance(value, str):
+                    text_keys.setdefault(value, set()).add(key)
+            flat = dict(default_flat)
+            flat.update(own_flat)
+            catalog[language] = {key: _compile_translation(value) for key, value in flat.items()}
+        return catalog, {text: frozenset(keys) for text, keys in text_keys.items()}
     
     def t(self, key: str, user_id: int = None, **kwargs) -> str:
         """Получить перевод по ключу для конкретного пользователя"""
         # Определяем язык для пользователя
         language = self.current_language
-        if user_id and user_id in self.user_languages:
-            language = self.user_languages[user_id]
-        
-        keys = key.split('.')
-        translation = self.translations.get(language, {})
-        
-        # Ищем перевод по вложенным ключам
-        for k in keys:
-            if isinstance(translation, dict) and k in translation:
-                translation = translation[k]
-            else:
-                # Если перевод не найден, используем русский
-                translation = self.translations.get(self.default_language, {})
-                for k in keys:
-                    if isinstance(translation, dict) and k in translation:
-                        translation = translation[k]
-                    else:
-                        return key  # Возвращаем ключ, если перевод не найден
-                break
+        if user_id:
+            language = self.user_languages.get(user_id, language)
         
-        # Если это строка, форматируем её
-        if isinstance(translation, str):
-            try:
-                return translation.format(**kwargs)
-            except KeyError:
-                return translation
+        catalog = self.catalog.get(language) or self.catalog.get(self.default_language, {})
+        translation = catalog.get(key)
+        if translation is None:
+            return key  # Возвращаем ключ, если перевод не найден
+        if type(translation) is str:
+            return translation
         
-        return str(translation)
+        # Шаблон с подстановками
+        try:
+            return translation(kwargs)
+        except KeyError:
+            return translation.__self__
     
     def set_language(self, language: str, user_id: int = None):
         """Установить язык для пользователя или глобально"""
@@ -81,16 +173,26 @@ class I18n:
             else:
                 self.current_language = language
     
-    async def load_user_languages_from_db(self):
-        """Загрузить языки пользователей из базы данных"""
+    async def ensure_user_language(self, user_id: int) -> str:
+        """Язык пользователя; при промахе кэша загружается из базы данных"""
+        language = self.user_languages.get(user_id)
+        if language is not None:
+            return language
+        language = self.default_language
         try:
             from database import db
-            users_data = await db.fetchall("SELECT user_id, language_code FROM users WHERE language_code IS NOT NULL")
-            for user_id, language_code in users_data:
-                if language_code and language_code in self.translations:
-                    self.user_languages[user_id] = language_code
+            language_code = await db.get_user_language(user_id)
+            if language_code and language_code in self.translations:
+                language = language_code
         except Exception as e:
-            print(f"Ошибка загрузки языков пользователей: {e}")
+            print(f"Ошибка загрузки языка пользователя {user_id}: {e}")
+            return language
+        # Пока шел запрос, язык мог быть сохранен сменой языка - он важнее
+        cached = self.user_languages.get(user_id)
+        if cached is not None:
+            return cached
+        self.user_languages[user_id] = language
+        return language
     
     def get_user_language(self, user_id: int) -> str:
         """Получить язык пользователя"""
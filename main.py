@@ -21,13 +21,13 @@ from aiohttp import web, ClientSession
 import os
 
 from config import BOT_TOKEN, ADMIN_IDS
-from database import db, init_db
+from database import db, background_db, init_db
 from keyboards import get_main_menu, get_main_menu_inline
 from handlers.user import router as user_router
 from handlers.admin import admin_router
 from admin_management import router as admin_management_router
 from i18n import _
-from middleware import AntiSpamMiddleware
+from middleware import AntiSpamMiddleware, UserLanguageMiddleware, MessageContentMiddleware
 from anti_spam import anti_spam
 from reservation_scheduler import reservation_scheduler
 from notifications import init_notification_system
@@ -47,6 +47,11 @@ anti_spam.set_admin_ids(ADMIN_IDS)
 # Подключение middleware
 dp.message.middleware(AntiSpamMiddleware())
 dp.callback_query.middleware(AntiSpamMiddleware())
+# Язык пользователя подгружается в кэш при первом обращении
+dp.message.middleware(UserLanguageMiddleware())
+dp.callback_query.middleware(UserLanguageMiddleware())
+# Правки сообщений в обход MessageManager сбрасывают запомненное им содержимое
+bot.session.middleware(MessageContentMiddleware())
 
 # Создаем отдельный роутер для отладки
 debug_router = Router()
@@ -316,6 +321,7 @@ async def shutdown_handler():
         pass
     try:
         await db.close_pool()
+        await background_db.close_pool()
     except:
         pass
     try:
@@ -338,6 +344,8 @@ async def main():
         kill_other_bot_instances()
         logger.info("Инициализация базы данных...")
         await init_db()
+        # Открываем соединения пула заранее, до первых запросов пользователей
+        await db.init_pool()
         
         # Синхронизируем админов из БД
         logger.info("Синхронизация администраторов...")
@@ -348,15 +356,14 @@ async def main():
                 ADMIN_IDS.append(admin_id)
                 logger.info(f"Добавлен админ из БД: {admin_id}")
         
-        # Загружаем языки пользователей
-        logger.info("Загрузка языков пользователей...")
-        from i18n import i18n
-        await i18n.load_user_languages_from_db()
-        
         # Инициализируем систему уведомлений
         logger.info("Инициализация системы уведомлений...")
         init_notification_system(bot)
         
+        # Продолжаем рассылки, прерванные перезапуском
+        from broadcast import broadcast_engine
+        await broadcast_engine.resume_jobs(bot)
+        
         # Запускаем планировщик резервирования
         logger.info("Запуск планировщика резервирования товаров...")
         await reservation_scheduler.start()
@@ -9,21 +9,47 @@ from aiogram.exceptions import TelegramBadRequest
 
 logger = logging.getLogger(__name__)
 
+
+class EditFailure:
+    """Причины, по которым Telegram отклоняет редактирование сообщения"""
+    NOT_MODIFIED = 'not_modified'  # Содержимое не изменилось - сообщение уже актуально
+    NOT_FOUND = 'not_found'        # Сообщения больше нет - удалять нечего
+    OTHER = 'other'                # Нельзя отредактировать (фото, старое сообщение и т.п.)
+
+
+def classify_edit_error(error: TelegramBadRequest) -> str:
+    """Определить причину отказа в редактировании по тексту ошибки Telegram"""
+    message = str(error).lower()
+    if 'message is not modified' in message:
+        return EditFailure.NOT_MODIFIED
+    if 'message to edit not found' in message:
+        return EditFailure.NOT_FOUND
+    return EditFailure.OTHER
+
+
+def content_hash(text: str, reply_markup=None, parse_mode: str = None, photo: str = None) -> int:
+    """Хэш содержимого сообщения (текст, клавиатура, режим разметки, фото)"""
+    markup = reply_markup.model_dump_json(exclude_none=True) if reply_markup is not None else None
+    return hash((text, markup, parse_mode, photo))
+
+
 class MessageManager:
     """Управляет сообщениями пользователей для предотвращения накопления"""
     
     def __init__(self):
         # Словарь для хранения ID последних сообщений пользователей
-        # user_id -> {'last_message_id': int, 'menu_state': str, 'message_history': [int]}
+        # user_id -> {'last_message_id': int, 'menu_state': str, 'message_history': [int],
+        #             'content_hash': хэш отправленного содержимого или None, если оно неизвестно}
         self.user_messages: Dict[int, Dict] = {}
         
-    def set_user_message(self, user_id: int, message_id: int, menu_state: str = 'main'):
+    def set_user_message(self, user_id: int, message_id: int, menu_state: str = 'main', content_hash: Optional[int] = None):
         """Сохранить ID последнего сообщения пользователя"""
         if user_id not in self.user_messages:
             self.user_messages[user_id] = {
                 'last_message_id': message_id,
                 'menu_state': menu_state,
-                'message_history': [message_id]
+                'message_history': [message_id],
+                'content_hash': content_hash
             }
         else:
             # Добавляем в историю и обновляем последнее сообщение
@@ -35,7 +61,8 @@ class MessageManager:
             self.user_messages[user_id].update({
                 'last_message_id': message_id,
                 'menu_state': menu_state,
-                'message_history': history
+                'message_history': history,
+                'content_hash': content_hash
             })
         logger.debug(f"Сохранено сообщение {message_id} для пользователя {user_id}, состояние: {menu_state}")
     
@@ -43,6 +70,20 @@ class MessageManager:
         """Получить информацию о последнем сообщении пользователя"""
         return self.user_messages.get(user_id)
     
+    def is_current_message(self, user_id: int, message_id: int) -> bool:
+        """Является ли сообщение последним отслеживаемым сообщением пользователя"""
+        user_info = self.user_messages.get(user_id)
+        return bool(user_info) and user_info['last_message_id'] == message_id
+    
+    def forget_content(self, user_id: int, message_id: Optional[int] = None):
+        """Забыть содержимое последнего сообщения (его отредактировали или удалили)
+        
+        message_id - затронутое сообщение; другие сообщения на хэш не влияют
+        """
+        user_info = self.user_messages.get(user_id)
+        if user_info and (message_id is None or user_info['last_message_id'] == message_id):
+            user_info['content_hash'] = None
+    
     def clear_user_message(self, user_id: int):
         """Очистить информацию о сообщениях пользователя"""
         if user_id in self.user_messages:
@@ -96,7 +137,8 @@ class MessageManager:
         menu_state: str = 'main',
         force_new: bool = False,
         send_reply_keyboard: bool = False,
-        photo: str = None
+        photo: str = None,
+        from_callback: bool = False
     ) -> Message:
         """
         Отправить новое сообщение или отредактировать существующее
@@ -109,8 +151,11 @@ class MessageManager:
             parse_mode: Режим парсинга
             menu_state: Состояние меню
             force_new: Принудительно создать новое сообщение
+            from_callback: Вызов из обработчика callback на отслеживаемом сообщении
+                (оно точно существует, поэтому неизменное содержимое можно не отправлять)
         """
         user_info = self.get_user_message(user_id)
+        new_hash = content_hash(text, reply_markup, parse_mode, photo)
         
         # Если принудительно создаем новое или нет предыдущего сообщения
         if force_new or not user_info:
@@ -139,10 +184,20 @@ class MessageManager:
                     reply_markup=reply_markup or keyboard_markup,
                     parse_mode=parse_mode
                 )
-            self.set_user_message(user_id, message.message_id, menu_state)
+            self.set_user_message(user_id, message.message_id, menu_state, new_hash)
             logger.debug(f"Отправлено новое сообщение {message.message_id} пользователю {user_id}")
             return message
         
+        # Сообщение уже показывает то же самое - запрос в Telegram не нужен. Вне callback
+        # пользователь мог удалить сообщение или очистить чат, поэтому там пробуем
+        # редактировать всегда (при ошибке сообщение будет отправлено заново)
+        if not from_callback:
+            user_info['content_hash'] = None
+        elif user_info.get('content_hash') == new_hash:
+            user_info['menu_state'] = menu_state
+            logger.debug(f"Сообщение {user_info['last_message_id']} пользователя {user_id} не изменилось, редактирование пропущено")
+            return None
+        
         # Пытаемся отредактировать существующее сообщение
         try:
             await bot.edit_message_text(
@@ -154,15 +209,25 @@ class MessageManager:
             )
             # Обновляем состояние меню
             user_info['menu_state'] = menu_state
-            
+            user_info['content_hash'] = new_hash
             
             logger.debug(f"Отредактировано сообщение {user_info['last_message_id']} пользователя {user_id}")
             return None  # Возвращаем None для отредактированного сообщения
         except TelegramBadRequest as e:
-            logger.warning(f"Не удалось отредактировать сообщение пользователя {user_id}: {e}")
+            failure = classify_edit_error(e)
+            if failure == EditFailure.NOT_MODIFIED:
+                # Сообщение уже в нужном виде
+                user_info['menu_state'] = menu_state
+                user_info['content_hash'] = new_hash
+                return None
             
-            # Если не удалось отредактировать, удаляем старое и создаем новое
-            await self.delete_user_message(bot, user_id)
+            if failure == EditFailure.NOT_FOUND:
+                # Сообщение уже удалено - просто отправляем новое
+                self.clear_user_message(user_id)
+            else:
+                logger.warning(f"Не удалось отредактировать сообщение пользователя {user_id}: {e}")
+                # Если не удалось отредактировать, удаляем старое и создаем новое
+                await self.delete_user_message(bot, user_id)
             
             # Получаем нижнюю клавиатуру если нужно
             keyboard_markup = None
@@ -185,7 +250,7 @@ class MessageManager:
                     reply_markup=reply_markup or keyboard_markup,
                     parse_mode=parse_mode
                 )
-            self.set_user_message(user_id, message.message_id, menu_state)
+            self.set_user_message(user_id, message.message_id, menu_state, new_hash)
             logger.debug(f"Создано новое сообщение {message.message_id} после неудачного редактирования для пользователя {user_id}")
             return message
     
@@ -247,7 +312,8 @@ class MessageManager:
                 reply_markup=reply_markup or keyboard_markup,
                 parse_mode=parse_mode
             )
-        self.set_user_message(user_id, message.message_id, menu_state)
+        self.set_user_message(user_id, message.message_id, menu_state,
+                              content_hash(text, reply_markup, parse_mode, photo))
         logger.debug(f"Callback навигация: создано новое сообщение {message.message_id} с нижней клавиатурой")
     
     def get_user_menu_state(self, user_id: int) -> str:
@@ -3,14 +3,23 @@ Middleware для защиты от спама
 """
 from typing import Callable, Dict, Any, Awaitable
 from aiogram import BaseMiddleware
+from aiogram.client.session.middlewares.base import BaseRequestMiddleware
+from aiogram.methods import (
+    DeleteMessage, EditMessageCaption, EditMessageMedia, EditMessageReplyMarkup, EditMessageText
+)
 from aiogram.types import Message, CallbackQuery, TelegramObject
 import logging
 import asyncio
 
 from anti_spam import anti_spam
+from i18n import i18n
+from message_manager import message_manager
 
 logger = logging.getLogger(__name__)
 
+# Запросы, меняющие уже отправленное сообщение
+_MESSAGE_CHANGING_METHODS = (EditMessageText, EditMessageCaption, EditMessageMedia, EditMessageReplyMarkup, DeleteMessage)
+
 class AntiSpamMiddleware(BaseMiddleware):
     """Middleware для защиты от спама"""
     
@@ -86,6 +95,32 @@ class AntiSpamMiddleware(BaseMiddleware):
         except Exception as e:
             logger.debug(f"Не удалось удалить спам-сообщение: {e}")
 
+class UserLanguageMiddleware(BaseMiddleware):
+    """Middleware, подгружающее язык пользователя в кэш i18n перед обработчиком"""
+    
+    async def __call__(
+        self,
+        handler: Callable[[TelegramObject, Dict[str, Any]], Awaitable[Any]],
+        event: TelegramObject,
+        data: Dict[str, Any]
+    ) -> Any:
+        user = getattr(event, 'from_user', None)
+        if user and user.id not in i18n.user_languages:
+            await i18n.ensure_user_language(user.id)
+        
+        return await handler(event, data)
+
+class MessageContentMiddleware(BaseRequestMiddleware):
+    """Middleware запросов бота: правка или удаление сообщения делает запомненное
+    MessageManager содержимое недостоверным. Собственные правки менеджер
+    запоминает заново после успешного запроса."""
+    
+    async def __call__(self, make_request, bot, method):
+        if isinstance(method, _MESSAGE_CHANGING_METHODS) and isinstance(method.chat_id, int) and method.message_id:
+            message_manager.forget_content(method.chat_id, method.message_id)
+        
+        return await make_request(bot, method)
+
 class AdminOnlyMiddleware(BaseMiddleware):
     """Middleware для ограничения доступа только администраторам"""
     
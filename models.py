@@ -83,6 +83,15 @@ class Order(NamedTuple):
         return json.loads(self.products)
 
 
+class OrderItem(NamedTuple):
+    """Позиция заказа (таблица order_items)"""
+    order_id: int
+    product_id: int
+    product_name: str
+    price: Decimal
+    quantity: int
+
+
 class OrderStatus(Enum):
     """Статусы заказов"""
     PENDING = 'pending'
@@ -10,6 +10,9 @@ from typing import Dict, Any
 
 logger = logging.getLogger(__name__)
 
+# Сколько уведомлений отправлять одновременно при массовой смене статусов
+NOTIFICATION_CONCURRENCY = 5
+
 class OrderNotificationSystem:
     """Система уведомлений о заказах"""
     
@@ -43,82 +46,115 @@ class OrderNotificationSystem:
             if old_status == new_status:
                 return
             
-            status_emoji = self._status_emojis.get(new_status, '❓')
-            status_text = self._status_texts.get(new_status, new_status)
+            message_text, keyboard = self._build_status_message(order.id, order.order_number, new_status)
+            
+            # Отправляем уведомление
+            await self.bot.send_message(
+                chat_id=order.user_id,
+                text=message_text,
+                reply_markup=keyboard,
+                parse_mode='HTML'
+            )
+            
+            logger.info(f"Отправлено уведомление пользователю {order.user_id} об изменении статуса заказа #{order.order_number}: {old_status} -> {new_status}")
             
-            # Формируем сообщение в зависимости от статуса
-            if new_status == 'payment_check':
-                message_text = f"""📋 <b>Обновление заказа #{order.order_number}</b>
+        except Exception as e:
+            logger.error(f"Ошибка отправки уведомления об изменении статуса заказа {order_id}: {e}")
+    
+    async def notify_status_changes(self, orders, old_status: str, new_status: str):
+        """Уведомить пользователей об изменении статуса нескольких заказов
+        
+        orders: записи с полями id, order_number, user_id (например, из UPDATE ... RETURNING).
+        Отправка идет параллельно, не более NOTIFICATION_CONCURRENCY сообщений одновременно.
+        """
+        if old_status == new_status or not orders:
+            return
+        
+        semaphore = asyncio.Semaphore(NOTIFICATION_CONCURRENCY)
+        
+        async def send(order):
+            async with semaphore:
+                try:
+                    message_text, keyboard = self._build_status_message(order['id'], order['order_number'], new_status)
+                    await self.bot.send_message(
+                        chat_id=order['user_id'],
+                        text=message_text,
+                        reply_markup=keyboard,
+                        parse_mode='HTML'
+                    )
+                except Exception as e:
+                    logger.error(f"Ошибка отправки уведомления об изменении статуса заказа #{order['order_number']}: {e}")
+        
+        await asyncio.gather(*(send(order) for order in orders))
+        logger.info(f"Отправлены уведомления о смене статуса {old_status} -> {new_status} для {len(orders)} заказов")
+    
+    def _build_status_message(self, order_id: int, order_number: int, new_status: str):
+        """Текст и клавиатура уведомления о новом статусе заказа"""
+        status_emoji = self._status_emojis.get(new_status, '❓')
+        status_text = self._status_texts.get(new_status, new_status)
+        
+        # Формируем сообщение в зависимости от статуса
+        if new_status == 'payment_check':
+            message_text = f"""📋 <b>Обновление заказа #{order_number}</b>
 
 {status_emoji} <b>Статус изменен:</b> {status_text}
 
 Ваш скриншот оплаты получен и проверяется администратором. Ожидайте подтверждения."""
-                
-            elif new_status == 'paid':
-                message_text = f"""📋 <b>Заказ #{order.order_number} оплачен!</b>
+            
+        elif new_status == 'paid':
+            message_text = f"""📋 <b>Заказ #{order_number} оплачен!</b>
 
 {status_emoji} <b>Статус:</b> {status_text}
 
 Ваш заказ подтвержден и передан в обработку. Скоро мы свяжемся с вами для уточнения деталей доставки."""
-                
-            elif new_status == 'shipping':
-                message_text = f"""📋 <b>Заказ #{order.order_number} отправлен!</b>
+            
+        elif new_status == 'shipping':
+            message_text = f"""📋 <b>Заказ #{order_number} отправлен!</b>
 
 {status_emoji} <b>Статус:</b> {status_text}
 
 Ваш заказ отправлен и уже в пути. Ожидайте доставки по указанному адресу."""
-                
-            elif new_status == 'delivered':
-                message_text = f"""📋 <b>Заказ #{order.order_number} доставлен!</b>
+            
+        elif new_status == 'delivered':
+            message_text = f"""📋 <b>Заказ #{order_number} доставлен!</b>
 
 {status_emoji} <b>Статус:</b> {status_text}
 
 Спасибо за покупку! Надеемся, вы остались довольны нашим сервисом. 
 
 Будем рады видеть вас снова! ❤️"""
-                
-            elif new_status == 'cancelled':
-                message_text = f"""📋 <b>Заказ #{order.order_number} отменен</b>
+            
+        elif new_status == 'cancelled':
+            message_text = f"""📋 <b>Заказ #{order_number} отменен</b>
 
 {status_emoji} <b>Статус:</b> {status_text}
 
 К сожалению, ваш заказ был отменен. Если у вас есть вопросы, обратитесь к нашей поддержке."""
-                
-            else:
-                message_text = f"""📋 <b>Обновление заказа #{order.order_number}</b>
+            
+        else:
+            message_text = f"""📋 <b>Обновление заказа #{order_number}</b>
 
 {status_emoji} <b>Статус изменен:</b> {status_text}"""
-            
-            # Кнопки для взаимодействия
-            keyboard = InlineKeyboardMarkup(inline_keyboard=[
-                [InlineKeyboardButton(text="📋 Посмотреть заказ", callback_data=f"order_{order.id}")],
-                [InlineKeyboardButton(text="📦 Мои заказы", callback_data="my_orders")]
+        
+        # Кнопки для взаимодействия
+        keyboard = InlineKeyboardMarkup(inline_keyboard=[
+            [InlineKeyboardButton(text="📋 Посмотреть заказ", callback_data=f"order_{order_id}")],
+            [InlineKeyboardButton(text="📦 Мои заказы", callback_data="my_orders")]
+        ])
+        
+        # Добавляем дополнительные кнопки в зависимости от статуса
+        if new_status == 'delivered':
+            # Предлагаем повторить заказ
+            keyboard.inline_keyboard.insert(-1, [
+                InlineKeyboardButton(text="🔄 Повторить заказ", callback_data=f"repeat_order_{order_id}")
             ])
-            
-            # Добавляем дополнительные кнопки в зависимости от статуса
-            if new_status == 'delivered':
-                # Предлагаем повторить заказ
-                keyboard.inline_keyboard.insert(-1, [
-                    InlineKeyboardButton(text="🔄 Повторить заказ", callback_data=f"repeat_order_{order.id}")
-                ])
-            elif new_status == 'cancelled':
-                # Предлагаем перейти в каталог
-                keyboard.inline_keyboard.insert(-1, [
-                    InlineKeyboardButton(text="🛍️ Каталог товаров", callback_data="catalog")
-                ])
-            
-            # Отправляем уведомление
-            await self.bot.send_message(
-                chat_id=order.user_id,
-                text=message_text,
-                reply_markup=keyboard,
-                parse_mode='HTML'
-            )
-            
-            logger.info(f"Отправлено уведомление пользователю {order.user_id} об изменении статуса заказа #{order.order_number}: {old_status} -> {new_status}")
-            
-        except Exception as e:
-            logger.error(f"Ошибка отправки уведомления об изменении статуса заказа {order_id}: {e}")
+        elif new_status == 'cancelled':
+            # Предлагаем перейти в каталог
+            keyboard.inline_keyboard.insert(-1, [
+                InlineKeyboardButton(text="🛍️ Каталог товаров", callback_data="catalog")
+            ])
+        
+        return message_text, keyboard
     
     async def notify_reservation_expiring(self, order_id: int, minutes_left: int):
         """Уведомить об истечении резерва товаров"""
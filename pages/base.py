@@ -3,18 +3,72 @@
 Обеспечивает единообразный интерфейс и общую функциональность.
 """
 
+import time
 from abc import ABC, abstractmethod
-from typing import Optional, Dict, Any
+from collections import OrderedDict
+from typing import Optional, Dict, Any, Tuple
 from aiogram.types import InlineKeyboardMarkup, Message, CallbackQuery
 from aiogram import Bot
 
+from catalog_cache import catalog_cache
+from config import RENDER_CACHE_SIZE
 from message_manager import message_manager
-from i18n import _
+from i18n import _, i18n
+
+
+class RenderCache:
+    """LRU-кэш результатов render() статичных страниц
+    
+    Ключ включает страницу, аргументы, язык, версию каталога и версию
+    переводов, поэтому изменения в админке и /reload_translations сами делают
+    старые записи недостижимыми; invalidate() сбрасывает их явно.
+    """
+    
+    def __init__(self, max_size: int):
+        self.max_size = max_size
+        self._entries: "OrderedDict[Tuple, Tuple[float, Dict[str, Any]]]" = OrderedDict()
+    
+    def get(self, key: Tuple) -> Optional[Dict[str, Any]]:
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        expires_at, page_data = entry
+        if time.monotonic() >= expires_at:
+            del self._entries[key]
+            return None
+        self._entries.move_to_end(key)
+        return page_data
+    
+    def store(self, key: Tuple, page_data: Dict[str, Any], ttl: float):
+        self._entries[key] = (time.monotonic() + ttl, page_data)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_size:
+            self._entries.popitem(last=False)
+    
+    def invalidate(self, page_name: Optional[str] = None):
+        """Сбросить записи страницы или весь кэш"""
+        if page_name is None:
+            self._entries.clear()
+            return
+        for key in [key for key in self._entries if key[0] == page_name]:
+            del self._entries[key]
+    
+    def __len__(self) -> int:
+        return len(self._entries)
+
+
+# Глобальный кэш отрисованных страниц
+render_cache = RenderCache(RENDER_CACHE_SIZE)
 
 
 class BasePage(ABC):
     """Базовый класс для всех страниц"""
     
+    # Сколько секунд хранить результат render(); 0 - страница не кэшируется.
+    # Включать только для страниц, которые зависят лишь от аргументов, языка
+    # и каталога (не от корзины, заказов или профиля пользователя).
+    render_cache_ttl: float = 0
+    
     def __init__(self, page_name: str):
         self.page_name = page_name
         self.menu_state = page_name
@@ -27,9 +81,35 @@ class BasePage(ABC):
         """
         pass
     
+    def is_render_cacheable(self, **kwargs) -> bool:
+        """Можно ли взять render() с такими аргументами из кэша"""
+        return self.render_cache_ttl > 0
+    
+    async def render_cached(self, user_id: int, **kwargs) -> Dict[str, Any]:
+        """render() через кэш, если страница его включила"""
+        if not self.is_render_cacheable(**kwargs):
+            return await self.render(user_id, **kwargs)
+        
+        # Язык определяется так же, как в i18n.t
+        language = i18n.user_languages.get(user_id, i18n.current_language)
+        key = (self.page_name, tuple(sorted(kwargs.items())), language, catalog_cache.version, i18n.version)
+        try:
+            page_data = render_cache.get(key)
+        except TypeError:  # Нехешируемые аргументы
+            return await self.render(user_id, **kwargs)
+        
+        if page_data is None:
+            page_data = await self.render(user_id, **kwargs)
+            render_cache.store(key, page_data, self.render_cache_ttl)
+        return page_data
+    
+    def invalidate_render_cache(self):
+        """Сбросить закэшированные результаты render() этой страницы"""
+        render_cache.invalidate(self.page_name)
+    
     async def show(self, bot: Bot, user_id: int, **kwargs):
         """Показать страницу пользователю"""
-        page_data = await self.render(user_id, **kwargs)
+        page_data = await self.render_cached(user_id, **kwargs)
         
         await message_manager.send_or_edit_message(
             bot, user_id,
@@ -41,7 +121,7 @@ class BasePage(ABC):
     
     async def show_from_message(self, message: Message, **kwargs):
         """Показать страницу из обработчика сообщения"""
-        page_data = await self.render(message.from_user.id, **kwargs)
+        page_data = await self.render_cached(message.from_user.id, **kwargs)
         
         from message_manager import message_manager
         await message_manager.send_or_edit_message(
@@ -54,9 +134,23 @@ class BasePage(ABC):
     
     async def show_from_callback(self, callback: CallbackQuery, **kwargs):
         """Показать страницу из обработчика callback"""
-        page_data = await self.render(callback.from_user.id, **kwargs)
+        page_data = await self.render_cached(callback.from_user.id, **kwargs)
         
         from message_manager import message_manager
+        if (message_manager.is_current_message(callback.from_user.id, callback.message.message_id)
+                and not callback.message.photo and not page_data.get('photo')
+                and not page_data.get('hide_reply_keyboard')):
+            # Кнопка нажата на текущем текстовом сообщении: редактируем его на месте,
+            # а при неизменном содержимом запрос в Telegram не отправляется
+            await message_manager.send_or_edit_message(
+                callback.bot, callback.from_user.id,
+                page_data.get('text', ''),
+                reply_markup=page_data.get('keyboard'),
+                menu_state=self.menu_state,
+                from_callback=True
+            )
+            return
+        
         await message_manager.handle_callback_navigation(
             callback,
             page_data.get('text', ''),
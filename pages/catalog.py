@@ -4,6 +4,7 @@
 
 from typing import Dict, Any, Optional
 from .base import BasePage
+from config import CATALOG_CACHE_TTL
 from database import db
 from keyboards import get_categories_keyboard, get_category_products_keyboard, get_product_card_keyboard, get_category_products_keyboard_with_stock
 from i18n import _
@@ -13,9 +14,15 @@ from utils.formatters import format_product_card
 class CatalogPage(BasePage):
     """Страница каталога"""
     
+    render_cache_ttl = CATALOG_CACHE_TTL
+    
     def __init__(self):
         super().__init__('catalog')
     
+    def is_render_cacheable(self, **kwargs) -> bool:
+        """Кэшируется только выбор типа каталога: списки зависят от наличия товаров"""
+        return not any(kwargs.values())
+    
     async def render(self, user_id: int, **kwargs) -> Dict[str, Any]:
         """Отрендерить каталог"""
         category_id = kwargs.get('category_id')
@@ -11,6 +11,9 @@ from i18n import _
 class InfoPage(BasePage):
     """Страница информации о магазине"""
     
+    # Текст зависит только от языка и конфигурации
+    render_cache_ttl = 3600
+    
     def __init__(self):
         super().__init__('info')
     
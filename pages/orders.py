@@ -8,10 +8,13 @@ from .base import BasePage
 from database import db
 from keyboards import get_orders_keyboard, get_order_details_keyboard
 from models import OrderStatus
-from components.pagination import pagination
+from components.pagination import PaginationComponent
 from aiogram.types import InlineKeyboardButton, InlineKeyboardMarkup
 from i18n import _
 
+# Собственный экземпляр: общий pagination перенастраивается админкой
+orders_pagination = PaginationComponent(items_per_page=5)
+
 
 class OrdersPage(BasePage):
     """Улучшенная страница заказов с фильтрацией и поиском"""
@@ -34,13 +37,11 @@ class OrdersPage(BasePage):
     async def _render_orders_list(self, user_id: int, page: int = 1, status_filter: str = 'all', search_query: Optional[str] = None) -> Dict[str, Any]:
         """Отрендерить список заказов с фильтрацией и поиском"""
         
-        # Получаем статистику заказов
-        stats = await db.get_user_orders_stats(user_id)
-        
-        # Получаем заказы с фильтрацией
-        orders = await db.get_user_orders(user_id, status_filter, search_query)
+        # Страница заказов и счетчики по статусам одним запросом
+        result = await db.get_user_orders_page(user_id, status_filter, search_query, page, orders_pagination.items_per_page)
+        stats = result['stats']
         
-        if not orders and not search_query:
+        if not stats['total'] and not search_query:
             from keyboards import get_back_to_menu_keyboard
             return {
                 'text': f"📋 <b>{self.get_title(user_id)}</b>\n\n{self.get_empty_message(user_id)}",
@@ -60,22 +61,21 @@ class OrdersPage(BasePage):
         
         text += "\n"
         
-        if not orders:
+        pagination_info = orders_pagination.paginate_offset(result['orders'], result['page'], result['matched'])
+        
+        if not result['orders']:
             text += "❌ Заказы не найдены\n\n"
         else:
-            # Используем компонент пагинации
-            pagination_info = pagination.paginate(orders, page)
-            
             # Добавляем информацию о странице только если есть несколько страниц
-            if pagination_info.get('total_pages', 1) > 1:
-                text += pagination.get_page_info_text(pagination_info, user_id)
+            if pagination_info['total_pages'] > 1:
+                text += orders_pagination.get_page_info_text(pagination_info, user_id)
             
             # Отображаем заказы текущей страницы
-            for order in pagination_info.get('items', orders):
-                text += await self._format_order_preview(order, user_id)
+            for order in pagination_info['items']:
+                text += self._format_order_preview(order, user_id, result['reservation_minutes'].get(order.id))
         
         # Создаем клавиатуру
-        keyboard = await self._create_orders_keyboard(orders, page, status_filter, search_query, stats, user_id)
+        keyboard = self._create_orders_keyboard(pagination_info, status_filter, search_query, stats, user_id)
         
         return {
             'text': text,
@@ -207,8 +207,11 @@ class OrdersPage(BasePage):
             status_value = status
         return _(f"orders.status_{status_value}", user_id=user_id)
     
-    async def _format_order_preview(self, order, user_id: int) -> str:
-        """Форматирование превью заказа с улучшенной информацией"""
+    def _format_order_preview(self, order, user_id: int, reservation_minutes: Optional[int] = None) -> str:
+        """Форматирование превью заказа с улучшенной информацией
+        
+        reservation_minutes - минут до конца резерва (None, если резерва нет)
+        """
         status_emoji = self._get_status_emoji(order.status)
         status_text = self._get_status_text(order.status, user_id)
         
@@ -224,9 +227,8 @@ class OrdersPage(BasePage):
         
         # Добавляем информацию о резерве для активных заказов
         if order.status == 'waiting_payment':
-            reservation = await db.get_order_reservation(order.id)
-            if reservation and reservation['minutes_left'] > 0:
-                text += f"│ ⏰ Резерв: {reservation['minutes_left']} мин\n"
+            if reservation_minutes:
+                text += f"│ ⏰ Резерв: {reservation_minutes} мин\n"
             else:
                 text += f"│ ⚠️ Резерв истек\n"
         
@@ -247,7 +249,7 @@ class OrdersPage(BasePage):
         
         return text
     
-    async def _create_orders_keyboard(self, orders, page: int, status_filter: str, search_query: Optional[str], stats: dict, user_id: int) -> InlineKeyboardMarkup:
+    def _create_orders_keyboard(self, pagination_info: dict, status_filter: str, search_query: Optional[str], stats: dict, user_id: int) -> InlineKeyboardMarkup:
         """Создание клавиатуры для страницы заказов"""
         keyboard = []
         
@@ -284,18 +286,18 @@ class OrdersPage(BasePage):
             keyboard.append(filter_row2)
         
         # Кнопка поиска
-        search_text = "🔍 Поиск по номеру" if not search_query else "🔄 Сбросить поиск"
+        search_text = "🔍 Поиск заказа" if not search_query else "🔄 Сбросить поиск"
         search_callback = "orders_search" if not search_query else "orders_filter_all"
         keyboard.append([InlineKeyboardButton(text=search_text, callback_data=search_callback)])
         
+        orders = pagination_info['items']
+        
         # Разделитель
         if orders:
             keyboard.append([InlineKeyboardButton(text="─── Заказы ───", callback_data="noop")])
         
         # Кнопки заказов с пагинацией
         if orders:
-            pagination_info = pagination.paginate(orders, page)
-            
             # Кнопки заказов
             for order in pagination_info['items']:
                 status_emoji = self._get_status_emoji(order.status)
@@ -0,0 +1,95 @@
+"""
+Статистика времени выполнения запросов к базе данных
+"""
+import bisect
+import time
+from contextlib import contextmanager
+from typing import Dict, List
+
+# Верхние границы корзин гистограммы, мс (последняя корзина - все, что медленнее)
+LATENCY_BUCKETS_MS = (0.5, 1, 2, 5, 10, 20, 50, 100, 200, 500, 1000, 2000, 5000)
+
+
+class QueryHistogram:
+    """Гистограмма задержек одного запроса"""
+    __slots__ = ('count', 'rows', 'total_ms', 'max_ms', 'buckets')
+
+    def __init__(self):
+        self.count = 0
+        self.rows = 0
+        self.total_ms = 0.0
+        self.max_ms = 0.0
+        self.buckets = [0] * (len(LATENCY_BUCKETS_MS) + 1)
+
+    def add(self, elapsed_ms: float, rows: int = 0):
+        self.count += 1
+        self.rows += rows
+        self.total_ms += elapsed_ms
+        if elapsed_ms > self.max_ms:
+            self.max_ms = elapsed_ms
+        self.buckets[bisect.bisect_left(LATENCY_BUCKETS_MS, elapsed_ms)] += 1
+
+    def percentile(self, fraction: float) -> float:
+        """Оценка перцентиля сверху: граница корзины, в которую он попадает"""
+        if not self.count:
+            return 0.0
+        rank = fraction * self.count
+        cumulative = 0
+        for index, bucket_count in enumerate(self.buckets):
+            cumulative += bucket_count
+            if cumulative >= rank:
+                if index < len(LATENCY_BUCKETS_MS):
+                    return min(float(LATENCY_BUCKETS_MS[index]), self.max_ms)
+                return self.max_ms
+        return self.max_ms
+
+
+class QueryStats:
+    """Сбор статистики по именованным запросам"""
+
+    def __init__(self):
+        self.queries: Dict[str, QueryHistogram] = {}
+        self.started_at = time.time()
+
+    def record(self, name: str, elapsed_ms: float, rows: int = 0):
+        """Учесть одно выполнение запроса"""
+        histogram = self.queries.get(name)
+        if histogram is None:
+            histogram = self.queries[name] = QueryHistogram()
+        histogram.add(elapsed_ms, rows)
+
+    @contextmanager
+    def measure(self, name: str):
+        """Замерить выполнение запроса; число строк записывается в result['rows']"""
+        result = {'rows': 0}
+        started = time.perf_counter()
+        try:
+            yield result
+        finally:
+            self.record(name, (time.perf_counter() - started) * 1000, result['rows'])
+
+    def get_summary(self, limit: int = 15, order_by: str = 'p95') -> List[dict]:
+        """Сводка по самым медленным запросам"""
+        summary = []
+        for name, histogram in self.queries.items():
+            summary.append({
+                'name': name,
+                'count': histogram.count,
+                'rows': histogram.rows,
+                'avg': histogram.total_ms / histogram.count,
+                'p50': histogram.percentile(0.50),
+                'p95': histogram.percentile(0.95),
+                'p99': histogram.percentile(0.99),
+                'max': histogram.max_ms,
+            })
+        summary.sort(key=lambda item: item[order_by], reverse=True)
+        return summary[:limit]
+
+    def reset(self):
+        """Сбросить накопленную статистику"""
+        self.queries.clear()
+        self.started_at = time.time()
+
+
+# Глобальный экземпляр статистики запросов
+query_stats = QueryStats()
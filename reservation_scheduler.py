@@ -1,34 +1,70 @@
 """
 Планировщик для автоматической очистки просроченных резервов товаров
+
+Вместо периодического опроса базы планировщик держит кучу ближайших
+сроков (reserved_until) и просыпается ровно к ним. Сроки загружаются один
+раз при старте, а затем обновляются из Database при создании/продлении
+резервов (schedule_cart_expiry / schedule_order_expiry).
+
+Это единственное место, где удаляются просроченные резервы: обработчики
+запросов только фильтруют по reserved_until. Очистка идет пачками с
+ограниченным бюджетом (RESERVATION_CLEANUP_*), остаток добирается
+следующим проходом.
 """
 import asyncio
+import heapq
+import itertools
 import logging
-from datetime import datetime
-from database import db
+from typing import Dict, List, Optional, Tuple
+from config import RESERVATION_CLEANUP_BATCH_SIZE, RESERVATION_CLEANUP_MAX_BATCHES
+from database import background_db
 
 logger = logging.getLogger(__name__)
 
+# За сколько секунд до истечения резерва заказа предупреждать пользователя
+ORDER_WARNING_SECONDS = 120
+# Запас, чтобы к моменту пробуждения срок в БД гарантированно истек
+EXPIRY_SLACK_SECONDS = 0.5
+# Страховочная перезагрузка сроков из БД (изменения в обход Database)
+RESYNC_INTERVAL_SECONDS = 600
+ERROR_RETRY_SECONDS = 30
+# Пауза перед продолжением очистки, если бюджет прохода исчерпан
+BACKLOG_DELAY_SECONDS = 1
+
+_CART = 'cart'
+_ORDER_WARNING = 'order_warning'
+_ORDER_EXPIRY = 'order_expiry'
+_ORDER_BACKLOG = 'order_backlog'
+
+
 class ReservationScheduler:
     """Планировщик для управления резервированием товаров"""
-    
+
     def __init__(self):
         self._running = False
         self._task = None
-    
+        self._wakeup = asyncio.Event()
+        # (время срабатывания, порядковый номер, тип, order_id, срок резерва)
+        self._heap: List[Tuple[float, int, str, Optional[int], float]] = []
+        self._sequence = itertools.count()
+        self._cart_deadline: Optional[float] = None
+        self._order_deadlines: Dict[int, float] = {}
+        self._next_resync = 0.0
+
     async def start(self):
         """Запуск планировщика"""
         if self._running:
             return
-        
+
         self._running = True
-        self._task = asyncio.create_task(self._cleanup_loop())
+        self._task = asyncio.create_task(self._run())
         logger.info("Планировщик очистки резервов запущен")
-    
+
     async def stop(self):
         """Остановка планировщика"""
         if not self._running:
             return
-        
+
         self._running = False
         if self._task:
             self._task.cancel()
@@ -37,96 +73,158 @@ class ReservationScheduler:
             except asyncio.CancelledError:
                 pass
         logger.info("Планировщик очистки резервов остановлен")
-    
-    async def _cleanup_loop(self):
-        """Основной цикл очистки просроченных резервов"""
+
+    def schedule_cart_expiry(self, seconds_left: float):
+        """Учесть срок резерва в корзине (секунд до reserved_until)"""
+        if not self._running or seconds_left is None:
+            return
+        deadline = self._now() + float(seconds_left) + EXPIRY_SLACK_SECONDS
+        if self._cart_deadline is not None and self._cart_deadline <= deadline:
+            return  # Более ранняя очистка уже запланирована
+        self._cart_deadline = deadline
+        self._push(deadline, _CART, None, deadline)
+
+    def schedule_order_expiry(self, order_id: int, seconds_left: float):
+        """Учесть новый срок резерва заказа (секунд до reserved_until)"""
+        if not self._running or seconds_left is None:
+            return
+        expires_at = self._now() + float(seconds_left) + EXPIRY_SLACK_SECONDS
+        # Старые записи кучи для заказа становятся неактуальными
+        self._order_deadlines[order_id] = expires_at
+        self._push(expires_at, _ORDER_EXPIRY, order_id, expires_at)
+        warning_at = expires_at - EXPIRY_SLACK_SECONDS - ORDER_WARNING_SECONDS
+        if warning_at > self._now():
+            self._push(warning_at, _ORDER_WARNING, order_id, expires_at)
+
+    def _now(self) -> float:
+        return asyncio.get_running_loop().time()
+
+    def _push(self, fire_at: float, kind: str, order_id: Optional[int], expires_at: float):
+        is_earliest = not self._heap or fire_at < self._heap[0][0]
+        heapq.heappush(self._heap, (fire_at, next(self._sequence), kind, order_id, expires_at))
+        if is_earliest:
+            self._wakeup.set()
+
+    async def _run(self):
+        """Основной цикл: ждем ближайший срок или новое событие"""
         while self._running:
             try:
-                # Очищаем просроченные резервы корзин каждые 2 минуты
-                await db.cleanup_expired_reservations()
-                
-                # Проверяем заказы с истекающими резервами и отправляем уведомления
-                await self._check_expiring_reservations()
-                
-                # Очищаем просроченные резервы заказов (с отменой заказов)
-                await db.cleanup_expired_order_reservations()
-                
-                # Получаем статистику для логирования
-                cart_reserved_count = await self._get_total_reserved_items()
-                order_reserved_count = await self._get_total_order_reserved_items()
-                
-                if cart_reserved_count > 0:
-                    logger.debug(f"Активных резервов в корзинах: {cart_reserved_count}")
-                if order_reserved_count > 0:
-                    logger.debug(f"Активных резервов в заказах: {order_reserved_count}")
-                
-                # Ожидаем 1 минуту перед следующей очисткой (сокращаем интервал для заказов)
-                await asyncio.sleep(60)
-                
+                if self._now() >= self._next_resync:
+                    await self._load_deadlines()
+
+                timeout = self._next_resync - self._now()
+                if self._heap:
+                    timeout = min(timeout, self._heap[0][0] - self._now())
+
+                if timeout > 0:
+                    try:
+                        await asyncio.wait_for(self._wakeup.wait(), timeout)
+                    except asyncio.TimeoutError:
+                        pass
+                self._wakeup.clear()
+
+                await self._process_due()
+
+            except asyncio.CancelledError:
+                raise
             except Exception as e:
                 logger.error(f"Ошибка в планировщике очистки резервов: {e}")
-                # В случае ошибки ждем 30 секунд и продолжаем
-                await asyncio.sleep(30)
-    
-    async def _get_total_reserved_items(self):
-        """Получить общее количество зарезервированных товаров"""
-        try:
-            query = "SELECT COUNT(*) FROM cart WHERE reserved_until > CURRENT_TIMESTAMP"
-            result = await db.fetchone(query)
-            return result[0] if result else 0
-        except Exception as e:
-            logger.error(f"Ошибка получения статистики резервов: {e}")
-            return 0
-    
-    async def _get_total_order_reserved_items(self):
-        """Получить общее количество зарезервированных товаров в заказах"""
-        try:
-            query = "SELECT COUNT(*) FROM order_reservations WHERE reserved_until > CURRENT_TIMESTAMP"
-            result = await db.fetchone(query)
-            return result[0] if result else 0
-        except Exception as e:
-            logger.error(f"Ошибка получения статистики резервов заказов: {e}")
-            return 0
-    
-    async def _check_expiring_reservations(self):
-        """Проверка заказов с истекающими резервами и отправка уведомлений"""
+                await asyncio.sleep(ERROR_RETRY_SECONDS)
+
+    async def _load_deadlines(self):
+        """Загрузить актуальные сроки резервов из БД"""
+        self._heap.clear()
+        self._cart_deadline = None
+        self._order_deadlines.clear()
+
+        cart_seconds = await background_db.fetchval(
+            "SELECT EXTRACT(EPOCH FROM (MIN(reserved_until) - CURRENT_TIMESTAMP)) FROM cart",
+            query_name='next_cart_expiry'
+        )
+        if cart_seconds is not None:
+            self.schedule_cart_expiry(cart_seconds)
+
+        rows = await background_db.fetchall("""
+            SELECT ord_res.order_id,
+                   EXTRACT(EPOCH FROM (ord_res.reserved_until - CURRENT_TIMESTAMP)) as seconds_left
+            FROM order_reservations ord_res
+            JOIN orders o ON o.id = ord_res.order_id
+            WHERE o.status = 'waiting_payment'
+        """, query_name='pending_order_reservations')
+        for row in rows:
+            self.schedule_order_expiry(row['order_id'], row['seconds_left'])
+
+        self._next_resync = self._now() + RESYNC_INTERVAL_SECONDS
+        logger.debug(f"Загружены сроки резервов: заказов {len(rows)}, корзина: {cart_seconds is not None}")
+
+    async def _process_due(self):
+        """Обработать все наступившие сроки"""
+        now = self._now()
+        cart_due = False
+        orders_due = False
+        warnings = []
+
+        while self._heap and self._heap[0][0] <= now:
+            _, _, kind, order_id, expires_at = heapq.heappop(self._heap)
+            if kind == _CART:
+                if self._cart_deadline == expires_at:
+                    self._cart_deadline = None
+                    cart_due = True
+            elif kind == _ORDER_BACKLOG:
+                orders_due = True
+            elif self._order_deadlines.get(order_id) != expires_at:
+                continue  # Срок был продлен или резерв снят
+            elif kind == _ORDER_WARNING:
+                warnings.append((order_id, expires_at))
+            else:
+                del self._order_deadlines[order_id]
+                orders_due = True
+
+        if cart_due:
+            if await self._sweep(background_db.cleanup_expired_reservations):
+                cart_seconds = await background_db.fetchval(
+                    "SELECT EXTRACT(EPOCH FROM (MIN(reserved_until) - CURRENT_TIMESTAMP)) FROM cart",
+                    query_name='next_cart_expiry'
+                )
+            else:
+                cart_seconds = BACKLOG_DELAY_SECONDS
+            if cart_seconds is not None:
+                self.schedule_cart_expiry(cart_seconds)
+
+        for order_id, expires_at in warnings:
+            await self._notify_expiring(order_id, max(1, round((expires_at - now) / 60)))
+
+        if orders_due:
+            if not await self._sweep(background_db.cleanup_expired_order_reservations):
+                self._push(self._now() + BACKLOG_DELAY_SECONDS, _ORDER_BACKLOG, None, 0.0)
+
+    async def _sweep(self, cleanup) -> bool:
+        """Очистка пачками в пределах бюджета; True, если очищено все"""
+        for _ in range(RESERVATION_CLEANUP_MAX_BATCHES):
+            processed = await cleanup(limit=RESERVATION_CLEANUP_BATCH_SIZE)
+            if processed < RESERVATION_CLEANUP_BATCH_SIZE:
+                return True
+            await asyncio.sleep(0)  # Отдаем управление обработчикам между пачками
+        logger.info("Бюджет очистки резервов исчерпан, продолжим следующим проходом")
+        return False
+
+    async def _notify_expiring(self, order_id: int, minutes_left: int):
+        """Отправить уведомление об истечении резерва заказа"""
         try:
-            # Получаем заказы с резервами, которые истекают в течение 2 минут
-            query = """
-            SELECT o.id, o.user_id, o.order_number,
-                   EXTRACT(EPOCH FROM (ord_res.reserved_until - CURRENT_TIMESTAMP))/60 as minutes_left
-            FROM orders o
-            JOIN order_reservations ord_res ON o.id = ord_res.order_id
-            WHERE o.status = 'waiting_payment' 
-            AND ord_res.reserved_until > CURRENT_TIMESTAMP 
-            AND ord_res.reserved_until <= CURRENT_TIMESTAMP + INTERVAL '2 minutes'
-            """
-            expiring_orders = await db.fetchall(query)
-            
-            for order_info in expiring_orders:
-                minutes_left = int(order_info['minutes_left'])
-                if minutes_left <= 2 and minutes_left > 0:
-                    try:
-                        from notifications import notification_system
-                        if notification_system:
-                            await notification_system.notify_reservation_expiring(
-                                order_info['id'], 
-                                minutes_left
-                            )
-                    except Exception as e:
-                        logger.error(f"Ошибка отправки уведомления об истечении резерва: {e}")
-                        
+            from notifications import notification_system
+            if notification_system:
+                await notification_system.notify_reservation_expiring(order_id, minutes_left)
         except Exception as e:
-            logger.error(f"Ошибка проверки истекающих резервов: {e}")
-    
+            logger.error(f"Ошибка отправки уведомления об истечении резерва: {e}")
+
     async def force_cleanup(self):
         """Принудительная очистка просроченных резервов"""
         try:
-            await db.cleanup_expired_reservations()
-            await db.cleanup_expired_order_reservations()
+            await background_db.cleanup_expired_reservations()
+            await background_db.cleanup_expired_order_reservations()
             logger.info("Выполнена принудительная очистка просроченных резервов")
         except Exception as e:
             logger.error(f"Ошибка принудительной очистки: {e}")
 
 # Глобальный экземпляр планировщика
-reservation_scheduler = ReservationScheduler()
\ No newline at end of file
+reservation_scheduler = ReservationScheduler()
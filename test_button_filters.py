@@ -6,7 +6,7 @@ import sys
 import os
 sys.path.append(os.path.dirname(os.path.abspath(__file__)))
 
-from button_filters import get_all_translations_for_key
+from button_filters import get_all_translations_for_key, get_keys_for_text
 
 def test_translation_lookup():
     """Тестирование получения переводов"""
@@ -24,6 +24,10 @@ def test_translation_lookup():
     for key in keys_to_test:
         translations = get_all_translations_for_key(key)
         print(f"  {key}: {translations}")
+        
+        # Обратный индекс должен находить ключ по любому из переводов
+        for text in translations:
+            assert key in get_keys_for_text(text), f"{text} -> {key}"
     
     print("\n✅ Тест завершен!")
 
@@ -0,0 +1,118 @@
+#!/usr/bin/env python3
+"""
+Тест пропуска неизмененных правок сообщений в MessageManager
+"""
+import sys
+import os
+import asyncio
+import datetime
+from types import SimpleNamespace
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from aiogram import Bot
+from aiogram.client.session.base import BaseSession
+from aiogram.methods import SendMessage
+from aiogram.types import Chat, InlineKeyboardButton, InlineKeyboardMarkup, Message
+
+from message_manager import message_manager
+from middleware import MessageContentMiddleware
+from pages.base import BasePage
+
+USER_ID = 1001
+
+
+class RecordingSession(BaseSession):
+    """Сессия без сети: записывает запросы к Telegram API"""
+
+    def __init__(self):
+        super().__init__()
+        self.requests = []
+
+    async def make_request(self, bot, method, timeout=None):
+        self.requests.append(type(method).__name__)
+        if isinstance(method, SendMessage):
+            return Message(
+                message_id=len(self.requests), date=datetime.datetime.now(),
+                chat=Chat(id=method.chat_id, type='private'), text=method.text
+            )
+        return True
+
+    async def close(self):
+        pass
+
+    async def stream_content(self, *args, **kwargs):
+        yield b''
+
+
+class StaticPage(BasePage):
+    """Страница с неизменным содержимым"""
+
+    def __init__(self):
+        super().__init__('test_static')
+
+    async def render(self, user_id: int, **kwargs):
+        return {
+            'text': 'Статичная страница',
+            'keyboard': InlineKeyboardMarkup(inline_keyboard=[
+                [InlineKeyboardButton(text='Назад', callback_data='back_to_menu')]
+            ])
+        }
+
+
+def make_bot():
+    bot = Bot(token='42:TEST', session=RecordingSession())
+    bot.session.middleware(MessageContentMiddleware())
+    return bot
+
+
+def make_callback(bot):
+    tracked_id = message_manager.get_user_message(USER_ID)['last_message_id']
+    return SimpleNamespace(
+        from_user=SimpleNamespace(id=USER_ID),
+        message=SimpleNamespace(message_id=tracked_id, photo=None),
+        bot=bot
+    )
+
+
+async def run_identical_render_check():
+    bot = make_bot()
+    page = StaticPage()
+    message_manager.clear_user_message(USER_ID)
+    await message_manager.send_or_edit_message(bot, USER_ID, 'Главное меню')
+
+    # Первый показ из callback редактирует текущее сообщение
+    await page.show_from_callback(make_callback(bot))
+    assert bot.session.requests == ['SendMessage', 'EditMessageText'], bot.session.requests
+
+    # Тот же показ еще раз - ни одного запроса к Telegram
+    await page.show_from_callback(make_callback(bot))
+    assert bot.session.requests == ['SendMessage', 'EditMessageText'], bot.session.requests
+    print("  ✅ повторный показ без изменений не отправляет запросов")
+
+    # Правка сообщения в обход менеджера сбрасывает запомненное содержимое
+    tracked_id = message_manager.get_user_message(USER_ID)['last_message_id']
+    await bot.edit_message_text(chat_id=USER_ID, message_id=tracked_id, text='⏳ Загрузка...')
+    await page.show_from_callback(make_callback(bot))
+    assert bot.session.requests[-2:] == ['EditMessageText', 'EditMessageText'], bot.session.requests
+    print("  ✅ после сторонней правки сообщение редактируется снова")
+
+    # Из обработчика сообщения правка выполняется всегда (сообщение могли удалить)
+    before = len(bot.session.requests)
+    page_data = await page.render(USER_ID)
+    await message_manager.send_or_edit_message(
+        bot, USER_ID, page_data['text'], reply_markup=page_data['keyboard'], menu_state=page.menu_state
+    )
+    assert bot.session.requests[before:] == ['EditMessageText'], bot.session.requests
+    print("  ✅ вне callback правка не пропускается")
+    message_manager.clear_user_message(USER_ID)
+
+
+def test_identical_render_makes_no_api_call():
+    """Повторный показ той же страницы из callback не обращается к Telegram"""
+    print("🧪 Тест пропуска неизмененных правок:")
+    asyncio.run(run_identical_render_check())
+
+
+if __name__ == "__main__":
+    test_identical_render_makes_no_api_call()
+    print("\n✅ Тест завершен!")
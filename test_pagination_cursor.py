@@ -0,0 +1,66 @@
+#!/usr/bin/env python3
+"""
+Тест курсоров пагинации списков заказов в админке (keyset по created_at, id)
+"""
+import sys
+import os
+from datetime import datetime
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from components.pagination import PaginationComponent
+
+FIRST_PAGE = (1, False, None)
+
+
+def test_cursor_roundtrip():
+    """Курсор сохраняет время с микросекундами и id"""
+    print("🧪 Тест кодирования курсора:")
+    for created_at, order_id in (
+        (datetime(2025, 3, 1, 12, 30, 15, 123456), 42),
+        (datetime(1970, 1, 1), 1),
+        (datetime(2038, 1, 19, 3, 14, 8, 1), 2 ** 31 - 1),
+    ):
+        cursor = PaginationComponent.make_cursor(created_at, order_id)
+        assert PaginationComponent.parse_cursor(cursor) == (created_at, order_id), cursor
+        print(f"  ✅ {cursor}")
+
+
+def test_callback_roundtrip():
+    """callback_data кнопок разбирается обратно, в том числе с префиксом фильтра"""
+    print("🧪 Тест разбора callback_data:")
+    cursor = PaginationComponent.make_cursor(datetime(2025, 3, 1, 12, 30), 7)
+    for prefix in ("admin_all_orders_page", "filter_orders_page_paid"):
+        assert PaginationComponent.parse_cursor_callback(f"{prefix}_3_a{cursor}", prefix) == (3, False, cursor)
+        assert PaginationComponent.parse_cursor_callback(f"{prefix}_2_b{cursor}", prefix) == (2, True, cursor)
+    print("  ✅ вперед и назад")
+
+
+def test_bad_callback_falls_back_to_first_page():
+    """Испорченная callback_data открывает первую страницу, а не роняет обработчик"""
+    print("🧪 Тест испорченных курсоров:")
+    prefix = "admin_all_orders_page"
+    bad_suffixes = (
+        "",                           # кнопка без страницы
+        "_3",                         # нет курсора
+        "_x_a1-2",                    # страница не число
+        "_0_a1-2",                    # нулевая страница
+        "_3_c1-2",                    # неизвестное направление
+        "_3_a",                       # пустой курсор
+        "_3_axyz",                    # нет разделителя
+        "_3_a1-2-3",                  # лишняя часть
+        "_3_a-5-2",                   # отрицательное время
+        "_3_a1.5-2",                  # дробное время
+        "_3_a1-",                     # нет id
+        "_3_a99999999999999999999-1", # время вне диапазона datetime
+        "_3_a1-2_extra",              # лишний сегмент
+    )
+    for suffix in bad_suffixes:
+        assert PaginationComponent.parse_cursor_callback(prefix + suffix, prefix) == FIRST_PAGE, suffix
+    print(f"  ✅ {len(bad_suffixes)} вариантов -> первая страница")
+
+
+if __name__ == "__main__":
+    test_cursor_roundtrip()
+    test_callback_roundtrip()
+    test_bad_callback_falls_back_to_first_page()
+    print("\n✅ Тест завершен!")
@@ -0,0 +1,83 @@
+#!/usr/bin/env python3
+"""
+Тест счетчика событий анти-спам системы (SlidingWindowCounter)
+"""
+import sys
+import os
+import random
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from anti_spam import SlidingWindowCounter
+
+
+def brute_force_counts(times, current_time):
+    """Эталон: прямой подсчет событий за минуту и за час"""
+    minute = sum(1 for t in times if current_time - t < SlidingWindowCounter.MINUTE)
+    hour = sum(1 for t in times if current_time - t < SlidingWindowCounter.HOUR)
+    return minute, hour
+
+
+def test_window_edges():
+    """Событие выходит из окна ровно на его границе"""
+    print("🧪 Тест границ окон:")
+    counter = SlidingWindowCounter()
+    counter.add(1000.0)
+
+    assert counter.counts(1000.0) == (1, 1)
+    assert counter.counts(1000.0 + 59.999) == (1, 1)
+    assert counter.counts(1000.0 + 60) == (0, 1)
+    assert counter.counts(1000.0 + 3599.999) == (0, 1)
+    assert counter.counts(1000.0 + 3600) == (0, 0)
+    print("  ✅ минута и час отсчитываются по >=")
+
+
+def test_ring_wraparound():
+    """Кольцо переходит через конец буфера без роста, затем растет с ненулевой головой"""
+    print("🧪 Тест кольцевого буфера:")
+    counter = SlidingWindowCounter()
+    capacity = SlidingWindowCounter.INITIAL_CAPACITY
+    # Первая половина событий в момент 0, вторая - через 1000 секунд
+    times = [0.0] * (capacity // 2) + [1000.0] * (capacity // 2)
+    for t in times:
+        counter.add(t)
+
+    # Первая половина устаревает - голова сдвигается, новые пишутся в начало буфера
+    start = float(SlidingWindowCounter.HOUR)
+    for i in range(capacity // 2):
+        times.append(start + i)
+        counter.add(start + i)
+    assert len(counter._times) == capacity, "буфер не должен расти, пока есть место"
+    assert counter._head != 0
+    assert counter.counts(times[-1]) == brute_force_counts(times, times[-1])
+
+    # Заполненное кольцо с ненулевой головой удваивается с сохранением порядка
+    times.append(times[-1] + 1)
+    counter.add(times[-1])
+    assert len(counter._times) == capacity * 2
+    for current_time in (times[-1], times[-1] + 30, times[-1] + 61, times[-1] + 3600):
+        assert counter.counts(current_time) == brute_force_counts(times, current_time), current_time
+    print(f"  ✅ голова {counter._head}, емкость {len(counter._times)}")
+
+
+def test_matches_brute_force():
+    """Случайная последовательность событий совпадает с прямым подсчетом"""
+    print("🧪 Тест на случайной последовательности:")
+    rng = random.Random(42)
+    counter = SlidingWindowCounter()
+    times = []
+    current_time = 0.0
+    for _ in range(1000):
+        current_time += rng.choice((0, 0.5, 1, 5, 30, 60, 600))
+        times.append(current_time)
+        counter.add(current_time)
+        probe = current_time + rng.choice((0, 59.5, 60, 3600))
+        assert counter.counts(probe) == brute_force_counts(times, probe), probe
+        current_time = probe
+    print("  ✅ 1000 событий совпали с эталоном")
+
+
+if __name__ == "__main__":
+    test_window_edges()
+    test_ring_wraparound()
+    test_matches_brute_force()
+    print("\n✅ Тест завершен!")